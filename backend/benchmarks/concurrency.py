@@ -0,0 +1,133 @@
+"""
+Latency of list requests while a large statement upload is in flight.
+
+The app runs in-process behind httpx's ASGI transport, on one event loop, the
+way a single uvicorn worker serves it. List requests are timed first on their
+own and then while a statement upload and its import job run alongside; the run fails when the
+p99 latency under the upload exceeds --max-ratio times the idle p99, which is
+what happens whenever an endpoint blocks the event loop.
+
+    python -m backend.benchmarks.concurrency --upload-rows 100k --clients 8
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from .generate import generate, write_statement_csv
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    suffixes = {"k": 1_000, "m": 1_000_000}
+    if value[-1] in suffixes:
+        return int(float(value[:-1]) * suffixes[value[-1]])
+    return int(value)
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def _list_load(client, headers: dict, clients: int, requests: int, until: asyncio.Task = None) -> List[float]:
+    """Latencies of list requests from concurrent clients; with until, they keep going until it is done."""
+    latencies = []
+
+    async def one_client():
+        sent = 0
+        while sent < requests or (until is not None and not until.done()):
+            path = "/api/transactions/" if sent % 2 == 0 else "/api/bank-transactions/"
+            started = time.perf_counter()
+            response = await client.get(path, params={"limit": 50}, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+            sent += 1
+
+    await asyncio.gather(*(one_client() for _ in range(clients)))
+    return latencies
+
+async def _run(args, app, headers: dict, csv_path: str) -> int:
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        idle = await _list_load(client, headers, args.clients, args.requests)
+
+        async def upload():
+            with open(csv_path, "rb") as f:
+                response = await client.post(
+                    "/api/bank-transactions/bulk/upload",
+                    files={"file": ("statement.csv", f, "text/csv")},
+                    data={"bank_name": "Bench Bank", "account_number": "000"},
+                    headers=headers
+                )
+            response.raise_for_status()
+            # The upload is imported by a job; the phase lasts until it is done
+            job_id = response.json()["id"]
+            while True:
+                job = (await client.get(f"/api/jobs/{job_id}", headers=headers)).json()
+                if job["status"] not in ("queued", "running"):
+                    break
+                await asyncio.sleep(0.05)
+            response = await client.get(f"/api/jobs/{job_id}/result", headers=headers)
+            response.raise_for_status()
+            return response.json()
+
+        started = time.perf_counter()
+        upload_task = asyncio.create_task(upload())
+        busy = await _list_load(client, headers, args.clients, args.requests, until=upload_task)
+        result = await upload_task
+        upload_seconds = time.perf_counter() - started
+
+    print(f"Upload of {args.upload_rows} rows: {result['inserted']} inserted in {upload_seconds:.2f}s")
+    print(f"{'phase':<14} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, latencies in (("idle", idle), ("during upload", busy)):
+        print(f"{name:<14} {len(latencies):>9} {percentile(latencies, 0.50) * 1000:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>9.1f} {max(latencies) * 1000:>9.1f}")
+
+    ratio = percentile(busy, 0.99) / percentile(idle, 0.99)
+    print(f"p99 during upload is {ratio:.1f}x idle (allowed: {args.max_ratio:.1f}x)")
+    return 0 if ratio <= args.max_ratio else 1
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check that an upload does not stall concurrent list requests")
+    parser.add_argument("--upload-rows", type=parse_size, default=50_000, help="Rows in the uploaded statement")
+    parser.add_argument("--rows", type=parse_size, default=1_000, help="Transactions stored before the run")
+    parser.add_argument("--clients", type=int, default=8, help="Concurrent list clients")
+    parser.add_argument("--requests", type=int, default=50, help="List requests per client in the idle phase")
+    parser.add_argument("--max-ratio", type=float, default=5.0, help="Allowed p99 growth during the upload")
+    parser.add_argument("--workdir", default=None, help="Where the database and statement go (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, "concurrency.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    # The backend reads its settings at import time, so it is imported once the database is chosen
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ.setdefault("SECRET_KEY", "benchmark")
+    from .. import models, database, auth
+    from ..main import app
+    from .run import _create_user, _seed_transactions
+
+    models.Base.metadata.create_all(bind=database.engine)
+    transactions, _ = generate(args.rows, seed=0)
+    _, bank_rows = generate(args.upload_rows, seed=1)
+    csv_path = os.path.join(workdir, "upload.csv")
+    write_statement_csv(csv_path, bank_rows)
+
+    db = database.SessionLocal()
+    try:
+        owner_id = _create_user(db, "bench_concurrency")
+        _seed_transactions(db, owner_id, transactions)
+        username = db.get(models.User, owner_id).username
+    finally:
+        db.close()
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': username})}"}
+
+    return asyncio.run(_run(args, app, headers, csv_path))
+
+if __name__ == "__main__":
+    sys.exit(main())
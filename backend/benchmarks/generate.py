@@ -0,0 +1,82 @@
+"""
+Deterministic synthetic data for the benchmarks.
+
+Every transaction gets a bank-side counterpart following a fixed mix of cases:
+exact matches, +/-1 day shifts, small amount jitter, duplicated bank rows and
+transactions with no bank row at all (plus an unrelated bank row instead).
+"""
+import csv
+import random
+from datetime import date, timedelta
+from typing import List, Tuple
+from ..utils.money import to_cents, format_cents
+
+MERCHANTS = [
+    ("Coffee", "Coffee at Starbucks", "STARBUCKS STORE {n}"),
+    ("Groceries", "Whole Foods groceries", "WHOLEFDS MKT #{n}"),
+    ("Groceries", "Trader Joes", "TRADER JOE S #{n} QPS"),
+    ("Shopping", "Amazon order", "AMAZON MKTP US*{n}"),
+    ("Transport", "Uber ride", "UBER *TRIP {n}"),
+    ("Transport", "Shell fuel", "SHELL OIL {n}"),
+    ("Utilities", "Electricity bill", "CITY POWER AUTOPAY {n}"),
+    ("Dining", "Dinner at Chipotle", "CHIPOTLE {n}"),
+    ("Subscriptions", "Netflix", "NETFLIX.COM {n}"),
+    ("Salary", "Monthly salary", "ACME CORP PAYROLL {n}"),
+]
+
+# Cumulative shares of each bank-side case
+CASES = [
+    (0.70, "exact"),
+    (0.80, "date_shift"),
+    (0.90, "amount_jitter"),
+    (0.95, "duplicate"),
+    (1.00, "missing"),
+]
+
+def generate(n_rows: int, seed: int = 0, start: date = date(2024, 1, 1), days: int = 365) -> Tuple[List[dict], List[dict]]:
+    """
+    Generate n_rows transactions and their bank statement rows.
+    Returns (transactions, bank_rows) as column dicts, in a stable order for a given seed.
+    Amounts are integer cents, as they are stored.
+    """
+    rng = random.Random(seed)
+    transactions = []
+    bank_rows = []
+    for _ in range(n_rows):
+        category, note, description = rng.choice(MERCHANTS)
+        tx_date = start + timedelta(days=rng.randrange(days))
+        amount = round(rng.uniform(1, 500), 2)
+        transactions.append({
+            "date": tx_date,
+            "amount_cents": to_cents(amount),
+            "category": category,
+            "type": "income" if category == "Salary" else "expense",
+            "note": note,
+        })
+
+        bank_row = {"date": tx_date, "amount_cents": to_cents(amount), "description": description.format(n=rng.randrange(10000))}
+        draw = rng.random()
+        case = next(name for share, name in CASES if draw < share)
+        if case == "date_shift":
+            bank_row["date"] = tx_date + timedelta(days=rng.choice([-1, 1]))
+        elif case == "amount_jitter":
+            bank_row["amount_cents"] = to_cents(round(amount * (1 + rng.uniform(-0.005, 0.005)), 2))
+        elif case == "duplicate":
+            bank_rows.append(dict(bank_row))
+        elif case == "missing":
+            _, _, other = rng.choice(MERCHANTS)
+            bank_row = {
+                "date": start + timedelta(days=rng.randrange(days)),
+                "amount_cents": to_cents(round(rng.uniform(1, 500), 2)),
+                "description": other.format(n=rng.randrange(10000)),
+            }
+        bank_rows.append(bank_row)
+    return transactions, bank_rows
+
+def write_statement_csv(path: str, bank_rows: List[dict]):
+    """Write bank rows as a statement CSV in the layout parse_bank_csv expects."""
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Date", "Description", "Amount"])
+        for row in bank_rows:
+            writer.writerow([row["date"].isoformat(), row["description"], format_cents(row["amount_cents"])])
@@ -0,0 +1,179 @@
+"""
+Check the unmatched report end to end on a temporary SQLite database.
+
+A user gets generated transactions, a statement import and some confirmed
+matches. The XLSX report is built by a job; it and the CSV report must hold exactly the unmatched rows the
+listings show; a second download must be served from the cached file; a write
+must make the next download a fresh report and drop the outdated one; and
+reports past REPORTS_MAX_AGE_HOURS or beyond REPORTS_MAX_BYTES must be evicted.
+The peak Python memory of a build is printed. Exits 1 on the first difference.
+
+    python -m backend.benchmarks.reports --rows 5000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from .explain import migrate
+from .generate import generate, write_statement_csv
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the contents, caching and eviction of unmatched reports")
+    parser.add_argument("--rows", type=int, default=2_000, help="Transactions generated for the user")
+    parser.add_argument("--workdir", default=None, help="Where the database and reports go (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="reports_")
+    db_path = os.path.join(workdir, "reports.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    # The backend reads its settings at import time (migrations import it too), so they are set first
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["REPORTS_DIR"] = os.path.join(workdir, "reports")
+    os.environ.setdefault("SECRET_KEY", "reports")
+    migrate(os.environ["DATABASE_URL"])
+
+    from fastapi.testclient import TestClient
+    from openpyxl import load_workbook
+    from sqlalchemy import insert
+    from .. import models, database, auth, matching, statements, reports
+    from ..config import settings
+    from ..main import app
+    from ..utils.descriptions import normalize_description
+
+    transactions, bank_rows = generate(args.rows, seed=2)
+    statement_path = os.path.join(workdir, "statement.csv")
+    write_statement_csv(statement_path, bank_rows)
+    db = database.SessionLocal()
+    try:
+        for user_id in (1, 2):
+            db.add(models.User(id=user_id, username=f"reports_{user_id}", email=f"reports_{user_id}@example.com",
+                               hashed_password="-"))
+        db.flush()
+        for user_id in (1, 2):
+            db.execute(insert(models.Transaction), [
+                {**tx, "normalized_note": normalize_description(tx["note"]), "matched": False, "owner_id": user_id}
+                for tx in transactions
+            ])
+        db.commit()
+        statements.import_statement(db, 1, statement_path, "Report Bank", "001")
+        matching.run_matching(db, 1, time_window_days=1, amount_tolerance=0.01)
+        matching.confirm_matches(db, 1, None, 0.9)
+    finally:
+        db.close()
+
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'reports_1'})}"}
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"[{'ok' if condition else 'FAIL'}] {message}")
+        if not condition:
+            failures.append(message)
+
+    def unmatched(client, url):
+        rows, cursor = [], None
+        while True:
+            response = client.get(url, params={"matched": False, "limit": 1000, **({"cursor": cursor} if cursor else {})},
+                                  headers=headers)
+            rows += response.json()
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                return rows
+
+    def download_xlsx(client):
+        # The first request queues the build and returns the job; its result is the workbook
+        response = client.get("/api/bank-transactions/unmatched/report", headers=headers)
+        if response.status_code != 202:
+            return response
+        job_id = response.json()["id"]
+        while client.get(f"/api/jobs/{job_id}", headers=headers).json()["status"] in ("queued", "running"):
+            time.sleep(0.05)
+        return client.get(f"/api/jobs/{job_id}/result", headers=headers)
+
+    def cached_files():
+        return sorted(os.listdir(settings.REPORTS_DIR)) if os.path.isdir(settings.REPORTS_DIR) else []
+
+    with TestClient(app) as client:
+        bank = unmatched(client, "/api/bank-transactions/")
+        listed = unmatched(client, "/api/transactions/")
+        expected_amounts = sorted([tx["amount"] for tx in bank] + [tx["amount"] for tx in listed])
+
+        started = time.perf_counter()
+        first = download_xlsx(client)
+        built = time.perf_counter() - started
+        workbook = load_workbook(io.BytesIO(first.content), read_only=True)
+        sheets = {sheet.title: list(sheet.values)[1:] for sheet in workbook.worksheets}
+        check(first.status_code == 200
+              and len(sheets["Unmatched Bank Transactions"]) == len(bank)
+              and len(sheets["Unmatched User Transactions"]) == len(listed),
+              f"the workbook holds the {len(bank)} unmatched bank and {len(listed)} unmatched user transactions")
+        check(sorted(row[2] for name in ("Unmatched Bank Transactions", "Unmatched User Transactions") for row in sheets[name])
+              == expected_amounts, "the workbook amounts match the listings")
+        check(dict(sheets["Summary"]) == {"Total Unmatched Bank Transactions": len(bank),
+                                          "Total Unmatched User Transactions": len(listed)}, "the summary sheet counts them")
+
+        inode = os.stat(os.path.join(settings.REPORTS_DIR, cached_files()[0])).st_ino
+        started = time.perf_counter()
+        second = client.get("/api/bank-transactions/unmatched/report", headers=headers)
+        served = time.perf_counter() - started
+        check(second.content == first.content and len(cached_files()) == 1
+              and os.stat(os.path.join(settings.REPORTS_DIR, cached_files()[0])).st_ino == inode,
+              f"a second download is served from the cache ({built * 1000:.0f} ms built, {served * 1000:.0f} ms cached)")
+
+        streamed = client.get("/api/bank-transactions/unmatched/report", params={"format": "csv"}, headers=headers)
+        rows = list(csv.DictReader(io.StringIO(streamed.content.decode())))
+        check(streamed.status_code == 200 and "content-length" not in streamed.headers
+              and sorted(float(row["Amount"]) for row in rows) == expected_amounts,
+              f"the CSV report streams the same {len(rows)} rows")
+        again = client.get("/api/bank-transactions/unmatched/report", params={"format": "csv"}, headers=headers)
+        check(again.content == streamed.content and "content-length" in again.headers and len(cached_files()) == 2,
+              "the streamed CSV is cached for the next download")
+
+        client.post("/api/transactions/", json={"date": "2024-12-31", "amount": 12.34, "category": "Reports",
+                                                "type": "expense", "note": "after the report"}, headers=headers)
+        fresh = client.get("/api/bank-transactions/unmatched/report", params={"format": "csv"}, headers=headers)
+        check(fresh.content.decode().count("\n") == streamed.content.decode().count("\n") + 1,
+              "a write makes the next download a fresh report")
+        check(len(cached_files()) == 1, f"reports of the outdated version are evicted: {cached_files()}")
+
+        # Eviction by age and size, with the limits lowered for the check
+        stale = os.path.join(settings.REPORTS_DIR, cached_files()[0])
+        os.utime(stale, (time.time() - 2 * 3600, time.time() - 2 * 3600))
+        settings.REPORTS_MAX_AGE_HOURS = 1
+        db = database.SessionLocal()
+        try:
+            oldest, _ = reports.build_unmatched_report(db, 2, "csv")
+            check(not os.path.exists(stale), "reports older than REPORTS_MAX_AGE_HOURS are evicted")
+            settings.REPORTS_MAX_AGE_HOURS = 24
+            for owner_id, fmt in ((1, "csv"), (2, "xlsx")):
+                time.sleep(0.01)
+                reports.build_unmatched_report(db, owner_id, fmt)
+            settings.REPORTS_MAX_BYTES = sum(os.path.getsize(os.path.join(settings.REPORTS_DIR, name))
+                                             for name in cached_files()) - 1
+            newest, _ = reports.build_unmatched_report(db, 1, "xlsx")
+            check(not os.path.exists(oldest) and os.path.exists(newest)
+                  and sum(os.path.getsize(os.path.join(settings.REPORTS_DIR, name)) for name in cached_files())
+                  <= settings.REPORTS_MAX_BYTES,
+                  "the least recently served reports go once REPORTS_MAX_BYTES is exceeded")
+
+            reports.invalidate(db, 1)
+            db.commit()
+            tracemalloc.start()
+            started = time.perf_counter()
+            reports.build_unmatched_report(db, 1, "xlsx")
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"xlsx build of {len(bank) + len(listed) + 1} rows: {time.perf_counter() - started:.2f}s, "
+                  f"peak Python memory {peak / 1024 / 1024:.1f} MiB")
+        finally:
+            db.close()
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Check that the monthly rollups stay in step with every write path.
+
+A temporary SQLite database gets generated transactions, partly through the
+API and partly through a statement import and matching. Single and bulk
+confirmations, updates, deletes and an archive run follow. After each step
+rebuild() must find no drift, and the summary endpoints must agree with counts
+taken from the full transaction listing. Exits 1 on the first difference.
+
+    python -m backend.benchmarks.rollups --rows 1000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date
+
+from .explain import migrate
+from .generate import generate, write_statement_csv
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check the monthly rollups against the transactions")
+    parser.add_argument("--rows", type=int, default=1_000, help="Transactions generated for the user")
+    parser.add_argument("--workdir", default=None, help="Where the database and archive go (default: a temp dir)")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rollups_")
+    db_path = os.path.join(workdir, "rollups.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    # The backend reads its settings at import time (migrations import it too), so they are set first
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    os.environ.setdefault("SECRET_KEY", "rollups")
+    migrate(os.environ["DATABASE_URL"])
+
+    from fastapi.testclient import TestClient
+    from .. import models, database, auth, matching, statements, cold_archive, rollups
+    from ..main import app
+    from ..utils.money import from_cents
+
+    transactions, bank_rows = generate(args.rows, seed=1)
+    statement_path = os.path.join(workdir, "statement.csv")
+    write_statement_csv(statement_path, bank_rows)
+    db = database.SessionLocal()
+    try:
+        db.add(models.User(id=1, username="rollups", email="rollups@example.com", hashed_password="-"))
+        db.commit()
+    finally:
+        db.close()
+
+    headers = {"Authorization": f"Bearer {auth.create_access_token({'sub': 'rollups'})}"}
+    failures = []
+
+    def check(condition: bool, message: str):
+        print(f"[{'ok' if condition else 'FAIL'}] {message}")
+        if not condition:
+            failures.append(message)
+
+    def in_session(func, *args):
+        db = database.SessionLocal()
+        try:
+            return func(db, *args)
+        finally:
+            db.close()
+
+    def verify(client, step: str):
+        check(in_session(rollups.rebuild, 1) == 0, f"{step}: no drift")
+        listed, cursor = [], None
+        while True:
+            response = client.get("/api/transactions/", params={"limit": 1000, **({"cursor": cursor} if cursor else {})},
+                                  headers=headers)
+            listed += response.json()
+            cursor = response.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        months = Counter()
+        for tx in listed:
+            month = tx["date"][:7] + "-01"
+            months[month, "count"] += 1
+            months[month, "matched_count"] += tx["matched"]
+            months[month, tx["type"]] += round(tx["amount"] * 100)
+        summary = client.get("/api/transactions/summary/monthly", headers=headers).json()
+        check(all(
+            row["count"] == months[row["month"], "count"]
+            and row["matched_count"] == months[row["month"], "matched_count"]
+            and row["income"] == from_cents(months[row["month"], "income"])
+            and row["expense"] == from_cents(months[row["month"], "expense"])
+            for row in summary
+        ) and sum(row["count"] for row in summary) == len(listed), f"{step}: monthly summary matches the listing")
+        categories = client.get("/api/transactions/summary/categories", params={"from_month": "2024-04", "to_month": "2024-06"},
+                                headers=headers).json()
+        in_range = [tx for tx in listed if "2024-04-01" <= tx["date"] < "2024-07-01"]
+        check(sum(row["count"] for row in categories) == len(in_range), f"{step}: category summary covers its months")
+        totals = client.get("/api/bank-matcher/summary", headers=headers).json()
+        check(totals["total_transactions"] == len(listed)
+              and totals["matched_count"] == sum(tx["matched"] for tx in listed), f"{step}: match summary matches the listing")
+
+    with TestClient(app) as client:
+        for tx in transactions:
+            client.post("/api/transactions/", json={**{key: tx[key] for key in ("category", "type", "note")},
+                                                    "date": tx["date"].isoformat(), "amount": from_cents(tx["amount_cents"])},
+                        headers=headers)
+        in_session(statements.import_statement, 1, statement_path, "Rollup Bank", "001")
+        verify(client, "after creates")
+
+        in_session(matching.run_matching, 1, 1, 0.01)
+        match_ids = [match["id"] for match in client.get("/api/matching/matches", headers=headers).json()]
+        client.post(f"/api/matching/matches/{match_ids[0]}/confirm", headers=headers)
+        client.post("/api/matching/matches/confirm", json={"match_ids": match_ids[1:len(match_ids) // 2]}, headers=headers)
+        verify(client, "after confirming matches")
+
+        listed = client.get("/api/transactions/", params={"matched": False, "limit": 20}, headers=headers).json()
+        bank = client.get("/api/bank-transactions/", params={"matched": False, "limit": 1}, headers=headers).json()
+        client.post("/api/matching/confirm", json={"transaction_id": listed[0]["id"], "bank_transaction_id": bank[0]["id"]},
+                    headers=headers)
+        for tx in listed[1:10]:
+            client.put(f"/api/transactions/{tx['id']}", json={
+                "date": "2024-12-31", "amount": tx["amount"] + 1, "category": "Moved", "type": "income", "note": tx["note"]
+            }, headers=headers)
+        for tx in listed[10:]:
+            client.delete(f"/api/transactions/{tx['id']}", headers=headers)
+        verify(client, "after updates and deletes")
+
+        in_session(cold_archive.archive_user, 1, date(2024, 7, 1))
+        verify(client, "after archiving")
+
+        started = time.perf_counter()
+        for _ in range(20):
+            client.get("/api/transactions/summary/monthly", headers=headers)
+        print(f"monthly summary: {(time.perf_counter() - started) / 20 * 1000:.1f} ms per request")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+Benchmarks for the matching, parsing and ingest hot paths.
+
+Each size gets its own on-disk SQLite database filled from the deterministic
+generator. Every hot path is timed (best of --repeat runs) and then run once
+more under tracemalloc for its peak memory. Results go to a JSON file.
+
+    python -m backend.benchmarks.run --sizes 1k,100k --out bench.json
+    python -m backend.benchmarks.run --sizes 1m --only statements.import_statement
+    python -m backend.benchmarks.run compare base.json bench.json --threshold 0.15
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+# The backend reads its settings at import time; the benchmarks bring their own databases
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+
+from sqlalchemy import insert, select
+from .. import models, database, matching, sql_matching, statements
+from ..pagination import encode_cursor, keyset_page, next_cursor
+from ..utils import matching as scored_matching
+from ..utils.bank_parser import parse_bank_csv
+from ..utils.descriptions import normalize_description, description_grams
+from .generate import generate, write_statement_csv
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+# Statements in the onboarding archive benchmark, one account each
+ARCHIVE_FILES = 40
+
+# Rows per page in the listing benchmarks; the last page should take as long as the first
+PAGE_SIZE = 100
+
+def parse_size(value: str) -> int:
+    value = value.strip().lower()
+    if value[-1] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+def _create_user(db, name: str) -> int:
+    user = models.User(username=name, email=f"{name}@example.com", hashed_password="-")
+    db.add(user)
+    db.commit()
+    return user.id
+
+def _seed_transactions(db, owner_id: int, transactions):
+    rows = [dict(tx, owner_id=owner_id, matched=False, normalized_note=normalize_description(tx["note"])) for tx in transactions]
+    for start in range(0, len(rows), 10_000):
+        db.execute(insert(models.Transaction), rows[start:start + 10_000])
+    db.commit()
+
+def _seed_bank_transactions(db, owner_id: int, bank_rows):
+    rows = []
+    for row in bank_rows:
+        normalized = normalize_description(row["description"])
+        rows.append(dict(
+            row,
+            owner_id=owner_id,
+            bank_name="Bench Bank",
+            account_number="000",
+            is_matched=False,
+            normalized_description=normalized,
+            gram_count=len(description_grams(normalized))
+        ))
+    for start in range(0, len(rows), 10_000):
+        db.execute(insert(models.BankTransaction), rows[start:start + 10_000])
+    db.commit()
+
+def _write_archive(zip_path: str, workdir: str, bank_rows):
+    """The bank rows split over ARCHIVE_FILES statements named <bank>_<account>.csv, zipped."""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for number in range(ARCHIVE_FILES):
+            part_path = os.path.join(workdir, f"Bench Bank_{number:03d}.csv")
+            write_statement_csv(part_path, bank_rows[number::ARCHIVE_FILES])
+            archive.write(part_path, os.path.basename(part_path))
+            os.remove(part_path)
+
+def _measure(setup, run, repeat: int):
+    """Best wall time over repeat runs, then peak traced memory of one more run."""
+    best = None
+    for _ in range(repeat):
+        state = setup()
+        started = time.perf_counter()
+        run(state)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return best, peak
+
+def run_size(size: int, workdir: str, repeat: int, seed: int, only=None):
+    db_path = os.path.join(workdir, f"bench_{size}.sqlite")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    Session = database.create_session_factory(f"sqlite:///{db_path}")
+    models.Base.metadata.create_all(bind=Session.kw["bind"])
+
+    transactions, bank_rows = generate(size, seed=seed)
+    csv_path = os.path.join(workdir, f"statement_{size}.csv")
+    write_statement_csv(csv_path, bank_rows)
+    zip_path = os.path.join(workdir, f"statements_{size}.zip")
+    _write_archive(zip_path, workdir, bank_rows)
+
+    db = Session()
+    owner_id = _create_user(db, f"bench_{size}")
+    _seed_transactions(db, owner_id, transactions)
+    _seed_bank_transactions(db, owner_id, bank_rows)
+    db.close()
+    rows = len(transactions) + len(bank_rows)
+
+    def loaded_rows():
+        session = Session()
+        try:
+            return matching.load_unmatched(session, owner_id)
+        finally:
+            session.close()
+
+    def loaded_models():
+        session = Session()
+        try:
+            return (
+                session.query(models.Transaction).filter(models.Transaction.owner_id == owner_id).all(),
+                session.query(models.BankTransaction).filter(models.BankTransaction.owner_id == owner_id).all()
+            )
+        finally:
+            session.close()
+
+    def sql_session():
+        return Session()
+
+    def sql_run(session, **kwargs):
+        # Matches are rolled back so every run starts from the same state
+        try:
+            sql_matching.insert_matches(session, owner_id, **kwargs)
+        finally:
+            session.rollback()
+            session.close()
+
+    import_runs = []
+
+    def import_setup():
+        session = Session()
+        import_owner = _create_user(session, f"bench_{size}_import_{len(import_runs)}")
+        import_runs.append(import_owner)
+        _seed_transactions(session, import_owner, transactions)
+        return session, import_owner
+
+    def import_run(state):
+        session, import_owner = state
+        try:
+            statements.import_statement(session, import_owner, csv_path, "Bench Bank", "000")
+        finally:
+            session.close()
+
+    def reimport_setup():
+        # The statement is already stored once; the timed run imports it again
+        session, import_owner = import_setup()
+        statements.import_statement(session, import_owner, csv_path, "Bench Bank", "000")
+        return session, import_owner
+
+    def index_setup():
+        # The statement is stored and waits for its grams and candidates, as after an upload
+        session, import_owner = import_setup()
+        statements.import_statement(session, import_owner, csv_path, "Bench Bank", "000")
+        return session, import_owner
+
+    def index_run(state):
+        session, import_owner = state
+        try:
+            statements.index_pending(session, import_owner)
+        finally:
+            session.close()
+
+    def archive_run(state):
+        session, import_owner = state
+        try:
+            statements.import_archive(session, import_owner, zip_path)
+        finally:
+            session.close()
+
+    def page_cursor(position: int):
+        # Cursor of the row before position in listing order, found outside the timing
+        def setup():
+            session = Session()
+            if position == 0:
+                return session, None
+            row = session.query(models.Transaction.date, models.Transaction.id).filter(
+                models.Transaction.owner_id == owner_id
+            ).order_by(models.Transaction.date.desc(), models.Transaction.id.desc()).offset(position - 1).first()
+            return session, encode_cursor(row.date, row.id)
+        return setup
+
+    def page_run(state):
+        session, cursor = state
+        try:
+            query = select(models.Transaction).filter(models.Transaction.owner_id == owner_id)
+            rows = session.scalars(keyset_page(query, models.Transaction, cursor, PAGE_SIZE)).all()
+            next_cursor(rows, PAGE_SIZE)
+        finally:
+            session.close()
+
+    benchmarks = [
+        ("matching.load_unmatched", lambda: None, lambda _: loaded_rows()),
+        ("matching.find_matches.exact", loaded_rows, lambda state: matching.find_matches(*state)),
+        ("matching.find_matches.tolerance", loaded_rows,
+         lambda state: matching.find_matches(*state, time_window_days=1, amount_tolerance=0.01)),
+        ("sql_matching.insert_matches.exact", sql_session, lambda state: sql_run(state)),
+        ("sql_matching.insert_matches.tolerance", sql_session,
+         lambda state: sql_run(state, time_window_days=1, amount_tolerance=0.01)),
+        ("utils.matching.find_matches", loaded_models, lambda state: scored_matching.find_matches(*state)),
+        ("utils.matching.assign_matches", loaded_models, lambda state: scored_matching.assign_matches(*state)),
+        ("bank_parser.parse_bank_csv", lambda: None, lambda _: parse_bank_csv(csv_path)),
+        ("statements.import_statement", import_setup, import_run),
+        ("statements.import_statement.reimport", reimport_setup, import_run),
+        ("statements.import_archive", import_setup, archive_run),
+        ("statements.index_pending", index_setup, index_run),
+        ("pagination.first_page", page_cursor(0), page_run),
+        ("pagination.last_page", page_cursor(max(len(transactions) - PAGE_SIZE, 0)), page_run),
+    ]
+
+    results = []
+    for name, setup, run in benchmarks:
+        if only and not any(name == prefix or name.startswith(prefix + ".") for prefix in only):
+            continue
+        seconds, peak = _measure(setup, run, repeat)
+        result = {
+            "name": name,
+            "size": size,
+            "rows": rows,
+            "seconds": round(seconds, 6),
+            "peak_mb": round(peak / 1024 / 1024, 3),
+            "rows_per_s": round(rows / seconds, 1) if seconds else None,
+        }
+        results.append(result)
+        print(f"{name:<36} {size:>9} {result['seconds']:>10.3f}s {result['peak_mb']:>10.1f}MB {result['rows_per_s'] or 0:>12.0f} rows/s")
+    return results
+
+def run(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for size in args.sizes:
+        results.extend(run_size(size, workdir, args.repeat, args.seed, args.only))
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.out}")
+
+def compare(args) -> int:
+    """Print the change of every benchmark and flag regressions beyond the threshold."""
+    with open(args.base) as f:
+        base = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    with open(args.new) as f:
+        new = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'benchmark':<36} {'size':>9} {'time':>9} {'memory':>9}")
+    for key in sorted(base.keys() & new.keys()):
+        old, cur = base[key], new[key]
+        time_change = cur["seconds"] / old["seconds"] - 1 if old["seconds"] else 0.0
+        memory_change = cur["peak_mb"] / old["peak_mb"] - 1 if old["peak_mb"] else 0.0
+        flag = ""
+        if time_change > args.threshold or memory_change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{key[0]:<36} {key[1]:>9} {time_change:>+9.1%} {memory_change:>+9.1%}{flag}")
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{key[0]:<36} {key[1]:>9} only in {'base' if key in base else 'new'}")
+
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(prog="backend.benchmarks.run compare", description="Compare two benchmark runs")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown or growth that counts as a regression")
+        return compare(parser.parse_args(argv[1:]))
+
+    parser = argparse.ArgumentParser(description="Benchmark the matching, parsing and ingest hot paths")
+    parser.add_argument("--sizes", type=lambda value: [parse_size(x) for x in value.split(",")], default=[1_000],
+                        help="Comma-separated row counts, e.g. 1k,100k,1m")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the best one is kept")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", type=lambda value: value.split(","), default=None,
+                        help="Comma-separated benchmark names to run, with their sub-benchmarks (default: all)")
+    parser.add_argument("--workdir", default=None, help="Where databases and statements go (default: a temp dir)")
+    parser.add_argument("--out", default="bench.json")
+    run(parser.parse_args(argv))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
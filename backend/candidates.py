@@ -0,0 +1,134 @@
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from typing import List
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from . import models
+from .utils.matching import DATE_WINDOW_DAYS, score_pairs
+
+# A pair is a candidate when it lies inside this window and scores at least CANDIDATE_MIN_SCORE
+CANDIDATE_WINDOW_DAYS = DATE_WINDOW_DAYS
+CANDIDATE_AMOUNT_TOLERANCE = 0.01
+CANDIDATE_MIN_SCORE = 0.6
+
+def candidate_rows(transactions: List[models.Transaction], bank_transactions: List[models.BankTransaction], owner_id: int) -> List[dict]:
+    """
+    Score transactions against bank transactions and keep the pairs inside the
+    candidate window. Bank transactions are indexed by day with their amounts in cents
+    sorted, so only the pairs inside the window are ever scored.
+    """
+    by_day = defaultdict(list)
+    for bank_transaction in bank_transactions:
+        by_day[bank_transaction.date.toordinal()].append(bank_transaction)
+    index = {}
+    for day, day_bank in by_day.items():
+        day_bank.sort(key=lambda b: b.amount_cents)
+        index[day] = ([b.amount_cents for b in day_bank], day_bank)
+
+    pairs = []
+    for transaction in transactions:
+        cents = transaction.amount_cents
+        tolerance = abs(cents) * CANDIDATE_AMOUNT_TOLERANCE
+        day = transaction.date.toordinal()
+        for offset in range(-CANDIDATE_WINDOW_DAYS, CANDIDATE_WINDOW_DAYS + 1):
+            bucket = index.get(day + offset)
+            if not bucket:
+                continue
+            amounts, day_bank = bucket
+            low = bisect_left(amounts, cents - tolerance)
+            high = bisect_right(amounts, cents + tolerance)
+            pairs.extend((transaction, bank_transaction) for bank_transaction in day_bank[low:high])
+
+    rows = []
+    for (transaction, bank_transaction), score in zip(pairs, score_pairs(pairs)):
+        if score >= CANDIDATE_MIN_SCORE:
+            rows.append({
+                "transaction_id": transaction.id,
+                "bank_transaction_id": bank_transaction.id,
+                "score": score,
+                "owner_id": owner_id,
+            })
+    return rows
+
+def refresh_transaction(db: Session, transaction: models.Transaction):
+    """
+    Recompute the candidates of a single transaction after it was created or updated.
+    Only bank transactions inside its date/amount window are scored.
+    The caller is responsible for committing.
+    """
+    remove_transaction(db, transaction.id)
+    if transaction.matched or transaction.bank_transaction_id is not None:
+        return
+
+    tolerance = abs(transaction.amount_cents) * CANDIDATE_AMOUNT_TOLERANCE
+    bank_transactions = db.query(models.BankTransaction).filter(
+        models.BankTransaction.owner_id == transaction.owner_id,
+        models.BankTransaction.date.between(
+            transaction.date - timedelta(days=CANDIDATE_WINDOW_DAYS),
+            transaction.date + timedelta(days=CANDIDATE_WINDOW_DAYS)
+        ),
+        models.BankTransaction.amount_cents.between(transaction.amount_cents - tolerance, transaction.amount_cents + tolerance),
+        models.BankTransaction.is_matched == False,
+        models.BankTransaction.transaction_id == None
+    ).all()
+
+    rows = candidate_rows([transaction], bank_transactions, transaction.owner_id)
+    if rows:
+        db.execute(insert(models.MatchCandidate), rows)
+
+def refresh_bank_transactions(db: Session, owner_id: int, bank_transactions: List[models.BankTransaction]):
+    """
+    Recompute the candidates of freshly imported or updated bank transactions.
+    Only transactions inside the window spanned by the bank transactions are scored.
+    The bank transactions must have been flushed so they carry ids; the caller commits.
+    """
+    bank_transactions = [b for b in bank_transactions if not b.is_matched and b.transaction_id is None]
+    if not bank_transactions:
+        return
+    remove_bank_transactions(db, [b.id for b in bank_transactions])
+
+    # Amounts are compared relative to the transaction amount, so widen the range to cover it
+    amounts = [b.amount_cents for b in bank_transactions]
+    slack = max(abs(a) for a in amounts) * CANDIDATE_AMOUNT_TOLERANCE / (1 - CANDIDATE_AMOUNT_TOLERANCE)
+    # Only the columns scoring looks at, which is much cheaper than full objects on large imports
+    transactions = db.query(
+        models.Transaction.id,
+        models.Transaction.date,
+        models.Transaction.amount_cents,
+        models.Transaction.note,
+        models.Transaction.normalized_note,
+        models.Transaction.category
+    ).filter(
+        models.Transaction.owner_id == owner_id,
+        models.Transaction.date.between(
+            min(b.date for b in bank_transactions) - timedelta(days=CANDIDATE_WINDOW_DAYS),
+            max(b.date for b in bank_transactions) + timedelta(days=CANDIDATE_WINDOW_DAYS)
+        ),
+        models.Transaction.amount_cents.between(min(amounts) - slack, max(amounts) + slack),
+        models.Transaction.matched == False,
+        models.Transaction.bank_transaction_id == None
+    ).all()
+
+    rows = candidate_rows(transactions, bank_transactions, owner_id)
+    if rows:
+        db.execute(insert(models.MatchCandidate), rows)
+
+def remove_transaction(db: Session, transaction_id: int):
+    """Drop every candidate pair of a transaction."""
+    db.query(models.MatchCandidate).filter(
+        models.MatchCandidate.transaction_id == transaction_id
+    ).delete(synchronize_session=False)
+
+def remove_bank_transactions(db: Session, bank_transaction_ids: List[int]):
+    """Drop every candidate pair of the given bank transactions."""
+    # Chunked to stay under the bound-parameter limit on large imports
+    for start in range(0, len(bank_transaction_ids), 500):
+        db.query(models.MatchCandidate).filter(
+            models.MatchCandidate.bank_transaction_id.in_(bank_transaction_ids[start:start + 500])
+        ).delete(synchronize_session=False)
+
+def remove_matched(db: Session, transaction_id: int, bank_transaction_id: int):
+    """Drop the candidates of both sides of a confirmed match."""
+    remove_transaction(db, transaction_id)
+    remove_bank_transactions(db, [bank_transaction_id])
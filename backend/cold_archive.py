@@ -0,0 +1,363 @@
+"""
+Cold archive of reconciled history.
+
+A matched pair of a transaction and its bank transaction is not edited once it
+is old. archive_user moves the pairs dated before a cutoff out of the hot tables
+into Parquet files, one per user, month and table:
+
+    <ARCHIVE_DIR>/<owner_id>/<YYYY-MM>/transactions.parquet
+                                      /bank_transactions.parquet
+
+so the hot tables and their indexes only grow with recent activity. Listings,
+single reads and statement deduplication read the archive as well; a month
+file is only opened when its month can hold rows of the request. The monthly
+rollups keep counting archived pairs. restore_pair moves a pair back for the
+rare correction.
+
+    python -m backend.cold_archive archive --older-than-days 365
+    python -m backend.cold_archive restore --user 1 --transaction 42
+"""
+import argparse
+import heapq
+import itertools
+import os
+import threading
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+from . import models, database, description_index
+from .config import settings
+from .executor import run_blocking
+from .filters import ListingFilters
+from .pagination import decode_cursor, keyset_page
+
+@dataclass(frozen=True)
+class ArchivedTable:
+    """A hot table whose reconciled rows are archived, and the Parquet schema of its files."""
+    name: str
+    model: type
+    schema: pa.Schema
+
+    @property
+    def columns(self) -> List[str]:
+        return self.schema.names
+
+TABLES: Dict[str, ArchivedTable] = {
+    "transactions": ArchivedTable("transactions", models.Transaction, pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("amount_cents", pa.int64()),
+        ("category", pa.string()),
+        ("type", pa.string()),
+        ("note", pa.string()),
+        ("normalized_note", pa.string()),
+        ("matched", pa.bool_()),
+        ("bank_transaction_id", pa.int64()),
+    ])),
+    "bank_transactions": ArchivedTable("bank_transactions", models.BankTransaction, pa.schema([
+        ("id", pa.int64()),
+        ("date", pa.date32()),
+        ("amount_cents", pa.int64()),
+        ("description", pa.string()),
+        ("normalized_description", pa.string()),
+        ("gram_count", pa.int64()),
+        ("fingerprint", pa.string()),
+        ("bank_name", pa.string()),
+        ("account_number", pa.string()),
+        ("is_matched", pa.bool_()),
+        ("transaction_id", pa.int64()),
+    ])),
+}
+
+# Month files are rewritten whole; this keeps two rewrites in the API process from interleaving
+_write_lock = threading.Lock()
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+def _user_dir(owner_id: int) -> str:
+    return os.path.join(settings.ARCHIVE_DIR, str(owner_id))
+
+def _path(owner_id: int, month: date, table: str) -> str:
+    return os.path.join(_user_dir(owner_id), month.strftime("%Y-%m"), f"{table}.parquet")
+
+def archived_months(owner_id: int, table: str) -> List[date]:
+    """First days of the months that have an archive file of table, oldest first."""
+    try:
+        names = os.listdir(_user_dir(owner_id))
+    except FileNotFoundError:
+        return []
+    months = []
+    for name in names:
+        try:
+            month = date.fromisoformat(f"{name}-01")
+        except ValueError:
+            continue
+        if os.path.exists(_path(owner_id, month, table)):
+            months.append(month)
+    return sorted(months)
+
+def _read(owner_id: int, month: date, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    path = _path(owner_id, month, table)
+    if not os.path.exists(path):
+        return TABLES[table].schema.empty_table().to_pandas()[columns or TABLES[table].columns]
+    # Nullable integer columns stay integers instead of turning into floats
+    return pq.read_table(path, columns=columns).to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+def _write(owner_id: int, month: date, table: str, frame: pd.DataFrame):
+    """Replace a month file with frame, or remove it when frame is empty. The swap is atomic."""
+    path = _path(owner_id, month, table)
+    if frame.empty:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrow_table = pa.Table.from_pandas(frame.sort_values(["date", "id"]), schema=TABLES[table].schema,
+                                       preserve_index=False)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(arrow_table, temp_path, compression="zstd")
+    os.replace(temp_path, path)
+
+def _append(owner_id: int, table: str, rows: pd.DataFrame):
+    """Add rows to the month files of their dates; rows already archived are not duplicated."""
+    months = rows["date"].map(_month_start)
+    for month, month_rows in rows.groupby(months):
+        existing = _read(owner_id, month, table)
+        existing = existing[~existing["id"].isin(month_rows["id"])]
+        _write(owner_id, month, table, pd.concat([existing, month_rows], ignore_index=True))
+
+def _drop(owner_id: int, table: str, ids: Iterable[int], months: Optional[Iterable[date]] = None):
+    """Remove rows by id from the month files of table (from every month when none are given)."""
+    ids = set(ids)
+    for month in months if months is not None else archived_months(owner_id, table):
+        existing = _read(owner_id, month, table)
+        if existing["id"].isin(ids).any():
+            _write(owner_id, month, table, existing[~existing["id"].isin(ids)])
+
+def archived_rows(owner_id: int, table: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Every archived row of table, for recounts."""
+    frames = [_read(owner_id, month, table, columns) for month in archived_months(owner_id, table)]
+    return pd.concat(frames, ignore_index=True) if frames else _read(owner_id, date.min, table, columns)
+
+def to_models(table: str, frame: pd.DataFrame, owner_id: int) -> List:
+    """Archived rows as model instances not attached to any session."""
+    model = TABLES[table].model
+    rows = frame.astype(object).where(frame.notna(), None).to_dict("records")
+    if table == "transactions":
+        for row in rows:
+            row["type"] = models.TransactionType(row["type"])
+    return [model(**row, owner_id=owner_id) for row in rows]
+
+def find_archived(owner_id: int, table: str, row_id: int):
+    """The archived row of table with id row_id as a transient model, or None."""
+    for month in reversed(archived_months(owner_id, table)):
+        frame = _read(owner_id, month, table)
+        frame = frame[frame["id"] == row_id]
+        if not frame.empty:
+            return to_models(table, frame, owner_id)[0]
+    return None
+
+def archived_fingerprints(owner_id: int, fingerprints: Set[str], days: Iterable[date]) -> Set[str]:
+    """Which of fingerprints belong to archived bank transactions of the months of days."""
+    months = set(archived_months(owner_id, "bank_transactions"))
+    found = set()
+    for month in months & {_month_start(day) for day in days}:
+        stored = _read(owner_id, month, "bank_transactions", ["fingerprint"])["fingerprint"]
+        found.update(stored[stored.isin(fingerprints)])
+    return found
+
+def filtered_rows(owner_id: int, table: str, filters: ListingFilters, before: Optional[Tuple[date, int]] = None,
+                  limit: Optional[int] = None) -> pd.DataFrame:
+    """
+    Archived rows of table passing filters, newest first on (date, id), and only
+    those before the key `before` when given. Months are read newest first and the
+    walk stops once limit rows are found.
+    """
+    date_to = filters.date_to
+    if before and (date_to is None or before[0] < date_to):
+        date_to = before[0] + timedelta(days=1)
+    found, count = [], 0
+    for month in reversed(archived_months(owner_id, table)):
+        if (date_to is not None and month >= date_to) or (filters.date_from and month < _month_start(filters.date_from)):
+            continue
+        frame = filters.apply(_read(owner_id, month, table))
+        if before:
+            frame = frame[(frame["date"] < before[0]) | ((frame["date"] == before[0]) & (frame["id"] < before[1]))]
+        if frame.empty:
+            continue
+        found.append(frame)
+        count += len(frame)
+        if limit is not None and count >= limit:
+            break
+    if not found:
+        return _read(owner_id, date.min, table)
+    frame = pd.concat(found, ignore_index=True).sort_values(["date", "id"], ascending=False)
+    return frame.head(limit) if limit is not None else frame
+
+async def listing_page(db: AsyncSession, query: Select, table: str, owner_id: int, filters: ListingFilters,
+                       cursor: Optional[str], limit: int, skip: int = 0) -> List:
+    """
+    keyset_page over the hot rows of query and the archived rows of the owner
+    together: up to limit + 1 rows after cursor, newest first, for next_cursor.
+    """
+    model = TABLES[table].model
+    if not archived_months(owner_id, table):
+        return list((await db.scalars(keyset_page(query, model, cursor, limit, skip))).all())
+    # Both sides are read from the start of the page and merged on (date, id); an offset
+    # applies to the merged rows, so it is read through rather than skipped in the query
+    skip = 0 if cursor else skip
+    rows = list((await db.scalars(keyset_page(query, model, cursor, skip + limit))).all())
+    before = decode_cursor(cursor) if cursor else None
+    archived = await run_blocking(filtered_rows, owner_id, table, filters, before, skip + limit + 1)
+    merged = heapq.merge(rows, to_models(table, archived, owner_id), key=lambda row: (row.date, row.id), reverse=True)
+    return list(itertools.islice(merged, skip, skip + limit + 1))
+
+async def listing_total(owner_id: int, table: str, filters: ListingFilters) -> int:
+    """Archived rows of table passing filters, for the total count of a listing."""
+    if not archived_months(owner_id, table):
+        return 0
+    return len(await run_blocking(filtered_rows, owner_id, table, filters))
+
+def _delete_pairs(db: Session, transaction_ids: List[int], bank_transaction_ids: List[int]):
+    T, B = models.Transaction, models.BankTransaction
+    # Chunked to stay under the bound-parameter limit
+    for start in range(0, len(transaction_ids), 500):
+        transaction_chunk = transaction_ids[start:start + 500]
+        bank_chunk = bank_transaction_ids[start:start + 500]
+        for model in (models.Match, models.MatchCandidate):
+            db.query(model).filter(
+                model.transaction_id.in_(transaction_chunk) | model.bank_transaction_id.in_(bank_chunk)
+            ).delete(synchronize_session=False)
+        description_index.remove_bank_transactions(db, bank_chunk)
+        # The pair reference each other; the links go first so neither delete trips a foreign key
+        db.execute(update(T).where(T.id.in_(transaction_chunk)).values(bank_transaction_id=None))
+        db.execute(update(B).where(B.id.in_(bank_chunk)).values(transaction_id=None))
+        db.query(B).filter(B.id.in_(bank_chunk)).delete(synchronize_session=False)
+        db.query(T).filter(T.id.in_(transaction_chunk)).delete(synchronize_session=False)
+
+def _load(db: Session, table: str, ids: List[int]) -> pd.DataFrame:
+    """Hot rows of table by id, in the archive columns."""
+    model, columns = TABLES[table].model, TABLES[table].columns
+    rows = []
+    for start in range(0, len(ids), 500):
+        rows.extend(db.execute(select(*(getattr(model, column) for column in columns)).filter(
+            model.id.in_(ids[start:start + 500])
+        )).all())
+    frame = pd.DataFrame([tuple(row) for row in rows], columns=columns)
+    if "type" in frame:
+        frame["type"] = frame["type"].map(lambda value: getattr(value, "value", value))
+    return frame
+
+def archive_user(db: Session, owner_id: int, cutoff: date) -> int:
+    """
+    Move the owner's matched pairs whose two dates fall before cutoff to the
+    archive, a month of transactions at a time: the rows are written to the month
+    files, then deleted from the hot tables and committed. When the commit fails
+    the rows are taken out of the files again. Returns the number of pairs moved.
+    """
+    T, B = models.Transaction, models.BankTransaction
+    pairs = select(T.id.label("t_id"), B.id.label("b_id"), T.date).join(
+        B, (B.id == T.bank_transaction_id) & (B.transaction_id == T.id)
+    ).filter(
+        T.owner_id == owner_id, B.owner_id == owner_id,
+        T.matched == True, B.is_matched == True,
+        T.date < cutoff, B.date < cutoff
+    )
+    months = sorted({_month_start(day) for _, _, day in db.execute(pairs)})
+    moved = 0
+    for month in months:
+        month_pairs = db.execute(pairs.filter(T.date >= month, T.date < _month_start(month + timedelta(days=31)))).all()
+        transaction_ids = [row.t_id for row in month_pairs]
+        bank_transaction_ids = [row.b_id for row in month_pairs]
+        frames = {"transactions": _load(db, "transactions", transaction_ids),
+                  "bank_transactions": _load(db, "bank_transactions", bank_transaction_ids)}
+        with _write_lock:
+            for table, frame in frames.items():
+                _append(owner_id, table, frame)
+            try:
+                _delete_pairs(db, transaction_ids, bank_transaction_ids)
+                db.commit()
+            except Exception:
+                db.rollback()
+                for table, frame in frames.items():
+                    _drop(owner_id, table, frame["id"], set(frame["date"].map(_month_start)))
+                raise
+        moved += len(month_pairs)
+    return moved
+
+def restore_pair(db: Session, owner_id: int, transaction_id: Optional[int] = None,
+                 bank_transaction_id: Optional[int] = None) -> Optional[models.Transaction]:
+    """
+    Move an archived pair, given by either side, back to the hot tables with its
+    original ids. Returns the restored transaction, or None when the pair is not
+    archived. The rows leave the archive once the restore is committed.
+    """
+    if transaction_id is None:
+        bank_transaction = find_archived(owner_id, "bank_transactions", bank_transaction_id)
+        if bank_transaction is None:
+            return None
+        transaction_id = bank_transaction.transaction_id
+    transaction = find_archived(owner_id, "transactions", transaction_id)
+    if transaction is None:
+        return None
+    bank_transaction = find_archived(owner_id, "bank_transactions", transaction.bank_transaction_id)
+
+    with _write_lock:
+        # Inserted unlinked, then linked, so neither insert refers to a row not there yet
+        transaction.bank_transaction_id = None
+        db.add(transaction)
+        if bank_transaction is not None:
+            bank_transaction.transaction_id = None
+            db.add(bank_transaction)
+            db.flush()
+            transaction.bank_transaction_id = bank_transaction.id
+            bank_transaction.transaction_id = transaction.id
+            description_index.index_bank_transactions(db, [bank_transaction])
+        db.commit()
+        _drop(owner_id, "transactions", [transaction.id], [_month_start(transaction.date)])
+        if bank_transaction is not None:
+            _drop(owner_id, "bank_transactions", [bank_transaction.id], [_month_start(bank_transaction.date)])
+    db.refresh(transaction)
+    return transaction
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move reconciled history to the cold archive and back")
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive = commands.add_parser("archive", help="Archive matched pairs older than a cutoff")
+    archive.add_argument("--older-than-days", type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                         help="Archive pairs dated before this many days ago")
+    archive.add_argument("--users", type=lambda value: [int(x) for x in value.split(",")], default=None,
+                         help="Comma-separated user ids (default: all users)")
+    restore = commands.add_parser("restore", help="Move one archived pair back to the database")
+    restore.add_argument("--user", type=int, required=True)
+    side = restore.add_mutually_exclusive_group(required=True)
+    side.add_argument("--transaction", type=int, help="Id of the pair's transaction")
+    side.add_argument("--bank-transaction", type=int, help="Id of the pair's bank transaction")
+    args = parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        if args.command == "archive":
+            cutoff = date.today() - timedelta(days=args.older_than_days)
+            query = db.query(models.User.id)
+            if args.users:
+                query = query.filter(models.User.id.in_(args.users))
+            for user_id, in query.order_by(models.User.id).all():
+                print(f"user {user_id}: {archive_user(db, user_id, cutoff)} pairs archived before {cutoff}")
+        else:
+            transaction = restore_pair(db, args.user, args.transaction, args.bank_transaction)
+            if transaction is None:
+                parser.exit(1, "No such archived pair\n")
+            print(f"Restored transaction {transaction.id} and bank transaction {transaction.bank_transaction_id}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
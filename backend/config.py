@@ -1,12 +1,36 @@
 import os
+from typing import Optional
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     DATABASE_URL: str
+    # Optional replica the read-only endpoints are served from
+    READ_REPLICA_URL: Optional[str] = None
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30
+    # Seconds after which a pooled connection is replaced, before servers drop it as idle
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Page cache of each SQLite connection; large imports slow down once their indexes outgrow it
+    SQLITE_CACHE_MB: int = 64
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60
     CORS_ORIGINS: str = "*"
+    JOB_WORKERS: int = 4
+    JOB_MAX_PER_USER: int = 2
+    BLOCKING_WORKERS: int = 4
+    PARSE_WORKERS: Optional[int] = None
+    MATCHING_BACKEND: str = "python"
+    # Matched pairs older than this many days may be moved to Parquet files under ARCHIVE_DIR
+    ARCHIVE_DIR: str = os.path.join("backend", "archive")
+    ARCHIVE_AFTER_DAYS: int = 365
+    # Built reports are kept under REPORTS_DIR until they are this old, or the oldest
+    # of them once the directory holds more than REPORTS_MAX_BYTES
+    REPORTS_DIR: str = os.path.join("backend", "reports")
+    REPORTS_MAX_BYTES: int = 512 * 1024 * 1024
+    REPORTS_MAX_AGE_HOURS: int = 24
 
     class Config:
         env_file = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.env'))
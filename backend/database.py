@@ -1,16 +1,171 @@
-from sqlalchemy import create_engine
+import threading
+from typing import Dict, Optional, Union
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url, URL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
+from sqlalchemy.pool import QueuePool
 from .config import settings
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL
- 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Read-only endpoints use the replica when one is configured, the primary otherwise
+READ_DATABASE_URL = settings.READ_REPLICA_URL or SQLALCHEMY_DATABASE_URL
+
+# Async drivers used for the same databases by the async endpoints
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(url: str) -> URL:
+    """The database URL with its driver swapped for the async one of the same backend."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername))
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers carry on while an import writes; the timeout makes writers queue instead of failing
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    # Under WAL, NORMAL only syncs at checkpoints: a power loss may drop the last commits but never
+    # corrupts the file. FULL syncs every page a large import spills from the cache, which slows it
+    # several times over. A negative cache_size is in KiB.
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_MB * 1024}")
+    cursor.close()
+
+def _pool_options(url: Union[str, URL]) -> dict:
+    """Pool settings for an engine on url, from the DB_POOL_* settings."""
+    url = make_url(url)
+    options = {"pool_pre_ping": settings.DB_POOL_PRE_PING, "pool_recycle": settings.DB_POOL_RECYCLE}
+    # Only queue pools are sized; SQLite drivers may default to a per-thread or no pool
+    if issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT
+        )
+    return options
+
+class PoolMetrics:
+    """Checkout counters of one connection pool, updated from its pool events."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.pool = None
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self._lock = threading.Lock()
+
+    def watch(self, engine: Engine):
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        self.pool = engine.pool
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "pool": self.pool.status(),
+                "checked_out": self.checked_out,
+                "peak_checked_out": self.peak_checked_out,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+            }
+
+# Metrics of every engine created here, by name
+_pool_metrics: Dict[str, PoolMetrics] = {}
+
+def _configure(engine: Engine, name: Optional[str] = None) -> Engine:
+    if engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", _sqlite_pragmas)
+    if name is not None:
+        metrics = _pool_metrics[name] = PoolMetrics(name)
+        metrics.watch(engine)
+    return engine
+
+def create_db_engine(url: str = SQLALCHEMY_DATABASE_URL, name: Optional[str] = None) -> Engine:
+    """A sync engine with the configured pool; with a name, its checkouts show up in pool_stats."""
+    return _configure(create_engine(url, **_pool_options(url)), name)
+
+def create_async_db_engine(url: str = SQLALCHEMY_DATABASE_URL, name: Optional[str] = None):
+    """An async engine with the configured pool, on the async driver of the same database."""
+    url = async_database_url(url)
+    engine = create_async_engine(url, **_pool_options(url))
+    _configure(engine.sync_engine, name)
+    return engine
+
+def pool_stats() -> Dict[str, dict]:
+    """Pool status and checkout counters per engine."""
+    return {name: metrics.snapshot() for name, metrics in _pool_metrics.items()}
+
+engine = create_db_engine(SQLALCHEMY_DATABASE_URL, "primary")
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Objects stay readable after commit; an async session cannot lazy-load them again
+async_engine = create_async_db_engine(SQLALCHEMY_DATABASE_URL, "primary_async")
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+if settings.READ_REPLICA_URL:
+    read_engine = create_db_engine(READ_DATABASE_URL, "replica")
+    async_read_engine = create_async_db_engine(READ_DATABASE_URL, "replica_async")
+else:
+    read_engine, async_read_engine = engine, async_engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def get_read_db():
+    """
+    Session for endpoints that only read. It is bound to the read replica when
+    READ_REPLICA_URL is set, which may lag the primary by replication delay.
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    """Async counterpart of get_read_db."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+def create_session_factory(url: str = SQLALCHEMY_DATABASE_URL) -> sessionmaker:
+    """
+    Create a separate engine and session factory.
+    Worker processes use this instead of the module-level engine, whose
+    connections must not be shared across a fork.
+    """
+    return sessionmaker(autocommit=False, autoflush=False, bind=create_db_engine(url))
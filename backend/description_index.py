@@ -0,0 +1,164 @@
+"""
+Per-user inverted index of bank transaction descriptions.
+
+Descriptions and notes are normalized once when they are written, and the
+tokens and trigrams of each description are stored in description_grams, so
+similar descriptions are found by the grams they share.
+
+reindex() recomputes the normalized text and grams of an owner's existing
+rows, for rows stored before the index existed or after normalization changed.
+Imported rows still waiting for statements.index_pending() are left to it:
+
+    python -m backend.description_index reindex --users 1,2
+"""
+import argparse
+from typing import Dict, List, Tuple, Optional
+from sqlalchemy import bindparam, delete, insert, func, select
+from sqlalchemy.orm import Session
+from . import models, database
+from .utils.descriptions import normalize_description, description_grams
+
+# Rows read and written at a time by reindex()
+REINDEX_BATCH_SIZE = 5000
+
+def index_bank_transactions(db: Session, bank_transactions: List[models.BankTransaction]) -> Dict[int, int]:
+    """
+    Write the grams of bank transaction descriptions to the per-user inverted index.
+    The bank transactions must have been flushed so they carry ids; the caller commits.
+    Returns the number of grams of each, by id.
+    """
+    if not bank_transactions:
+        return {}
+    remove_bank_transactions(db, [b.id for b in bank_transactions])
+
+    rows = []
+    gram_counts = {}
+    for bank_transaction in bank_transactions:
+        grams = description_grams(bank_transaction.normalized_description or "")
+        gram_counts[bank_transaction.id] = len(grams)
+        for gram in grams:
+            rows.append({
+                "owner_id": bank_transaction.owner_id,
+                "gram": gram,
+                "bank_transaction_id": bank_transaction.id,
+            })
+    if rows:
+        # Core executemany on the table; the ORM bulk path adds nothing for plain rows
+        db.execute(insert(models.DescriptionGram.__table__), rows)
+    return gram_counts
+
+def remove_bank_transactions(db: Session, bank_transaction_ids: List[int]):
+    """Drop the index entries of the given bank transactions."""
+    # Chunked to stay under the bound-parameter limit on large imports
+    for start in range(0, len(bank_transaction_ids), 500):
+        db.query(models.DescriptionGram).filter(
+            models.DescriptionGram.bank_transaction_id.in_(bank_transaction_ids[start:start + 500])
+        ).delete(synchronize_session=False)
+
+def search(db: Session, owner_id: int, text: str, bank_transaction_ids: Optional[List[int]] = None,
+           min_score: float = 0.0, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+    """
+    Find bank transactions whose description shares grams with text.
+    Only bank transactions with at least one gram in common are touched.
+    Returns (bank_transaction_id, jaccard score) tuples, best first.
+    """
+    grams = description_grams(normalize_description(text))
+    if not grams:
+        return []
+
+    overlap = func.count(models.DescriptionGram.id)
+    query = db.query(
+        models.DescriptionGram.bank_transaction_id,
+        overlap,
+        models.BankTransaction.gram_count
+    ).join(
+        models.BankTransaction, models.BankTransaction.id == models.DescriptionGram.bank_transaction_id
+    ).filter(
+        models.DescriptionGram.owner_id == owner_id,
+        models.DescriptionGram.gram.in_(grams)
+    )
+    if bank_transaction_ids is not None:
+        query = query.filter(models.DescriptionGram.bank_transaction_id.in_(bank_transaction_ids))
+    rows = query.group_by(models.DescriptionGram.bank_transaction_id, models.BankTransaction.gram_count).all()
+
+    scored = []
+    for bank_transaction_id, shared, gram_count in rows:
+        score = shared / (len(grams) + (gram_count or 0) - shared)
+        if score >= min_score:
+            scored.append((bank_transaction_id, score))
+    scored.sort(key=lambda x: x[1], reverse=True)
+    return scored[:limit] if limit else scored
+
+def _update_by_id(db: Session, table, values: List[dict]):
+    """Executemany UPDATE of table rows by id; each dict holds row_id and the new column values."""
+    if values:
+        columns = [name for name in values[0] if name != "row_id"]
+        db.execute(
+            table.update().where(table.c.id == bindparam("row_id")).values({name: bindparam(name) for name in columns}),
+            values
+        )
+
+def reindex(db: Session, owner_id: int) -> Tuple[int, int]:
+    """
+    Recompute the normalized notes and descriptions of the owner's rows and rebuild
+    the grams of all their indexed bank transactions, then commit. Returns how many
+    transactions and bank transactions had missing or outdated normalized text.
+    """
+    T, B = models.Transaction, models.BankTransaction
+    notes = []
+    for row_id, note, normalized in db.execute(select(T.id, T.note, T.normalized_note).where(T.owner_id == owner_id)).all():
+        expected = normalize_description(note)
+        if expected != normalized:
+            notes.append({"row_id": row_id, "normalized_note": expected})
+    for start in range(0, len(notes), REINDEX_BATCH_SIZE):
+        _update_by_id(db, T.__table__, notes[start:start + REINDEX_BATCH_SIZE])
+
+    db.execute(delete(models.DescriptionGram).where(models.DescriptionGram.owner_id == owner_id))
+    descriptions, grams = [], []
+    changed = 0
+
+    def flush():
+        _update_by_id(db, B.__table__, descriptions)
+        if grams:
+            db.execute(insert(models.DescriptionGram.__table__), grams)
+        descriptions.clear()
+        grams.clear()
+
+    rows = db.execute(
+        select(B.id, B.description, B.normalized_description, B.gram_count)
+        .where(B.owner_id == owner_id, B.gram_count.isnot(None)).order_by(B.id)
+    ).all()
+    for row_id, description, normalized, gram_count in rows:
+        expected = normalize_description(description)
+        row_grams = description_grams(expected)
+        if expected != normalized or gram_count != len(row_grams):
+            descriptions.append({"row_id": row_id, "normalized_description": expected, "gram_count": len(row_grams)})
+            changed += 1
+        grams.extend({"owner_id": owner_id, "gram": gram, "bank_transaction_id": row_id} for gram in row_grams)
+        if len(grams) >= REINDEX_BATCH_SIZE * 10:
+            flush()
+    flush()
+    db.commit()
+    return len(notes), changed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the description index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reindex_parser = commands.add_parser("reindex", help="Recompute the normalized text and grams of existing rows")
+    reindex_parser.add_argument("--users", type=lambda value: [int(x) for x in value.split(",")], default=None,
+                                help="Comma-separated user ids (default: all users)")
+    args = parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        query = db.query(models.User.id)
+        if args.users:
+            query = query.filter(models.User.id.in_(args.users))
+        for user_id, in query.order_by(models.User.id).all():
+            notes, descriptions = reindex(db, user_id)
+            print(f"user {user_id}: {notes} notes and {descriptions} descriptions renormalized, grams rebuilt")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
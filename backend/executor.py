@@ -0,0 +1,74 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, AsyncIterator, Callable, Iterator, Optional
+from . import database
+from .config import settings
+
+# Blocking work awaited by async endpoints: statement parsing and imports, report
+# building. At most BLOCKING_WORKERS of these run at once and the rest queue here,
+# so a burst of uploads cannot take over the threadpool that sync endpoints use.
+_executor = ThreadPoolExecutor(max_workers=settings.BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+# CPU-bound parsing that scales past one core, such as the statements of an archive.
+# Started on first use; workers are spawned rather than forked because the API
+# process runs threads, which a fork would copy mid-flight.
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """Run func(*args, **kwargs) in the bounded pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+async def iterate_blocking(iterator: Iterator) -> AsyncIterator:
+    """
+    Yield the items of a blocking iterator, each one produced in the bounded pool,
+    such as the chunks of a streamed report. The iterator is closed however the
+    loop ends, so it can release its session when a client goes away.
+    """
+    done = object()
+    try:
+        while True:
+            item = await run_blocking(next, iterator, done)
+            if item is done:
+                return
+            yield item
+    finally:
+        await run_blocking(iterator.close)
+
+def _in_session(session_factory: Callable, func: Callable, *args, **kwargs) -> Any:
+    db = session_factory()
+    try:
+        return func(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def run_with_session(func: Callable, *args, **kwargs) -> Any:
+    """
+    Like run_blocking, with a sync session opened in the worker thread and passed
+    as the first argument; func commits what it wants kept.
+    """
+    return await run_blocking(_in_session, database.SessionLocal, func, *args, **kwargs)
+
+async def run_with_read_session(func: Callable, *args, **kwargs) -> Any:
+    """run_with_session for read-only work, on a session of the read replica when there is one."""
+    return await run_blocking(_in_session, database.ReadSessionLocal, func, *args, **kwargs)
+
+def process_workers() -> int:
+    """Number of processes of the shared process pool: PARSE_WORKERS, or the CPU count."""
+    return settings.PARSE_WORKERS or os.cpu_count() or 1
+
+def process_pool() -> ProcessPoolExecutor:
+    """The shared process pool of process_workers() processes."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(
+                max_workers=process_workers(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _process_pool
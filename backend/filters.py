@@ -0,0 +1,184 @@
+"""
+Filters of the transaction and bank transaction listings.
+
+Every filter becomes a plain comparison on a column, so the database can serve
+it from an index: date, week, month and year filters are half-open date ranges
+(date >= start AND date < end) rather than extract() calls, amounts compare as
+cents, and a text search on bank transactions first narrows the rows through
+the description gram index. The dependencies below return a ListingFilters,
+whose predicates the router adds to its query and which applies the same tests
+to rows read from the cold archive.
+"""
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+import pandas as pd
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy import func, select, union_all
+from sqlalchemy.sql import ColumnElement
+from . import models, auth
+from .utils.descriptions import normalize_description, substring_grams
+from .utils.money import to_cents
+
+def date_range(filter_type: str, filter_value: str) -> Tuple[date, date]:
+    """[start, end) of a date, ISO week (YYYY-WW), month (YYYY-MM) or year (YYYY) filter."""
+    if filter_type == "date":
+        try:
+            start = datetime.strptime(filter_value, "%Y-%m-%d").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
+        return start, start + timedelta(days=1)
+    if filter_type == "week":
+        try:
+            year, week = map(int, filter_value.split('-'))
+            start = date.fromisocalendar(year, week, 1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid week format. Use YYYY-WW (e.g., 2023-01).")
+        return start, start + timedelta(days=7)
+    if filter_type == "month":
+        try:
+            start = datetime.strptime(filter_value, "%Y-%m").date()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM.")
+        return start, date(start.year + start.month // 12, start.month % 12 + 1, 1)
+    if filter_type == "year":
+        try:
+            start = date(int(filter_value), 1, 1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid year format. Use YYYY.")
+        return start, date(start.year + 1, 1, 1)
+    raise HTTPException(status_code=400, detail="Invalid filter_type. Must be date, month, week, or year.")
+
+class ListingFilters:
+    """
+    The filters of one listing request: SQL predicates on the model, and the same
+    tests as masks over a DataFrame of its columns. date_from and date_to bound the
+    dates that can pass, half-open, so archived months outside them are never read.
+    """
+
+    def __init__(self):
+        self.predicates: List[ColumnElement] = []
+        self.masks: List[Callable[[pd.DataFrame], pd.Series]] = []
+        self.date_from: Optional[date] = None
+        self.date_to: Optional[date] = None
+
+    def add(self, predicate: ColumnElement, mask: Callable[[pd.DataFrame], pd.Series]):
+        self.predicates.append(predicate)
+        self.masks.append(mask)
+
+    def between(self, model, start: Optional[date], end: Optional[date]):
+        """Keep dates in [start, end); either bound may be None."""
+        if start:
+            self.add(model.date >= start, lambda frame: frame["date"] >= start)
+            self.date_from = max(self.date_from or start, start)
+        if end:
+            self.add(model.date < end, lambda frame: frame["date"] < end)
+            self.date_to = min(self.date_to or end, end)
+
+    def apply(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """The rows of frame that pass every filter."""
+        for mask in self.masks:
+            if frame.empty:
+                break
+            frame = frame[mask(frame)]
+        return frame
+
+def _contains(column: str, text: str) -> Callable[[pd.DataFrame], pd.Series]:
+    return lambda frame: frame[column].str.contains(text, regex=False, na=False)
+
+def _icontains(column: str, text: str) -> Callable[[pd.DataFrame], pd.Series]:
+    return lambda frame: frame[column].str.lower().str.contains(text.lower(), regex=False, na=False)
+
+def _common_filters(model, matched_column: str, filter_type: Optional[str], filter_value: Optional[str],
+                    date_from: Optional[date], date_to: Optional[date], amount_min: Optional[float],
+                    amount_max: Optional[float], matched: Optional[bool]) -> ListingFilters:
+    filters = ListingFilters()
+    if filter_type and filter_value:
+        filters.between(model, *date_range(filter_type, filter_value))
+    filters.between(model, date_from, date_to + timedelta(days=1) if date_to else None)
+    if amount_min is not None:
+        cents_min = to_cents(amount_min)
+        filters.add(model.amount_cents >= cents_min, lambda frame: frame["amount_cents"] >= cents_min)
+    if amount_max is not None:
+        cents_max = to_cents(amount_max)
+        filters.add(model.amount_cents <= cents_max, lambda frame: frame["amount_cents"] <= cents_max)
+    if matched is not None:
+        column = getattr(model, matched_column)
+        filters.add(column.is_(True) if matched else column.isnot(True),
+                    lambda frame: (frame[matched_column] == True) == matched)
+    return filters
+
+def transaction_filters(
+    filter_type: Optional[str] = Query(None, description="Type of filter (date, month, week, year)"),
+    filter_value: Optional[str] = Query(None, description="Value for the filter"),
+    date_from: Optional[date] = Query(None, description="First day, inclusive"),
+    date_to: Optional[date] = Query(None, description="Last day, inclusive"),
+    amount_min: Optional[float] = Query(None),
+    amount_max: Optional[float] = Query(None),
+    matched: Optional[bool] = Query(None, description="Only matched (true) or unmatched (false) transactions"),
+    category: Optional[List[str]] = Query(None, description="Any of these categories"),
+    type: Optional[models.TransactionType] = Query(None),
+    q: Optional[str] = Query(None, description="Text the note contains"),
+) -> ListingFilters:
+    """The filters on models.Transaction given by the query parameters of a listing."""
+    model = models.Transaction
+    filters = _common_filters(model, "matched", filter_type, filter_value, date_from, date_to,
+                              amount_min, amount_max, matched)
+    if category:
+        filters.add(model.category.in_(category), lambda frame: frame["category"].isin(category))
+    if type:
+        filters.add(model.type == type, lambda frame: frame["type"] == type.value)
+    if q:
+        normalized = normalize_description(q)
+        if normalized:
+            filters.add(model.normalized_note.contains(normalized, autoescape=True), _contains("normalized_note", normalized))
+        else:
+            filters.add(model.note.icontains(q, autoescape=True), _icontains("note", q))
+    return filters
+
+def bank_transaction_filters(
+    filter_type: Optional[str] = Query(None, description="Type of filter (date, month, week, year)"),
+    filter_value: Optional[str] = Query(None, description="Value for the filter"),
+    date_from: Optional[date] = Query(None, description="First day, inclusive"),
+    date_to: Optional[date] = Query(None, description="Last day, inclusive"),
+    amount_min: Optional[float] = Query(None),
+    amount_max: Optional[float] = Query(None),
+    matched: Optional[bool] = Query(None, description="Only matched (true) or unmatched (false) transactions"),
+    bank_name: Optional[str] = Query(None),
+    account_number: Optional[str] = Query(None),
+    q: Optional[str] = Query(None, description="Text the description contains"),
+    current_user: models.User = Depends(auth.get_current_user_async),
+) -> ListingFilters:
+    """The filters on models.BankTransaction given by the query parameters of a listing."""
+    model = models.BankTransaction
+    filters = _common_filters(model, "is_matched", filter_type, filter_value, date_from, date_to,
+                              amount_min, amount_max, matched)
+    if bank_name:
+        filters.add(model.bank_name == bank_name, lambda frame: frame["bank_name"] == bank_name)
+    if account_number:
+        filters.add(model.account_number == account_number, lambda frame: frame["account_number"] == account_number)
+    if q:
+        _description_search(filters, current_user.id, q)
+    return filters
+
+def _description_search(filters: ListingFilters, owner_id: int, text: str):
+    normalized = normalize_description(text)
+    if not normalized:
+        # Only digits and punctuation, which normalization drops; matched on the raw description
+        filters.add(models.BankTransaction.description.icontains(text, autoescape=True), _icontains("description", text))
+        return
+    filters.add(models.BankTransaction.normalized_description.contains(normalized, autoescape=True),
+                _contains("normalized_description", normalized))
+    grams = substring_grams(normalized)
+    if grams:
+        # Rows holding every trigram of the text, from the gram index; the LIKE above then only
+        # rechecks those instead of every description of the user. Archived rows have no grams,
+        # and freshly imported ones none yet: those are rechecked as they are.
+        indexed = select(models.DescriptionGram.bank_transaction_id).filter(
+            models.DescriptionGram.owner_id == owner_id,
+            models.DescriptionGram.gram.in_(grams)
+        ).group_by(models.DescriptionGram.bank_transaction_id).having(func.count() == len(grams))
+        unindexed = select(models.BankTransaction.id).filter(
+            models.BankTransaction.owner_id == owner_id,
+            models.BankTransaction.gram_count.is_(None)
+        )
+        filters.predicates.append(models.BankTransaction.id.in_(union_all(indexed, unindexed)))
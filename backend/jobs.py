@@ -0,0 +1,282 @@
+import json
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import Session
+from . import models, database, matching, statements, reports
+from .config import settings
+from .schemas.bank_transaction import BankImportResult
+from .schemas.job import JobOut
+from .utils.bank_parser import cleanup_upload
+
+# Jobs are rows in the jobs table; this pool runs them in the API process
+_executor = ThreadPoolExecutor(max_workers=settings.JOB_WORKERS, thread_name_prefix="job")
+_handlers: Dict[str, Callable] = {}
+
+# Progress and cancel flags of the jobs running in this process. SQLite allows a single
+# writer, which a running handler already is, so there progress is only kept here and
+# written to the table when the job ends.
+_live: Dict[str, dict] = {}
+_live_lock = threading.Lock()
+_PERSIST_PROGRESS = database.engine.dialect.name != "sqlite"
+
+ACTIVE_STATUSES = (models.JobStatus.queued, models.JobStatus.running)
+
+class JobCancelled(Exception):
+    pass
+
+class JobLimitExceeded(Exception):
+    pass
+
+class JobContext:
+    """
+    Handed to job handlers to report progress.
+    Progress goes through its own short session so it is visible immediately and
+    never commits the handler's half-done work. Reporting progress is also where a
+    requested cancellation takes effect.
+    """
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+
+    def progress(self, done: int, total: Optional[int] = None):
+        with _live_lock:
+            state = _live[self.job_id]
+            state["progress"] = done
+            if total is not None:
+                state["total"] = total
+        if _PERSIST_PROGRESS:
+            db = database.SessionLocal()
+            try:
+                job = db.get(models.Job, self.job_id)
+                job.progress = done
+                if total is not None:
+                    job.total = total
+                db.commit()
+                if job.cancel_requested:
+                    state["cancel"] = True
+            finally:
+                db.close()
+        if state["cancel"]:
+            raise JobCancelled()
+
+def handler(kind: str):
+    """Register a function as the handler for a job kind."""
+    def register(func: Callable):
+        _handlers[kind] = func
+        return func
+    return register
+
+def submit(db: Session, owner_id: int, kind: str, payload: dict, capped: bool = True) -> models.Job:
+    """
+    Queue a job for the owner and hand it to the worker pool.
+    Raises JobLimitExceeded when the owner already has JOB_MAX_PER_USER jobs queued
+    or running, unless capped is False, for jobs the server queues itself.
+    """
+    # The cap is checked and the job inserted in one statement, so concurrent submissions
+    # cannot all pass it. On PostgreSQL they also queue on the owner's row; SQLite
+    # serializes the insert with its single writer.
+    db.execute(select(models.User.id).where(models.User.id == owner_id).with_for_update())
+    active = select(func.count(models.Job.id)).where(
+        models.Job.owner_id == owner_id,
+        models.Job.status.in_(ACTIVE_STATUSES)
+    ).scalar_subquery()
+    job_id = uuid.uuid4().hex
+    values = {
+        "id": job_id,
+        "kind": kind,
+        "status": models.JobStatus.queued,
+        "payload": json.dumps(payload),
+        "owner_id": owner_id,
+    }
+    row = select(*(literal(value, models.Job.__table__.c[name].type) for name, value in values.items()))
+    if capped:
+        row = row.where(active < settings.JOB_MAX_PER_USER)
+    queued = db.execute(insert(models.Job).from_select(list(values), row))
+    if not queued.rowcount:
+        db.rollback()
+        raise JobLimitExceeded(f"At most {settings.JOB_MAX_PER_USER} jobs can be queued or running at once")
+    db.commit()
+    job = db.get(models.Job, job_id)
+    _executor.submit(_run, job.id)
+    return job
+
+def queue_indexing(db: Session, owner_id: int) -> Optional[models.Job]:
+    """
+    Queue the indexing of the owner's freshly imported bank transactions
+    (statements.index_pending), unless a queued indexing job will already take
+    them. It does not count toward JOB_MAX_PER_USER.
+    """
+    queued = db.execute(select(models.Job.id).where(
+        models.Job.owner_id == owner_id,
+        models.Job.kind == "statement_index",
+        models.Job.status == models.JobStatus.queued
+    ).limit(1)).scalar()
+    if queued:
+        return None
+    return submit(db, owner_id, "statement_index", {}, capped=False)
+
+def find_active(db: Session, owner_id: int, kind: str, payload: dict) -> Optional[models.Job]:
+    """The owner's queued or running job of a kind with the same payload, if any."""
+    return db.execute(select(models.Job).where(
+        models.Job.owner_id == owner_id,
+        models.Job.kind == kind,
+        models.Job.payload == json.dumps(payload),
+        models.Job.status.in_(ACTIVE_STATUSES)
+    ).limit(1)).scalar()
+
+def cancel(db: Session, job: models.Job) -> models.Job:
+    """Cancel a queued job outright, or ask a running job to stop at its next progress report."""
+    if job.status == models.JobStatus.queued:
+        job.status = models.JobStatus.cancelled
+        job.finished_at = datetime.utcnow()
+        _cleanup(job)
+        db.commit()
+    elif job.status == models.JobStatus.running:
+        with _live_lock:
+            state = _live.get(job.id)
+            if state:
+                state["cancel"] = True
+        # A job running in this process on SQLite holds the write lock; the flag above is enough
+        if _PERSIST_PROGRESS or not state:
+            job.cancel_requested = True
+            db.commit()
+    db.refresh(job)
+    return job
+
+def describe(job: models.Job) -> JobOut:
+    """The stored job, with live progress when it is running in this process."""
+    job_out = JobOut.model_validate(job)
+    with _live_lock:
+        state = _live.get(job.id)
+        if state:
+            job_out.progress = state["progress"]
+            job_out.total = state["total"]
+            job_out.cancel_requested = job_out.cancel_requested or state["cancel"]
+    return job_out
+
+def resume_pending():
+    """
+    Re-queue jobs left over from a previous process.
+    Jobs that were running when it stopped are marked failed, and imported rows
+    an interrupted indexing job did not reach are queued for indexing again.
+    """
+    db = database.SessionLocal()
+    try:
+        interrupted = db.query(models.Job).filter(models.Job.status == models.JobStatus.running).all()
+        for job in interrupted:
+            job.status = models.JobStatus.failed
+            job.error = "Interrupted by a server restart"
+            job.finished_at = datetime.utcnow()
+            _cleanup(job)
+        queued = [job.id for job in db.query(models.Job).filter(models.Job.status == models.JobStatus.queued).all()]
+        db.commit()
+    finally:
+        db.close()
+    for job_id in queued:
+        _executor.submit(_run, job_id)
+
+    db = database.SessionLocal()
+    try:
+        unindexed = db.execute(select(models.BankTransaction.owner_id).where(
+            models.BankTransaction.gram_count.is_(None)
+        ).distinct()).scalars().all()
+        for owner_id in unindexed:
+            queue_indexing(db, owner_id)
+    finally:
+        db.close()
+
+def _finish(job_id: str, status: models.JobStatus, result: Optional[dict] = None, error: Optional[str] = None):
+    db = database.SessionLocal()
+    try:
+        job = db.get(models.Job, job_id)
+        with _live_lock:
+            state = _live.pop(job_id, None)
+        if state:
+            job.progress = state["progress"]
+            job.total = state["total"]
+        job.status = status
+        job.result = json.dumps(result) if result is not None else None
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        if status == models.JobStatus.succeeded and job.total:
+            job.progress = job.total
+        _cleanup(job)
+        db.commit()
+    finally:
+        db.close()
+
+def _cleanup(job: models.Job):
+    # Uploaded files are owned by the job until it ends
+    payload = json.loads(job.payload or "{}")
+    if payload.get("file_path"):
+        cleanup_upload(payload["file_path"])
+
+def _run(job_id: str):
+    db = database.SessionLocal()
+    try:
+        # Claim the job; it may have been cancelled while it was queued
+        claimed = db.query(models.Job).filter(
+            models.Job.id == job_id,
+            models.Job.status == models.JobStatus.queued
+        ).update({"status": models.JobStatus.running, "started_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return
+
+        with _live_lock:
+            _live[job_id] = {"progress": 0, "total": None, "cancel": False}
+        job = db.get(models.Job, job_id)
+        result = _handlers[job.kind](db, job.owner_id, json.loads(job.payload), JobContext(job_id))
+    except JobCancelled:
+        db.rollback()
+        _finish(job_id, models.JobStatus.cancelled)
+    except Exception as e:
+        db.rollback()
+        _finish(job_id, models.JobStatus.failed, error=str(e))
+    else:
+        _finish(job_id, models.JobStatus.succeeded, result=result)
+    finally:
+        db.close()
+
+@handler("match")
+def _match(db: Session, owner_id: int, payload: dict, context: JobContext) -> dict:
+    match_records = matching.run_matching(
+        db,
+        owner_id,
+        time_window_days=payload["time_window_days"],
+        amount_tolerance=payload["amount_tolerance"],
+        progress=context.progress,
+        backend=payload.get("backend"),
+        strategy=payload.get("strategy", "greedy")
+    )
+    return {"match_ids": [match_record.id for match_record in match_records]}
+
+@handler("bank_import")
+def _bank_import(db: Session, owner_id: int, payload: dict, context: JobContext) -> dict:
+    bank_transaction_ids, duplicates, read_with = statements.import_statement(
+        db,
+        owner_id,
+        payload["file_path"],
+        payload["bank_name"],
+        payload["account_number"],
+        progress=context.progress,
+        date_format=payload.get("date_format"),
+        decimal=payload.get("decimal_separator")
+    )
+    if bank_transaction_ids:
+        queue_indexing(db, owner_id)
+    result = BankImportResult(inserted=len(bank_transaction_ids), duplicates=duplicates, **statements.profile_result(read_with))
+    return {"bank_transaction_ids": bank_transaction_ids, **result.model_dump()}
+
+@handler("statement_index")
+def _statement_index(db: Session, owner_id: int, payload: dict, context: JobContext) -> dict:
+    return {"indexed": statements.index_pending(db, owner_id, progress=context.progress)}
+
+@handler("unmatched_report")
+def _unmatched_report(db: Session, owner_id: int, payload: dict, context: JobContext) -> dict:
+    fmt = payload.get("format", "xlsx")
+    filepath, filename = reports.build_unmatched_report(db, owner_id, fmt)
+    return {"path": filepath, "filename": filename, "media_type": reports.MEDIA_TYPES[fmt]}
@@ -4,13 +4,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from typing import List
-from .routers import auth, transactions, bank_transactions, matching
-from . import models, database
+from .routers import auth, transactions, bank_transactions, matching, bank_matcher, jobs as jobs_router
+from . import models, database, jobs
+from .pagination import NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER
 from .auth import create_access_token, authenticate_user, get_password_hash, get_current_user, verify_password
 
-# Create database tables
-models.Base.metadata.create_all(bind=database.engine)
-
 app = FastAPI(title="HomeBudget Guard API")
 
 # Configure CORS
@@ -20,21 +18,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_COUNT_HEADER],
 )
 
-# Dependency
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 # Include routers
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(transactions.router, prefix="/api/transactions", tags=["transactions"])
 app.include_router(bank_transactions.router, prefix="/api/bank-transactions", tags=["bank-transactions"])
 app.include_router(matching.router, prefix="/api/matching", tags=["matching"])
+app.include_router(bank_matcher.router, prefix="/api/bank-matcher", tags=["bank-matcher"])
+app.include_router(jobs_router.router, prefix="/api/jobs", tags=["jobs"])
+
+@app.on_event("startup")
+def resume_jobs():
+    # Pick up jobs queued before the last shutdown
+    jobs.resume_pending()
+
+@app.get("/health/database")
+def read_database_health():
+    # Pool status and checkout counters per engine, to spot pool exhaustion and dropped connections
+    return database.pool_stats()
 
 @app.get("/")
 def read_root():
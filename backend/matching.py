@@ -1,7 +1,13 @@
-from datetime import datetime, timedelta
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, deque
+from datetime import date, timedelta
+from sqlalchemy import and_, func, exists, select, update, delete
 from sqlalchemy.orm import Session
-from . import models
-from typing import List, Tuple
+from . import models, candidates, reports, rollups, sql_matching
+from .config import settings
+from .utils.matching import DATE_WINDOW_DAYS, assign_matches
+from .utils.sql import date_shift, days_between
+from typing import List, Tuple, Optional, Callable, Dict
 
 def find_potential_matches(db: Session, transaction: models.Transaction, time_window_days: int = 1, amount_tolerance: float = 0.01) -> List[models.BankTransaction]:
     """
@@ -11,7 +17,7 @@ def find_potential_matches(db: Session, transaction: models.Transaction, time_wi
         db: Database session
         transaction: The transaction to find matches for
         time_window_days: Number of days to look before and after the transaction date
-        amount_tolerance: Tolerance for amount matching (e.01 means 1% difference allowed)
+        amount_tolerance: Tolerance for amount matching (0.01 means 1% difference allowed)
     
     Returns:
         List of potential matching bank transactions
@@ -20,36 +26,297 @@ def find_potential_matches(db: Session, transaction: models.Transaction, time_wi
     start_date = transaction.date - timedelta(days=time_window_days)
     end_date = transaction.date + timedelta(days=time_window_days)
     
-    # Calculate amount range
-    min_amount = transaction.amount * (1 - amount_tolerance)
-    max_amount = transaction.amount * (1 + amount_tolerance)
+    # Calculate amount range in cents (relative to the size of the amount, so debits work too)
+    tolerance = abs(transaction.amount_cents) * amount_tolerance
+    min_amount = transaction.amount_cents - tolerance
+    max_amount = transaction.amount_cents + tolerance
     
     # Query for potential matches
     potential_matches = db.query(models.BankTransaction).filter(
         models.BankTransaction.date.between(start_date, end_date),
-        models.BankTransaction.amount.between(min_amount, max_amount),
+        models.BankTransaction.amount_cents.between(min_amount, max_amount),
         models.BankTransaction.is_matched == False,
         models.BankTransaction.owner_id == transaction.owner_id
     ).all()
     
     return potential_matches
 
-def find_matches(transactions: List[models.Transaction], bank_transactions: List[models.BankTransaction]) -> List[Tuple[models.Transaction, models.BankTransaction]]:
+def find_potential_matches_batch(db: Session, owner_id: int, transaction_ids: Optional[List[int]] = None,
+                                 date_from: Optional[date] = None, date_to: Optional[date] = None,
+                                 time_window_days: int = 1, amount_tolerance: float = 0.01,
+                                 limit: Optional[int] = None) -> Dict[int, List[models.BankTransaction]]:
+    """
+    Find potential bank transaction matches for many transactions with one range join.
+    
+    Args:
+        db: Database session
+        owner_id: ID of the owner
+        transaction_ids: Transactions to find matches for
+        date_from: Only transactions on or after this date
+        date_to: Only transactions on or before this date
+        time_window_days: Number of days to look before and after each transaction date
+        amount_tolerance: Tolerance for amount matching (0.01 means 1% difference allowed)
+        limit: Maximum number of matches per transaction
+    
+    Returns:
+        Potential matches per transaction id, closest date first, then closest amount
+    """
+    T = models.Transaction
+    B = models.BankTransaction
+    day_diff = func.abs(days_between(B.date, T.date))
+    amount_diff = func.abs(B.amount_cents - T.amount_cents)
+    tolerance = func.abs(T.amount_cents) * amount_tolerance
+    
+    pairs = db.query(
+        T.id.label("transaction_id"),
+        B.id.label("bank_transaction_id"),
+        func.row_number().over(partition_by=T.id, order_by=(day_diff, amount_diff, B.id)).label("rank")
+    ).join(B, and_(
+        B.owner_id == T.owner_id,
+        B.date.between(date_shift(T.date, -time_window_days), date_shift(T.date, time_window_days)),
+        B.amount_cents.between(T.amount_cents - tolerance, T.amount_cents + tolerance),
+        B.is_matched == False
+    )).filter(T.owner_id == owner_id)
+    if transaction_ids is not None:
+        pairs = pairs.filter(T.id.in_(transaction_ids))
+    if date_from is not None:
+        pairs = pairs.filter(T.date >= date_from)
+    if date_to is not None:
+        pairs = pairs.filter(T.date <= date_to)
+    pairs = pairs.subquery()
+    
+    query = db.query(pairs.c.transaction_id, B).join(B, B.id == pairs.c.bank_transaction_id)
+    if limit is not None:
+        query = query.filter(pairs.c.rank <= limit)
+    rows = query.order_by(pairs.c.transaction_id, pairs.c.rank).all()
+    
+    grouped = defaultdict(list)
+    for transaction_id, bank_transaction in rows:
+        grouped[transaction_id].append(bank_transaction)
+    return dict(grouped)
+
+def find_matches(transactions: List[models.Transaction], bank_transactions: List[models.BankTransaction], time_window_days: int = 0, amount_tolerance: float = 0.0) -> List[Tuple[models.Transaction, models.BankTransaction]]:
     """
     Find matches between transactions and bank transactions based on date and amount.
     This function operates on already fetched lists of transactions.
+
+    Bank transactions are indexed once, so each transaction is looked up instead of
+    being compared against every bank transaction. A bank transaction is handed to
+    at most one transaction per call.
+
+    Args:
+        transactions: Unmatched transactions, in the order they should be served
+        bank_transactions: Unmatched bank transactions, in order of preference
+        time_window_days: Number of days to look before and after the transaction date
+        amount_tolerance: Tolerance for amount matching (0.01 means 1% difference allowed)
+
+    Returns:
+        List of (transaction, bank transaction) pairs, in transaction order
     """
+    if time_window_days == 0 and amount_tolerance == 0:
+        return _find_exact_matches(transactions, bank_transactions)
+    return _find_tolerance_matches(transactions, bank_transactions, time_window_days, amount_tolerance)
+
+def _find_exact_matches(transactions: List[models.Transaction], bank_transactions: List[models.BankTransaction]) -> List[Tuple[models.Transaction, models.BankTransaction]]:
+    # Bank transactions sharing a (date, cents) key are served in input order
+    index = defaultdict(deque)
+    for bank_transaction in bank_transactions:
+        index[(bank_transaction.date, bank_transaction.amount_cents)].append(bank_transaction)
+
     matches = []
     for transaction in transactions:
-        for bank_transaction in bank_transactions:
-            # Match if date and amount are exactly the same
-            if (transaction.date == bank_transaction.date and 
-                transaction.amount == bank_transaction.amount):
-                matches.append((transaction, bank_transaction))
-                break  # Move to next transaction once we find a match
-    
+        candidates = index.get((transaction.date, transaction.amount_cents))
+        if candidates:
+            matches.append((transaction, candidates.popleft()))
+
     return matches
 
+def _find_tolerance_matches(transactions: List[models.Transaction], bank_transactions: List[models.BankTransaction], time_window_days: int, amount_tolerance: float) -> List[Tuple[models.Transaction, models.BankTransaction]]:
+    # Index bank transactions by date, with amounts in cents sorted for range lookups
+    by_date = defaultdict(list)
+    for position, bank_transaction in enumerate(bank_transactions):
+        by_date[bank_transaction.date].append((bank_transaction.amount_cents, position))
+    index = {}
+    for day, rows in by_date.items():
+        rows.sort()
+        index[day] = ([amount for amount, _ in rows], [position for _, position in rows])
+
+    # Collect every pair inside the window, keyed by how close it is
+    candidates = []
+    for transaction_position, transaction in enumerate(transactions):
+        cents = transaction.amount_cents
+        tolerance = abs(cents) * amount_tolerance
+        for offset in range(-time_window_days, time_window_days + 1):
+            bucket = index.get(transaction.date + timedelta(days=offset))
+            if not bucket:
+                continue
+            amounts, positions = bucket
+            # Integer amounts: the bisection bounds are exact
+            low = bisect_left(amounts, cents - tolerance)
+            high = bisect_right(amounts, cents + tolerance)
+            for i in range(low, high):
+                candidates.append((abs(offset), abs(amounts[i] - cents), transaction_position, positions[i]))
+
+    # Closest pairs win; each side is used at most once
+    candidates.sort()
+    used_transactions = set()
+    used_bank_transactions = set()
+    pairs = []
+    for _, _, transaction_position, bank_position in candidates:
+        if transaction_position in used_transactions or bank_position in used_bank_transactions:
+            continue
+        used_transactions.add(transaction_position)
+        used_bank_transactions.add(bank_position)
+        pairs.append((transaction_position, bank_position))
+
+    pairs.sort()
+    return [(transactions[t], bank_transactions[b]) for t, b in pairs]
+
+def load_unmatched(db: Session, owner_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None,
+                   scoring: bool = False):
+    """
+    Load the id, date and amount_cents of the owner's unmatched transactions and bank
+    transactions, ordered by id. Rows with a pending Match record are left out.
+    date_from and date_to (inclusive) restrict both sides. With scoring, the rows also
+    carry the text and match flags utils.matching scores pairs on.
+    
+    Returns:
+        Tuple of (transaction rows, bank transaction rows)
+    """
+    transaction_columns = [models.Transaction.id, models.Transaction.date, models.Transaction.amount_cents]
+    bank_columns = [models.BankTransaction.id, models.BankTransaction.date, models.BankTransaction.amount_cents]
+    if scoring:
+        transaction_columns += [models.Transaction.note, models.Transaction.normalized_note,
+                                models.Transaction.category, models.Transaction.matched]
+        bank_columns += [models.BankTransaction.description, models.BankTransaction.normalized_description,
+                         models.BankTransaction.is_matched]
+    transaction_query = db.query(*transaction_columns).filter(
+        models.Transaction.owner_id == owner_id,
+        models.Transaction.bank_transaction_id == None,
+        ~exists().where(models.Match.transaction_id == models.Transaction.id)
+    )
+    bank_query = db.query(*bank_columns).filter(
+        models.BankTransaction.owner_id == owner_id,
+        models.BankTransaction.transaction_id == None,
+        ~exists().where(models.Match.bank_transaction_id == models.BankTransaction.id)
+    )
+    if date_from is not None:
+        transaction_query = transaction_query.filter(models.Transaction.date >= date_from)
+        bank_query = bank_query.filter(models.BankTransaction.date >= date_from)
+    if date_to is not None:
+        transaction_query = transaction_query.filter(models.Transaction.date <= date_to)
+        bank_query = bank_query.filter(models.BankTransaction.date <= date_to)
+    
+    transactions = transaction_query.order_by(models.Transaction.id).all()
+    bank_transactions = bank_query.order_by(models.BankTransaction.id).all()
+    return transactions, bank_transactions
+
+def match_score(day_diff: int, amount_diff_cents: int) -> float:
+    """
+    Confidence of a matched pair between 0 and 1, from the amount and date factors
+    of utils.matching.calculate_similarity_score.
+    """
+    amount_factor = 1.0 if amount_diff_cents == 0 else 0.0
+    date_factor = 1.0 - day_diff / float(DATE_WINDOW_DAYS) if day_diff <= DATE_WINDOW_DAYS else 0.0
+    return (amount_factor + date_factor) / 2
+
+def match_rows(matches, owner_id: int) -> List[dict]:
+    """Column values of the Match records for (transaction, bank transaction) pairs."""
+    return [
+        {
+            "transaction_id": transaction.id,
+            "bank_transaction_id": bank_transaction.id,
+            "match_date": bank_transaction.date,
+            "match_amount_cents": bank_transaction.amount_cents,
+            "score": match_score(abs((bank_transaction.date - transaction.date).days),
+                                 abs(bank_transaction.amount_cents - transaction.amount_cents)),
+            "owner_id": owner_id,
+        }
+        for transaction, bank_transaction in matches
+    ]
+
+def run_matching(db: Session, owner_id: int, time_window_days: int = 0, amount_tolerance: float = 0.0,
+                 progress: Optional[Callable[[int, int], None]] = None, backend: Optional[str] = None,
+                 strategy: str = "greedy") -> List[models.Match]:
+    """
+    Match the owner's unmatched transactions against their unmatched bank transactions
+    and store the pairs as Match records.
+    
+    Args:
+        db: Database session
+        owner_id: ID of the owner
+        time_window_days: Number of days to look before and after the transaction date
+        amount_tolerance: Tolerance for amount matching (0.01 means 1% difference allowed)
+        progress: Called as progress(done, total) as the run moves through its steps
+        backend: "python" to match in this process, "sql" to match inside the database
+            (default: settings.MATCHING_BACKEND)
+        strategy: "greedy" pairs the closest date and amount first; "optimal" pairs
+            one-to-one for the highest total similarity score (amount, date and
+            description), keeping pairs that score at least CANDIDATE_MIN_SCORE. The
+            optimal assignment always runs in this process.
+    
+    Returns:
+        The created Match records
+    """
+    if strategy not in ("greedy", "optimal"):
+        raise ValueError(f"Unknown matching strategy: {strategy}")
+    backend = "python" if strategy == "optimal" else backend or settings.MATCHING_BACKEND
+    if backend == "sql":
+        if progress:
+            progress(1, 2)
+        match_ids = sql_matching.insert_matches(
+            db,
+            owner_id,
+            time_window_days=time_window_days,
+            amount_tolerance=amount_tolerance
+        )
+        if progress:
+            progress(2, 2)
+        db.commit()
+        match_records = []
+        for start in range(0, len(match_ids), 500):
+            match_records.extend(db.query(models.Match).filter(models.Match.id.in_(match_ids[start:start + 500])).all())
+        return sorted(match_records, key=lambda match_record: match_record.id)
+    if backend != "python":
+        raise ValueError(f"Unknown matching backend: {backend}")
+    
+    transactions, bank_transactions = load_unmatched(db, owner_id, scoring=strategy == "optimal")
+    if progress:
+        progress(1, 2)
+    
+    # Find matches
+    if strategy == "optimal":
+        assigned = assign_matches(
+            transactions,
+            bank_transactions,
+            min_confidence=candidates.CANDIDATE_MIN_SCORE,
+            time_window_days=time_window_days,
+            amount_tolerance=amount_tolerance
+        )
+        rows = match_rows([(transaction, bank_transaction) for transaction, bank_transaction, _ in assigned], owner_id)
+        # The score is the one the assignment maximised
+        for row, (_, _, score) in zip(rows, assigned):
+            row["score"] = score
+    else:
+        matches = find_matches(
+            transactions,
+            bank_transactions,
+            time_window_days=time_window_days,
+            amount_tolerance=amount_tolerance
+        )
+        rows = match_rows(matches, owner_id)
+    if progress:
+        progress(2, 2)
+    
+    # Create match records
+    match_records = [models.Match(**row) for row in rows]
+    db.add_all(match_records)
+    db.commit()
+    for match_record in match_records:
+        db.refresh(match_record)
+    
+    return match_records
+
 def create_match(db: Session, transaction_id: int, bank_transaction_id: int, owner_id: int) -> Tuple[models.Transaction, models.BankTransaction]:
     """
     Create a match between a transaction and a bank transaction.
@@ -78,15 +345,150 @@ def create_match(db: Session, transaction_id: int, bank_transaction_id: int, own
         raise ValueError("Transaction or bank transaction not found")
     
     # Update the records
+    before = rollups.snapshot(transaction)
     transaction.matched = True
     transaction.bank_transaction_id = bank_transaction_id
     
     bank_transaction.is_matched = True
     bank_transaction.transaction_id = transaction_id
+    rollups.track(db, owner_id, removed=[before], added=[rollups.snapshot(transaction)])
+    reports.invalidate(db, owner_id)
+    
+    # Neither side is a candidate for anything else any more
+    candidates.remove_matched(db, transaction_id, bank_transaction_id)
     
     # Save changes
     db.commit()
     db.refresh(transaction)
     db.refresh(bank_transaction)
     
-    return transaction, bank_transaction 
\ No newline at end of file
+    return transaction, bank_transaction
+
+def _select_matches(db: Session, owner_id: int, match_ids: Optional[List[int]], min_score: Optional[float]):
+    """
+    The owner's Match records picked by id and/or minimum score, with the current
+    match state of both sides, best score first.
+    """
+    query = db.query(
+        models.Match.id,
+        models.Match.transaction_id,
+        models.Match.bank_transaction_id,
+        models.Match.score,
+        models.Transaction.bank_transaction_id.label("linked_bank_transaction_id"),
+        models.BankTransaction.transaction_id.label("linked_transaction_id")
+    ).join(
+        models.Transaction, models.Transaction.id == models.Match.transaction_id
+    ).join(
+        models.BankTransaction, models.BankTransaction.id == models.Match.bank_transaction_id
+    ).filter(models.Match.owner_id == owner_id)
+    if min_score is not None:
+        query = query.filter(models.Match.score >= min_score)
+    
+    if match_ids is None:
+        rows = query.all()
+    else:
+        # Chunked to stay under the bound-parameter limit
+        rows = []
+        for start in range(0, len(match_ids), 500):
+            rows.extend(query.filter(models.Match.id.in_(match_ids[start:start + 500])).all())
+    rows.sort(key=lambda row: (-(row.score or 0.0), row.id))
+    return rows
+
+def confirm_matches(db: Session, owner_id: int, match_ids: Optional[List[int]] = None,
+                    min_score: Optional[float] = None) -> Tuple[List[int], List[Tuple[int, str]]]:
+    """
+    Confirm many Match records in one transaction.
+    
+    Both sides of every accepted match are linked with set-based UPDATE ... FROM
+    statements, their candidates are dropped and the Match records deleted. A match
+    whose transaction or bank transaction is already matched, or is taken by a better
+    match of the same batch, is reported as a conflict and left alone.
+    
+    Args:
+        db: Database session
+        owner_id: ID of the owner
+        match_ids: Match records to confirm
+        min_score: Only confirm matches scoring at least this much
+    
+    Returns:
+        Tuple of (confirmed match ids, (match id, reason) conflicts)
+    """
+    rows = _select_matches(db, owner_id, match_ids, min_score)
+    
+    conflicts = []
+    if match_ids is not None:
+        found = {row.id for row in rows}
+        conflicts.extend((match_id, "Match not found") for match_id in dict.fromkeys(match_ids) if match_id not in found)
+    
+    accepted = []
+    claimed_transactions = {}
+    claimed_bank_transactions = {}
+    for match_id, transaction_id, bank_transaction_id, _, linked_bank_transaction_id, linked_transaction_id in rows:
+        if linked_bank_transaction_id is not None:
+            conflicts.append((match_id, f"Transaction {transaction_id} is already matched"))
+        elif linked_transaction_id is not None:
+            conflicts.append((match_id, f"Bank transaction {bank_transaction_id} is already matched"))
+        elif transaction_id in claimed_transactions:
+            conflicts.append((match_id, f"Transaction {transaction_id} is confirmed by match {claimed_transactions[transaction_id]}"))
+        elif bank_transaction_id in claimed_bank_transactions:
+            conflicts.append((match_id, f"Bank transaction {bank_transaction_id} is confirmed by match {claimed_bank_transactions[bank_transaction_id]}"))
+        else:
+            claimed_transactions[transaction_id] = match_id
+            claimed_bank_transactions[bank_transaction_id] = match_id
+            accepted.append(match_id)
+    
+    for start in range(0, len(accepted), 500):
+        chunk = accepted[start:start + 500]
+        before = rollups.snapshots_of(db, [
+            transaction_id for transaction_id, in db.execute(select(models.Match.transaction_id).where(models.Match.id.in_(chunk)))
+        ])
+        rollups.track(db, owner_id, removed=before, added=[(key._replace(matched=True), amount) for key, amount in before])
+        db.execute(
+            update(models.Transaction).where(
+                models.Transaction.id == models.Match.transaction_id,
+                models.Match.id.in_(chunk)
+            ).values(bank_transaction_id=models.Match.bank_transaction_id, matched=True).execution_options(synchronize_session=False)
+        )
+        db.execute(
+            update(models.BankTransaction).where(
+                models.BankTransaction.id == models.Match.bank_transaction_id,
+                models.Match.id.in_(chunk)
+            ).values(transaction_id=models.Match.transaction_id, is_matched=True).execution_options(synchronize_session=False)
+        )
+        # Neither side is a candidate for anything else any more. One delete per side, so each
+        # is a lookup on that side's index; an OR of the two makes PostgreSQL scan the table.
+        for column, matched in ((models.MatchCandidate.transaction_id, models.Match.transaction_id),
+                                (models.MatchCandidate.bank_transaction_id, models.Match.bank_transaction_id)):
+            db.execute(
+                delete(models.MatchCandidate).where(
+                    column.in_(select(matched).where(models.Match.id.in_(chunk)))
+                ).execution_options(synchronize_session=False)
+            )
+        db.execute(delete(models.Match).where(models.Match.id.in_(chunk)).execution_options(synchronize_session=False))
+    if accepted:
+        reports.invalidate(db, owner_id)
+    db.commit()
+    
+    return accepted, conflicts
+
+def reject_matches(db: Session, owner_id: int, match_ids: Optional[List[int]] = None,
+                   min_score: Optional[float] = None) -> Tuple[List[int], List[Tuple[int, str]]]:
+    """
+    Delete many Match records in one transaction.
+    
+    Returns:
+        Tuple of (rejected match ids, (match id, reason) conflicts)
+    """
+    rows = _select_matches(db, owner_id, match_ids, min_score)
+    rejected = [row.id for row in rows]
+    
+    conflicts = []
+    if match_ids is not None:
+        found = set(rejected)
+        conflicts.extend((match_id, "Match not found") for match_id in dict.fromkeys(match_ids) if match_id not in found)
+    
+    for start in range(0, len(rejected), 500):
+        db.execute(delete(models.Match).where(models.Match.id.in_(rejected[start:start + 500])).execution_options(synchronize_session=False))
+    db.commit()
+    
+    return rejected, conflicts
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""initial schema
+
+The schema of the first release, as Base.metadata.create_all built it on
+startup: users, transactions, bank transactions and matches. A database created
+that way is brought under Alembic with `alembic stamp 0001`; 0002 then adds
+everything later versions built on startup.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 01:32:53.512359
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+transaction_type = sa.Enum('income', 'expense', name='transactiontype')
+
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('hashed_password', sa.String(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.create_index('ix_users_username', 'users', ['username'], unique=True)
+
+    # transactions and bank_transactions reference each other; the key from
+    # transactions is added once both tables exist
+    op.create_table('transactions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('type', transaction_type, nullable=False),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.Column('matched', sa.Boolean(), nullable=True),
+    sa.Column('bank_transaction_id', sa.Integer(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_transactions_id', 'transactions', ['id'], unique=False)
+
+    op.create_table('bank_transactions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('description', sa.String(), nullable=False),
+    sa.Column('bank_name', sa.String(), nullable=False),
+    sa.Column('account_number', sa.String(), nullable=False),
+    sa.Column('is_matched', sa.Boolean(), nullable=True),
+    sa.Column('transaction_id', sa.Integer(), nullable=True),
+    sa.Column('owner_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_bank_transactions_id', 'bank_transactions', ['id'], unique=False)
+
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.create_foreign_key(
+            'transactions_bank_transaction_id_fkey', 'bank_transactions', ['bank_transaction_id'], ['id']
+        )
+
+    op.create_table('matches',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('transaction_id', sa.Integer(), nullable=False),
+    sa.Column('bank_transaction_id', sa.Integer(), nullable=False),
+    sa.Column('match_date', sa.Date(), nullable=False),
+    sa.Column('match_amount', sa.Float(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['bank_transaction_id'], ['bank_transactions.id'], ),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_matches_id', 'matches', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_table('matches')
+    with op.batch_alter_table('transactions', schema=None) as batch_op:
+        batch_op.drop_constraint('transactions_bank_transaction_id_fkey', type_='foreignkey')
+    op.drop_table('bank_transactions')
+    op.drop_table('transactions')
+    op.drop_table('users')
+    transaction_type.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,255 @@
+"""series schema
+
+What later versions added to the schema while they still built it on startup:
+bank transaction fingerprints, normalized descriptions and notes, the
+description index, match scores, match candidates and background jobs, with
+their indexes.
+
+A database stamped 0001 may have been created by any of those versions, so
+only what it lacks is created. Its rows are then brought up to date one owner
+at a time, as the application writes them: normalized text, grams and
+fingerprints of every row, and the candidates of every unmatched pair.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 23:51:12.604318
+
+"""
+from collections import defaultdict, namedtuple
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from backend.candidates import candidate_rows
+from backend.utils.descriptions import normalize_description, description_grams
+from backend.utils.fingerprint import bank_fingerprint
+from backend.utils.money import to_cents
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+job_status = sa.Enum('queued', 'running', 'succeeded', 'failed', 'cancelled', name='jobstatus')
+
+# Rows updated or inserted per statement by the backfill
+BATCH_SIZE = 5000
+
+# (table, column) added to the tables of the first release; all nullable
+ADDED_COLUMNS = [
+    ('transactions', sa.Column('normalized_note', sa.Text(), nullable=True)),
+    ('bank_transactions', sa.Column('normalized_description', sa.String(), nullable=True)),
+    ('bank_transactions', sa.Column('gram_count', sa.Integer(), nullable=True)),
+    ('bank_transactions', sa.Column('fingerprint', sa.String(length=40), nullable=True)),
+    ('matches', sa.Column('score', sa.Float(), nullable=True)),
+]
+
+# (name, table, columns)
+ADDED_INDEXES = [
+    ('ix_transactions_owner_date', 'transactions', ['owner_id', 'date']),
+    ('ix_bank_transactions_owner_date', 'bank_transactions', ['owner_id', 'date']),
+    ('ix_matches_bank_transaction_id', 'matches', ['bank_transaction_id']),
+    ('ix_matches_score', 'matches', ['score']),
+    ('ix_matches_transaction_id', 'matches', ['transaction_id']),
+    ('ix_match_candidates_bank_transaction_id', 'match_candidates', ['bank_transaction_id']),
+    ('ix_match_candidates_id', 'match_candidates', ['id']),
+    ('ix_match_candidates_owner_id', 'match_candidates', ['owner_id']),
+    ('ix_match_candidates_transaction_id', 'match_candidates', ['transaction_id']),
+    ('ix_description_grams_bank_transaction_id', 'description_grams', ['bank_transaction_id']),
+    ('ix_description_grams_id', 'description_grams', ['id']),
+    ('ix_description_grams_owner_gram', 'description_grams', ['owner_id', 'gram']),
+    ('ix_jobs_id', 'jobs', ['id']),
+    ('ix_jobs_owner_id', 'jobs', ['owner_id']),
+]
+
+FINGERPRINT_CONSTRAINT = 'uq_bank_transactions_owner_fingerprint'
+
+# The columns candidate scoring reads, as the backfill has them
+_Transaction = namedtuple('_Transaction', 'id date amount_cents note normalized_note category')
+_BankTransaction = namedtuple('_BankTransaction', 'id date amount_cents description normalized_description')
+
+transactions = sa.table('transactions',
+    sa.column('id', sa.Integer()), sa.column('date', sa.Date()), sa.column('amount', sa.Float()),
+    sa.column('category', sa.String()), sa.column('note', sa.Text()), sa.column('normalized_note', sa.Text()),
+    sa.column('matched', sa.Boolean()), sa.column('bank_transaction_id', sa.Integer()), sa.column('owner_id', sa.Integer()),
+)
+bank_transactions = sa.table('bank_transactions',
+    sa.column('id', sa.Integer()), sa.column('date', sa.Date()), sa.column('amount', sa.Float()),
+    sa.column('description', sa.String()), sa.column('normalized_description', sa.String()),
+    sa.column('gram_count', sa.Integer()), sa.column('fingerprint', sa.String()),
+    sa.column('account_number', sa.String()), sa.column('is_matched', sa.Boolean()),
+    sa.column('transaction_id', sa.Integer()), sa.column('owner_id', sa.Integer()),
+)
+match_candidates = sa.table('match_candidates',
+    sa.column('transaction_id', sa.Integer()), sa.column('bank_transaction_id', sa.Integer()),
+    sa.column('score', sa.Float()), sa.column('owner_id', sa.Integer()),
+)
+grams_table = sa.table('description_grams',
+    sa.column('owner_id', sa.Integer()), sa.column('gram', sa.String()), sa.column('bank_transaction_id', sa.Integer()),
+)
+
+
+def _create_tables(existing: set) -> None:
+    if 'match_candidates' not in existing:
+        op.create_table('match_candidates',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('transaction_id', sa.Integer(), nullable=False),
+        sa.Column('bank_transaction_id', sa.Integer(), nullable=False),
+        sa.Column('score', sa.Float(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['bank_transaction_id'], ['bank_transactions.id'], ),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['transaction_id'], ['transactions.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('transaction_id', 'bank_transaction_id')
+        )
+
+    if 'description_grams' not in existing:
+        op.create_table('description_grams',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.Column('gram', sa.String(), nullable=False),
+        sa.Column('bank_transaction_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['bank_transaction_id'], ['bank_transactions.id'], ),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'jobs' not in existing:
+        op.create_table('jobs',
+        sa.Column('id', sa.String(), nullable=False),
+        sa.Column('kind', sa.String(), nullable=False),
+        sa.Column('status', job_status, nullable=False),
+        sa.Column('progress', sa.Integer(), nullable=True),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=True),
+        sa.Column('result', sa.Text(), nullable=True),
+        sa.Column('error', sa.Text(), nullable=True),
+        sa.Column('cancel_requested', sa.Boolean(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('started_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.Column('owner_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+
+
+def _has_fingerprint_constraint(inspector) -> bool:
+    # SQLite reports a constraint created inline without its name, so it is found by its columns
+    constraints = inspector.get_unique_constraints('bank_transactions') + [
+        index for index in inspector.get_indexes('bank_transactions') if index['unique']
+    ]
+    return any(constraint['column_names'] == ['owner_id', 'fingerprint'] for constraint in constraints)
+
+
+def _update_by_id(bind, table, values: list) -> None:
+    """Executemany UPDATE of table rows by id; each dict holds row_id and the new column values."""
+    if not values:
+        return
+    columns = [name for name in values[0] if name != 'row_id']
+    statement = table.update().where(table.c.id == sa.bindparam('row_id')).values(
+        {name: sa.bindparam(name) for name in columns}
+    )
+    for start in range(0, len(values), BATCH_SIZE):
+        bind.execute(statement, values[start:start + BATCH_SIZE])
+
+
+def _insert(bind, table, rows: list) -> None:
+    for start in range(0, len(rows), BATCH_SIZE):
+        bind.execute(table.insert(), rows[start:start + BATCH_SIZE])
+
+
+def _backfill_notes(bind) -> None:
+    notes = [
+        {'row_id': row_id, 'normalized_note': normalize_description(note)}
+        for row_id, note in bind.execute(sa.select(transactions.c.id, transactions.c.note))
+    ]
+    _update_by_id(bind, transactions, notes)
+
+
+def _backfill_owner(bind, owner_id: int) -> None:
+    """Normalized descriptions, grams, fingerprints and candidates of one owner's rows."""
+    T, B = transactions.c, bank_transactions.c
+    bind.execute(sa.delete(match_candidates).where(match_candidates.c.owner_id == owner_id))
+    bind.execute(sa.delete(grams_table).where(grams_table.c.owner_id == owner_id))
+    # Cleared first, so rows given new fingerprints never meet old ones on the unique constraint
+    bind.execute(bank_transactions.update().where(B.owner_id == owner_id).values(fingerprint=None))
+
+    # Identical lines are numbered in the order they were stored, as on import
+    ordinals = defaultdict(int)
+    updates, grams, unmatched_bank = [], [], []
+    for row in bind.execute(sa.select(B.id, B.date, B.amount, B.description, B.account_number, B.is_matched,
+                                      B.transaction_id).where(B.owner_id == owner_id).order_by(B.id)):
+        cents = to_cents(row.amount)
+        normalized = normalize_description(row.description)
+        row_grams = description_grams(normalized)
+        line = (row.account_number.strip(), row.date, cents, normalized)
+        fingerprint = bank_fingerprint(owner_id, row.account_number, row.date, cents, normalized, ordinals[line])
+        ordinals[line] += 1
+        updates.append({'row_id': row.id, 'normalized_description': normalized,
+                        'gram_count': len(row_grams), 'fingerprint': fingerprint})
+        grams.extend({'owner_id': owner_id, 'gram': gram, 'bank_transaction_id': row.id} for gram in row_grams)
+        if not row.is_matched and row.transaction_id is None:
+            unmatched_bank.append(_BankTransaction(row.id, row.date, cents, row.description, normalized))
+    _update_by_id(bind, bank_transactions, updates)
+    _insert(bind, grams_table, grams)
+
+    unmatched = [
+        _Transaction(row.id, row.date, to_cents(row.amount), row.note, row.normalized_note, row.category)
+        for row in bind.execute(sa.select(T.id, T.date, T.amount, T.note, T.normalized_note, T.category).where(
+            T.owner_id == owner_id,
+            sa.func.coalesce(T.matched, sa.false()) == sa.false(),
+            T.bank_transaction_id.is_(None)
+        ))
+    ]
+    if unmatched and unmatched_bank:
+        _insert(bind, match_candidates, candidate_rows(unmatched, unmatched_bank, owner_id))
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    existing = set(inspector.get_table_names())
+
+    for table, column in ADDED_COLUMNS:
+        if column.name not in {c['name'] for c in inspector.get_columns(table)}:
+            op.add_column(table, column)
+    _create_tables(existing)
+
+    indexes = defaultdict(set)
+    for table in {table for _, table, _ in ADDED_INDEXES}:
+        if table in existing:
+            indexes[table] = {index['name'] for index in inspector.get_indexes(table)}
+    for name, table, columns in ADDED_INDEXES:
+        if name not in indexes[table]:
+            op.create_index(name, table, columns, unique=False)
+
+    _backfill_notes(bind)
+    owners = bind.execute(sa.select(bank_transactions.c.owner_id).where(
+        bank_transactions.c.owner_id.isnot(None)
+    ).distinct()).scalars().all()
+    for owner_id in owners:
+        _backfill_owner(bind, owner_id)
+
+    if not _has_fingerprint_constraint(inspector):
+        with op.batch_alter_table('bank_transactions', schema=None) as batch_op:
+            batch_op.create_unique_constraint(FINGERPRINT_CONSTRAINT, ['owner_id', 'fingerprint'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('bank_transactions', schema=None) as batch_op:
+        batch_op.drop_constraint(FINGERPRINT_CONSTRAINT, type_='unique')
+    for name, table, _ in reversed(ADDED_INDEXES):
+        if table not in ('match_candidates', 'description_grams', 'jobs'):
+            op.drop_index(name, table_name=table)
+    op.drop_table('jobs')
+    op.drop_table('description_grams')
+    op.drop_table('match_candidates')
+    for table, column in reversed(ADDED_COLUMNS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column.name)
+    job_status.drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,57 @@
+"""hot path indexes
+
+Composite indexes led by owner_id for the per-owner filters of the routers and
+the matching engines. The old indexes they cover are dropped after the new
+ones exist, so no query runs without an index meanwhile.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 01:33:32.347302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_owner_date_amount', 'transactions', ['owner_id', 'date', 'amount'], unique=False)
+    op.create_index('ix_transactions_owner_matched_date', 'transactions', ['owner_id', 'matched', 'date'], unique=False)
+    op.create_index('ix_transactions_owner_bank_transaction', 'transactions', ['owner_id', 'bank_transaction_id'], unique=False)
+    op.drop_index('ix_transactions_owner_date', table_name='transactions')
+
+    op.create_index('ix_bank_transactions_owner_date_amount', 'bank_transactions', ['owner_id', 'date', 'amount'], unique=False)
+    op.create_index('ix_bank_transactions_owner_matched_date', 'bank_transactions', ['owner_id', 'is_matched', 'date'], unique=False)
+    op.create_index('ix_bank_transactions_owner_transaction', 'bank_transactions', ['owner_id', 'transaction_id'], unique=False)
+    op.drop_index('ix_bank_transactions_owner_date', table_name='bank_transactions')
+
+    op.create_index('ix_matches_owner_score', 'matches', ['owner_id', 'score'], unique=False)
+    op.drop_index('ix_matches_score', table_name='matches')
+
+    op.create_index('ix_jobs_owner_created', 'jobs', ['owner_id', 'created_at'], unique=False)
+    op.drop_index('ix_jobs_owner_id', table_name='jobs')
+
+
+def downgrade() -> None:
+    op.create_index('ix_jobs_owner_id', 'jobs', ['owner_id'], unique=False)
+    op.drop_index('ix_jobs_owner_created', table_name='jobs')
+
+    op.create_index('ix_matches_score', 'matches', ['score'], unique=False)
+    op.drop_index('ix_matches_owner_score', table_name='matches')
+
+    op.create_index('ix_bank_transactions_owner_date', 'bank_transactions', ['owner_id', 'date'], unique=False)
+    op.drop_index('ix_bank_transactions_owner_transaction', table_name='bank_transactions')
+    op.drop_index('ix_bank_transactions_owner_matched_date', table_name='bank_transactions')
+    op.drop_index('ix_bank_transactions_owner_date_amount', table_name='bank_transactions')
+
+    op.create_index('ix_transactions_owner_date', 'transactions', ['owner_id', 'date'], unique=False)
+    op.drop_index('ix_transactions_owner_bank_transaction', table_name='transactions')
+    op.drop_index('ix_transactions_owner_matched_date', table_name='transactions')
+    op.drop_index('ix_transactions_owner_date_amount', table_name='transactions')
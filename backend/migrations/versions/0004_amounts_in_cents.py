@@ -0,0 +1,61 @@
+"""amounts in cents
+
+Float amounts become integer cents: transactions.amount and
+bank_transactions.amount turn into amount_cents, matches.match_amount into
+match_amount_cents. Values are converted through NUMERIC, so 0.29 becomes 29
+and not 28, and rounded half away from zero. The (owner_id, date, amount)
+indexes are rebuilt on the new columns.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, float column, cents column, index over (owner_id, date, amount) or None)
+AMOUNT_COLUMNS = [
+    ('transactions', 'amount', 'amount_cents', 'ix_transactions_owner_date_amount'),
+    ('bank_transactions', 'amount', 'amount_cents', 'ix_bank_transactions_owner_date_amount'),
+    ('matches', 'match_amount', 'match_amount_cents', None),
+]
+
+
+def upgrade() -> None:
+    for table, amount, cents, index in AMOUNT_COLUMNS:
+        op.add_column(table, sa.Column(cents, sa.BigInteger(), nullable=True))
+        rows = sa.table(table, sa.column(amount, sa.Float()), sa.column(cents, sa.BigInteger()))
+        op.execute(rows.update().values({
+            cents: sa.cast(sa.func.round(sa.cast(rows.c[amount], sa.Numeric(18, 6)) * 100), sa.BigInteger())
+        }))
+        if index:
+            op.drop_index(index, table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(cents, existing_type=sa.BigInteger(), nullable=False)
+            batch_op.drop_column(amount)
+        if index:
+            op.create_index(index, table, ['owner_id', 'date', cents], unique=False)
+
+
+def downgrade() -> None:
+    for table, amount, cents, index in reversed(AMOUNT_COLUMNS):
+        op.add_column(table, sa.Column(amount, sa.Float(), nullable=True))
+        rows = sa.table(table, sa.column(amount, sa.Float()), sa.column(cents, sa.BigInteger()))
+        op.execute(rows.update().values({amount: rows.c[cents] / 100.0}))
+        if index:
+            op.drop_index(index, table_name=table)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column(amount, existing_type=sa.Float(), nullable=False)
+            batch_op.drop_column(cents)
+        if index:
+            op.create_index(index, table, ['owner_id', 'date', amount], unique=False)
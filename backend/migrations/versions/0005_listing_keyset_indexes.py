@@ -0,0 +1,30 @@
+"""listing keyset indexes
+
+(owner_id, date, id) indexes for the keyset pages of the transaction and bank
+transaction listings, which are ordered by (date, id) and seek past a cursor.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 11:05:27.630915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_owner_date_id', 'transactions', ['owner_id', 'date', 'id'], unique=False)
+    op.create_index('ix_bank_transactions_owner_date_id', 'bank_transactions', ['owner_id', 'date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bank_transactions_owner_date_id', table_name='bank_transactions')
+    op.drop_index('ix_transactions_owner_date_id', table_name='transactions')
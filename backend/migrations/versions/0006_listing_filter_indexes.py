@@ -0,0 +1,31 @@
+"""listing filter indexes
+
+Indexes for the filters of the listings that no existing index covers: the
+category of transactions and the bank and account of bank transactions, each
+followed by date so that a filter combined with a date range stays a range scan.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 13:41:08.502317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_transactions_owner_category_date', 'transactions', ['owner_id', 'category', 'date'], unique=False)
+    op.create_index('ix_bank_transactions_owner_account_date', 'bank_transactions', ['owner_id', 'bank_name', 'account_number', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bank_transactions_owner_account_date', table_name='bank_transactions')
+    op.drop_index('ix_transactions_owner_category_date', table_name='transactions')
@@ -0,0 +1,56 @@
+"""monthly rollups
+
+monthly_rollups holds the count and amount of each owner's transactions per
+month, category, type and match state, and is filled here from the
+transactions table. Pairs already moved to the cold archive are not in that
+table; `python -m backend.rollups rebuild` counts them too.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 16:20:44.071853
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('monthly_rollups',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Date(), nullable=False),
+    sa.Column('category', sa.String(), nullable=False),
+    sa.Column('type', sa.String(), nullable=False),
+    sa.Column('matched', sa.Boolean(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('amount_cents', sa.BigInteger(), nullable=False),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('owner_id', 'month', 'category', 'type', 'matched', name='uq_monthly_rollups_key')
+    )
+    op.create_index('ix_monthly_rollups_id', 'monthly_rollups', ['id'], unique=False)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        month, kind = "date(date, 'start of month')", "type"
+    else:
+        month, kind = "CAST(date_trunc('month', date) AS DATE)", "CAST(type AS VARCHAR)"
+    op.execute(
+        "INSERT INTO monthly_rollups (owner_id, month, category, type, matched, count, amount_cents) "
+        f"SELECT owner_id, {month}, category, {kind}, COALESCE(matched, false), count(id), sum(amount_cents) "
+        "FROM transactions WHERE owner_id IS NOT NULL "
+        f"GROUP BY owner_id, {month}, category, {kind}, COALESCE(matched, false)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_monthly_rollups_id', table_name='monthly_rollups')
+    op.drop_table('monthly_rollups')
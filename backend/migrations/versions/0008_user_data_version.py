@@ -0,0 +1,30 @@
+"""user data version
+
+users.data_version is bumped by every write that can change an owner's
+reports; built reports are cached per (owner, data version).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 18:02:31.514207
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('data_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('data_version')
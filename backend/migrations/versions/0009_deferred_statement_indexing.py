@@ -0,0 +1,31 @@
+"""deferred statement indexing
+
+Statement imports store their rows with gram_count NULL and leave the grams
+and match candidates to a background job. A partial index holds just the rows
+still waiting for it, in the order the job takes them.
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17 21:14:52.380614
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_bank_transactions_owner_unindexed', 'bank_transactions', ['owner_id', 'date', 'id'], unique=False,
+                    sqlite_where=sa.text('gram_count IS NULL'), postgresql_where=sa.text('gram_count IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_bank_transactions_owner_unindexed', table_name='bank_transactions')
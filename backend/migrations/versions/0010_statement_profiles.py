@@ -0,0 +1,50 @@
+"""statement profiles
+
+statement_profiles keeps the layout each owner's bank statements were read
+with, per bank and header, so the next statement of the same bank is read the
+same way, by every server process and after restarts.
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 23:02:17.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('statement_profiles',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('bank_name', sa.String(), nullable=False),
+    sa.Column('header', sa.Text(), nullable=False),
+    sa.Column('date_column', sa.String(), nullable=False),
+    sa.Column('description_column', sa.String(), nullable=False),
+    sa.Column('amount_column', sa.String(), nullable=True),
+    sa.Column('debit_column', sa.String(), nullable=True),
+    sa.Column('credit_column', sa.String(), nullable=True),
+    sa.Column('date_format', sa.String(), nullable=False),
+    sa.Column('decimal', sa.String(), nullable=False),
+    sa.Column('thousands', sa.String(), nullable=True),
+    sa.Column('dates_ambiguous', sa.Boolean(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('owner_id', 'bank_name', 'header', name='uq_statement_profiles_owner_bank_header')
+    )
+    op.create_index('ix_statement_profiles_id', 'statement_profiles', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_statement_profiles_id', table_name='statement_profiles')
+    op.drop_table('statement_profiles')
@@ -1,39 +1,99 @@
-from sqlalchemy import Column, Integer, String, Float, Date, ForeignKey, Enum, Text, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Float, Date, DateTime, ForeignKey, Enum, Text, Boolean, UniqueConstraint, Index, text
+from sqlalchemy.orm import relationship, validates
 from .database import Base
+from .utils.descriptions import normalize_description, description_grams
+from .utils.money import to_cents, from_cents
 import enum
+from datetime import datetime
+
+def _money(column: str) -> property:
+    """
+    Decimal view of an integer cents column. The API schemas read and write
+    amounts through it; queries and matching use the cents column itself.
+    """
+    def get(self):
+        cents = getattr(self, column)
+        return None if cents is None else from_cents(cents)
+
+    def set(self, value):
+        setattr(self, column, None if value is None else to_cents(value))
+
+    return property(get, set)
 
 class TransactionType(str, enum.Enum):
     income = "income"
     expense = "expense"
 
+class JobStatus(str, enum.Enum):
+    queued = "queued"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+    cancelled = "cancelled"
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    # Bumped by every write that can change the owner's reports, which are cached per version
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
     transactions = relationship("Transaction", back_populates="owner")
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    # Every query is per owner: date ranges (matching, preview), unmatched rows, match state,
+    # the newest-first keyset pages of the listing and its category filter
+    __table_args__ = (
+        Index("ix_transactions_owner_date_amount", "owner_id", "date", "amount_cents"),
+        Index("ix_transactions_owner_date_id", "owner_id", "date", "id"),
+        Index("ix_transactions_owner_matched_date", "owner_id", "matched", "date"),
+        Index("ix_transactions_owner_bank_transaction", "owner_id", "bank_transaction_id"),
+        Index("ix_transactions_owner_category_date", "owner_id", "category", "date"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
-    amount = Column(Float, nullable=False)
+    # Money is stored as integer cents so that amounts compare, hash and sum exactly
+    amount_cents = Column(BigInteger, nullable=False)
+    amount = _money("amount_cents")
     category = Column(String, nullable=False)
     type = Column(Enum(TransactionType), nullable=False)
     note = Column(Text)
+    normalized_note = Column(Text)
     matched = Column(Boolean, default=False)
     bank_transaction_id = Column(Integer, ForeignKey("bank_transactions.id"), nullable=True)
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User", back_populates="transactions")
 
+    @validates("note")
+    def _normalize_note(self, key, value):
+        self.normalized_note = normalize_description(value)
+        return value
+
 class BankTransaction(Base):
     __tablename__ = "bank_transactions"
+    __table_args__ = (
+        Index("ix_bank_transactions_owner_date_amount", "owner_id", "date", "amount_cents"),
+        Index("ix_bank_transactions_owner_date_id", "owner_id", "date", "id"),
+        Index("ix_bank_transactions_owner_matched_date", "owner_id", "is_matched", "date"),
+        Index("ix_bank_transactions_owner_transaction", "owner_id", "transaction_id"),
+        Index("ix_bank_transactions_owner_account_date", "owner_id", "bank_name", "account_number", "date"),
+        # The imported rows still waiting for the indexing job, in the order it takes them
+        Index("ix_bank_transactions_owner_unindexed", "owner_id", "date", "id",
+              sqlite_where=text("gram_count IS NULL"), postgresql_where=text("gram_count IS NULL")),
+        UniqueConstraint("owner_id", "fingerprint", name="uq_bank_transactions_owner_fingerprint"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     date = Column(Date, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount_cents = Column(BigInteger, nullable=False)
+    amount = _money("amount_cents")
     description = Column(String, nullable=False)
+    normalized_description = Column(String)
+    # NULL while an imported row waits for its grams and candidates; see statements.index_pending
+    gram_count = Column(Integer, default=0)
+    # Identity of the statement line, unique per owner; see statements and utils.fingerprint
+    fingerprint = Column(String(40))
     bank_name = Column(String, nullable=False)
     account_number = Column(String, nullable=False)
     is_matched = Column(Boolean, default=False)
@@ -41,15 +101,100 @@ class BankTransaction(Base):
     owner_id = Column(Integer, ForeignKey("users.id"))
     owner = relationship("User")
 
+    @validates("description")
+    def _normalize_description(self, key, value):
+        self.normalized_description = normalize_description(value)
+        self.gram_count = len(description_grams(self.normalized_description))
+        return value
+
 class Match(Base):
     __tablename__ = "matches"
+    # Matches are listed and bulk-confirmed per owner, best score first
+    __table_args__ = (Index("ix_matches_owner_score", "owner_id", "score"),)
     id = Column(Integer, primary_key=True, index=True)
-    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False)
-    bank_transaction_id = Column(Integer, ForeignKey("bank_transactions.id"), nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False, index=True)
+    bank_transaction_id = Column(Integer, ForeignKey("bank_transactions.id"), nullable=False, index=True)
     match_date = Column(Date, nullable=False)
-    match_amount = Column(Float, nullable=False)
+    match_amount_cents = Column(BigInteger, nullable=False)
+    match_amount = _money("match_amount_cents")
+    score = Column(Float)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     
     transaction = relationship("Transaction")
     bank_transaction = relationship("BankTransaction")
-    owner = relationship("User") 
\ No newline at end of file
+    owner = relationship("User")
+
+class MatchCandidate(Base):
+    __tablename__ = "match_candidates"
+    __table_args__ = (UniqueConstraint("transaction_id", "bank_transaction_id"),)
+    id = Column(Integer, primary_key=True, index=True)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), nullable=False, index=True)
+    bank_transaction_id = Column(Integer, ForeignKey("bank_transactions.id"), nullable=False, index=True)
+    score = Column(Float, nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+
+    transaction = relationship("Transaction")
+    bank_transaction = relationship("BankTransaction")
+
+class DescriptionGram(Base):
+    __tablename__ = "description_grams"
+    __table_args__ = (Index("ix_description_grams_owner_gram", "owner_id", "gram"),)
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    gram = Column(String, nullable=False)
+    bank_transaction_id = Column(Integer, ForeignKey("bank_transactions.id"), nullable=False, index=True)
+
+class MonthlyRollup(Base):
+    __tablename__ = "monthly_rollups"
+    # Count and amount of an owner's transactions per month, category, type and match state,
+    # kept in step by every write to transactions (see rollups.py); archived pairs stay counted
+    __table_args__ = (
+        UniqueConstraint("owner_id", "month", "category", "type", "matched", name="uq_monthly_rollups_key"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    month = Column(Date, nullable=False)
+    category = Column(String, nullable=False)
+    type = Column(String, nullable=False)
+    matched = Column(Boolean, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+    amount_cents = Column(BigInteger, nullable=False, default=0)
+
+class StatementProfile(Base):
+    __tablename__ = "statement_profiles"
+    # How one bank's statements with a given header read (see utils.bank_formats), per owner;
+    # header is the JSON list of the normalized header names
+    __table_args__ = (
+        UniqueConstraint("owner_id", "bank_name", "header", name="uq_statement_profiles_owner_bank_header"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    bank_name = Column(String, nullable=False)
+    header = Column(Text, nullable=False)
+    date_column = Column(String, nullable=False)
+    description_column = Column(String, nullable=False)
+    amount_column = Column(String, nullable=True)
+    debit_column = Column(String, nullable=True)
+    credit_column = Column(String, nullable=True)
+    date_format = Column(String, nullable=False)
+    decimal = Column(String, nullable=False)
+    thousands = Column(String, nullable=True)
+    dates_ambiguous = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_owner_created", "owner_id", "created_at"),)
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(Enum(JobStatus), nullable=False, default=JobStatus.queued)
+    progress = Column(Integer, default=0)
+    total = Column(Integer, nullable=True)
+    payload = Column(Text)
+    result = Column(Text)
+    error = Column(Text)
+    cancel_requested = Column(Boolean, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,84 @@
+"""
+Keyset pagination for the transaction listings.
+
+Pages are ordered newest first on (date, id), and the next page starts right
+after the last row of the current one. Each page is a seek on an
+(owner_id, date, id) index, so a deep page costs as much as the first one, and
+rows inserted meanwhile do not shift later pages. Cursors are opaque to clients.
+"""
+import base64
+import json
+from datetime import date
+from typing import Awaitable, Callable, List, Optional, Tuple
+from fastapi import HTTPException, Response
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_MODES = ("exact", "estimate")
+
+def encode_cursor(day: date, row_id: int) -> str:
+    """Opaque cursor for the row (day, row_id)."""
+    return base64.urlsafe_b64encode(json.dumps([day.isoformat(), row_id]).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    """(date, id) of a cursor made by encode_cursor; raises ValueError when it is not one."""
+    try:
+        day, row_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return date.fromisoformat(day), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def keyset_page(query: Select, model, cursor: Optional[str], limit: int, skip: int = 0) -> Select:
+    """
+    The page of query after cursor, newest first. One row beyond limit is
+    selected, which tells next_cursor whether another page follows. skip is the
+    deprecated offset paging, only applied without a cursor.
+    """
+    page = query.order_by(model.date.desc(), model.id.desc()).limit(limit + 1)
+    if cursor:
+        try:
+            day, row_id = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return page.filter(tuple_(model.date, model.id) < tuple_(day, row_id))
+    return page.offset(skip) if skip else page
+
+def next_cursor(rows: List, limit: int) -> Optional[str]:
+    """The cursor of the page after rows, or None on the last page. Drops the extra row."""
+    if len(rows) <= limit:
+        return None
+    del rows[limit:]
+    return encode_cursor(rows[-1].date, rows[-1].id)
+
+async def total_count(db: AsyncSession, query: Select, mode: str) -> int:
+    """
+    Number of rows of query (without paging). mode "estimate" takes the
+    planner's row estimate on PostgreSQL instead of counting; other databases
+    are always counted.
+    """
+    if mode == "estimate" and db.bind.dialect.name == "postgresql":
+        # Run as driver SQL: text() would take ":name" inside a quoted filter value for a bind parameter
+        statement = query.compile(dialect=db.bind.dialect, compile_kwargs={"literal_binds": True})
+        connection = await db.connection()
+        plan = (await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}")).scalar()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]["Plan"]["Plan Rows"])
+    return await db.scalar(select(func.count()).select_from(query.order_by(None).subquery()))
+
+async def set_page_headers(response: Response, db: AsyncSession, query: Select, rows: List, limit: int,
+                           total: Optional[str], archived: Optional[Callable[[], Awaitable[int]]] = None):
+    """
+    Trim rows to the page and set the next-cursor header, plus the total count when
+    asked for. archived counts the listed rows kept outside the database, if any.
+    """
+    cursor = next_cursor(rows, limit)
+    if cursor:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
+    if total:
+        count = await total_count(db, query, total)
+        if archived:
+            count += await archived()
+        response.headers[TOTAL_COUNT_HEADER] = str(count)
@@ -0,0 +1,153 @@
+"""
+Batch reconciliation across all users.
+
+Partitions (one per user, or one per user and month) are spread over a process
+pool; every worker opens its own engine, runs the matching engine and writes the
+Match records of a partition in one bulk insert. With --backend sql the workers
+only drive the database, which does the matching itself.
+
+    python -m backend.reconcile --workers 8 --partition month --time-window-days 1
+"""
+import argparse
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import insert, func
+from . import models, database, matching, sql_matching
+from .config import settings
+
+# Session factory of the current worker process
+_Session = None
+
+def _init_worker():
+    global _Session
+    _Session = database.create_session_factory()
+
+def _month_end(month_start: date) -> date:
+    next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+def list_partitions(user_ids: Optional[List[int]], by_month: bool) -> List[Tuple[int, Optional[date], Optional[date]]]:
+    """
+    Partitions as (user_id, date_from, date_to). Month partitions cover the months
+    between the user's oldest and newest unmatched transaction.
+    """
+    db = database.SessionLocal()
+    try:
+        query = db.query(models.User.id)
+        if user_ids:
+            query = query.filter(models.User.id.in_(user_ids))
+        users = [user_id for user_id, in query.order_by(models.User.id).all()]
+        if not by_month:
+            return [(user_id, None, None) for user_id in users]
+
+        ranges = db.query(
+            models.Transaction.owner_id,
+            func.min(models.Transaction.date),
+            func.max(models.Transaction.date)
+        ).filter(
+            models.Transaction.owner_id.in_(users),
+            models.Transaction.bank_transaction_id == None
+        ).group_by(models.Transaction.owner_id).all()
+    finally:
+        db.close()
+
+    partitions = []
+    for user_id, first, last in ranges:
+        month = first.replace(day=1)
+        while month <= last:
+            partitions.append((user_id, month, _month_end(month)))
+            month = _month_end(month) + timedelta(days=1)
+    return partitions
+
+def reconcile_partition(partition: Tuple[int, Optional[date], Optional[date]], time_window_days: int,
+                        amount_tolerance: float, dry_run: bool, backend: str = "python") -> dict:
+    """Match one partition in the calling worker and bulk-insert its Match records."""
+    user_id, date_from, date_to = partition
+    started = time.perf_counter()
+    db = _Session()
+    try:
+        if backend == "sql":
+            row_count = sql_matching.count_unmatched(db, user_id, date_from, date_to)
+            match_count = len(sql_matching.insert_matches(
+                db,
+                user_id,
+                time_window_days=time_window_days,
+                amount_tolerance=amount_tolerance,
+                date_from=date_from,
+                date_to=date_to
+            ))
+        else:
+            transactions, bank_transactions = matching.load_unmatched(db, user_id, date_from, date_to)
+            matches = matching.find_matches(
+                transactions,
+                bank_transactions,
+                time_window_days=time_window_days,
+                amount_tolerance=amount_tolerance
+            )
+            rows = matching.match_rows(matches, user_id)
+            if rows:
+                db.execute(insert(models.Match), rows)
+            row_count = len(transactions) + len(bank_transactions)
+            match_count = len(rows)
+        if dry_run:
+            db.rollback()
+        else:
+            db.commit()
+    finally:
+        db.close()
+    return {
+        "pid": os.getpid(),
+        "rows": row_count,
+        "matches": match_count,
+        "seconds": time.perf_counter() - started,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reconcile transactions with bank transactions for every user")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument("--partition", choices=["user", "month"], default="user",
+                        help="Unit of work; month partitions only pair rows dated in the same month")
+    parser.add_argument("--users", type=lambda value: [int(x) for x in value.split(",")], default=None,
+                        help="Comma-separated user ids (default: all users)")
+    parser.add_argument("--time-window-days", type=int, default=0)
+    parser.add_argument("--amount-tolerance", type=float, default=0.0)
+    parser.add_argument("--backend", choices=["python", "sql"], default=settings.MATCHING_BACKEND,
+                        help="Match in the worker processes or inside the database")
+    parser.add_argument("--dry-run", action="store_true", help="Match without writing Match records")
+    args = parser.parse_args(argv)
+
+    partitions = list_partitions(args.users, args.partition == "month")
+    print(f"Reconciling {len(partitions)} partitions with {args.workers} workers")
+
+    started = time.perf_counter()
+    per_worker = defaultdict(lambda: {"partitions": 0, "rows": 0, "matches": 0, "seconds": 0.0})
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as executor:
+        futures = [
+            executor.submit(reconcile_partition, partition, args.time_window_days, args.amount_tolerance,
+                            args.dry_run, args.backend)
+            for partition in partitions
+        ]
+        for future in futures:
+            result = future.result()
+            stats = per_worker[result["pid"]]
+            stats["partitions"] += 1
+            stats["rows"] += result["rows"]
+            stats["matches"] += result["matches"]
+            stats["seconds"] += result["seconds"]
+    elapsed = time.perf_counter() - started
+
+    print(f"{'worker':>8} {'partitions':>10} {'rows':>10} {'matches':>10} {'busy s':>8} {'rows/s':>10}")
+    for pid, stats in sorted(per_worker.items()):
+        rate = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        print(f"{pid:>8} {stats['partitions']:>10} {stats['rows']:>10} {stats['matches']:>10} {stats['seconds']:>8.2f} {rate:>10.0f}")
+    total_rows = sum(stats["rows"] for stats in per_worker.values())
+    total_matches = sum(stats["matches"] for stats in per_worker.values())
+    rate = total_rows / elapsed if elapsed else 0.0
+    print(f"Total: {total_rows} rows, {total_matches} matches in {elapsed:.2f}s ({rate:.0f} rows/s)")
+
+if __name__ == "__main__":
+    main()
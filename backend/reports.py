@@ -0,0 +1,235 @@
+"""
+Reports of an owner's unmatched bank and user transactions, as XLSX or CSV.
+
+Rows are read through a server-side cursor, a batch at a time, and written
+straight into an openpyxl write-only workbook or a CSV stream, so memory stays
+flat however many rows there are.
+
+Every write that can change a report calls invalidate(), which bumps the
+owner's users.data_version in the same database transaction. Built reports
+are kept under REPORTS_DIR named by (owner, data version, format), so a report
+downloaded again before the data changes is served from the file already
+built. After each build, reports older than REPORTS_MAX_AGE_HOURS and stale
+versions are deleted, then the least recently served ones until the directory
+is back under REPORTS_MAX_BYTES.
+"""
+import csv
+import io
+import os
+import re
+import time
+import uuid
+from typing import Iterator, Optional, Tuple
+from openpyxl import Workbook
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from . import models, database
+from .config import settings
+from .utils.money import from_cents, format_cents
+
+MEDIA_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+}
+
+# Rows fetched from the cursor, and written to a CSV stream, at a time
+BATCH_SIZE = 1000
+
+BANK_COLUMNS = ["Date", "Description", "Amount", "Bank Name", "Account Number", "Type"]
+TRANSACTION_COLUMNS = ["Date", "Description", "Amount", "Category", "Type"]
+CSV_COLUMNS = ["Type", "Date", "Description", "Amount", "Bank Name", "Account Number", "Category"]
+
+_REPORT_NAME = re.compile(r"^unmatched_transactions_(\d+)_v(\d+)\.(\w+)$")
+
+def invalidate(db: Session, owner_id: int):
+    """Mark the owner's cached reports stale. The caller commits, with the write that changed the data."""
+    db.execute(
+        update(models.User).where(models.User.id == owner_id).values(data_version=models.User.data_version + 1)
+    )
+
+def data_version(db: Session, owner_id: int) -> int:
+    return db.execute(select(models.User.data_version).where(models.User.id == owner_id)).scalar_one()
+
+def report_path(owner_id: int, version: int, fmt: str) -> str:
+    return os.path.join(settings.REPORTS_DIR, f"unmatched_transactions_{owner_id}_v{version}.{fmt}")
+
+def _bank_rows(db: Session, owner_id: int) -> Iterator[tuple]:
+    B = models.BankTransaction
+    result = db.execute(
+        select(B.date, B.description, B.amount_cents, B.bank_name, B.account_number)
+        .where(B.owner_id == owner_id, B.is_matched == False)
+        .order_by(B.date, B.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def _transaction_rows(db: Session, owner_id: int) -> Iterator[tuple]:
+    T = models.Transaction
+    result = db.execute(
+        select(T.date, T.note, T.category, T.amount_cents)
+        .where(T.owner_id == owner_id, T.matched == False)
+        .order_by(T.date, T.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    try:
+        yield from result
+    finally:
+        result.close()
+
+def _write_xlsx(db: Session, owner_id: int, path: str):
+    workbook = Workbook(write_only=True)
+    bank_sheet = workbook.create_sheet("Unmatched Bank Transactions")
+    bank_sheet.append(BANK_COLUMNS)
+    bank_count = 0
+    for day, description, amount_cents, bank_name, account_number in _bank_rows(db, owner_id):
+        bank_sheet.append([day, description, from_cents(amount_cents), bank_name, account_number, "Bank Transaction"])
+        bank_count += 1
+
+    transaction_sheet = workbook.create_sheet("Unmatched User Transactions")
+    transaction_sheet.append(TRANSACTION_COLUMNS)
+    transaction_count = 0
+    for day, note, category, amount_cents in _transaction_rows(db, owner_id):
+        transaction_sheet.append([day, note or category, from_cents(amount_cents), category, "User Transaction"])
+        transaction_count += 1
+
+    summary_sheet = workbook.create_sheet("Summary")
+    summary_sheet.append(["Metric", "Count"])
+    summary_sheet.append(["Total Unmatched Bank Transactions", bank_count])
+    summary_sheet.append(["Total Unmatched User Transactions", transaction_count])
+    workbook.save(path)
+
+def _csv_chunks(db: Session, owner_id: int) -> Iterator[bytes]:
+    """The CSV report, encoded, BATCH_SIZE rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    rows = 0
+    for day, description, amount_cents, bank_name, account_number in _bank_rows(db, owner_id):
+        writer.writerow(["Bank Transaction", day.isoformat(), description, format_cents(amount_cents), bank_name, account_number, ""])
+        rows += 1
+        if rows % BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    for day, note, category, amount_cents in _transaction_rows(db, owner_id):
+        writer.writerow(["User Transaction", day.isoformat(), note or category, format_cents(amount_cents), "", "", category])
+        rows += 1
+        if rows % BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+def cached_report(db: Session, owner_id: int, fmt: str) -> Tuple[int, Optional[str]]:
+    """
+    The owner's current data version, and the path of the report built for it
+    if there is one. A cached report served counts as recently used for eviction.
+    """
+    version = data_version(db, owner_id)
+    path = report_path(owner_id, version, fmt)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return version, None
+    return version, path
+
+def _temporary_path(path: str) -> str:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def build_unmatched_report(db: Session, owner_id: int, fmt: str = "xlsx") -> Tuple[str, str]:
+    """
+    Write the owner's report at the current data version, unless it is cached.
+    Returns (file path, download file name).
+    """
+    # The version is read before the rows: a write committed in between lands in
+    # a report labelled with the older version, which is never served again
+    version, path = cached_report(db, owner_id, fmt)
+    if path is None:
+        path = report_path(owner_id, version, fmt)
+        temporary = _temporary_path(path)
+        try:
+            if fmt == "xlsx":
+                _write_xlsx(db, owner_id, temporary)
+            else:
+                with open(temporary, "wb") as f:
+                    for chunk in _csv_chunks(db, owner_id):
+                        f.write(chunk)
+            os.replace(temporary, path)
+        finally:
+            _discard(temporary)
+        evict(keep=path)
+    return path, os.path.basename(path)
+
+def stream_unmatched_csv(owner_id: int, version: int) -> Iterator[bytes]:
+    """
+    The owner's CSV report, yielded as it is read, on a read session of its own.
+    It is saved as the cached report of version once complete; a download given
+    up halfway leaves nothing behind.
+    """
+    db = database.ReadSessionLocal()
+    path = report_path(owner_id, version, "csv")
+    temporary = _temporary_path(path)
+    try:
+        with open(temporary, "wb") as f:
+            for chunk in _csv_chunks(db, owner_id):
+                f.write(chunk)
+                yield chunk
+        os.replace(temporary, path)
+        evict(keep=path)
+    finally:
+        _discard(temporary)
+        db.close()
+
+def evict(keep: Optional[str] = None):
+    """
+    Delete reports older than REPORTS_MAX_AGE_HOURS and those of an older data
+    version than another report of the same owner, then the least recently
+    served ones until REPORTS_MAX_BYTES is met. keep, the report just built, and
+    reports still being written are left alone.
+    """
+    try:
+        entries = [entry for entry in os.scandir(settings.REPORTS_DIR) if entry.is_file()]
+    except FileNotFoundError:
+        return
+    expired = time.time() - settings.REPORTS_MAX_AGE_HOURS * 3600
+    reports = []
+    for entry in entries:
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime < expired and entry.path != keep:
+            _discard(entry.path)
+            continue
+        # Temporary files of reports being written do not match
+        name = _REPORT_NAME.match(entry.name)
+        if name:
+            reports.append((stat.st_mtime, stat.st_size, entry.path, int(name.group(1)), int(name.group(2))))
+
+    latest = {}
+    for *_, owner_id, version in reports:
+        latest[owner_id] = max(latest.get(owner_id, version), version)
+    total = 0
+    evictable = []
+    for mtime, size, path, owner_id, version in reports:
+        if version < latest[owner_id] and path != keep:
+            _discard(path)
+            continue
+        total += size
+        if path != keep:
+            evictable.append((mtime, size, path))
+    for _, size, path in sorted(evictable):
+        if total <= settings.REPORTS_MAX_BYTES:
+            break
+        _discard(path)
+        total -= size
@@ -0,0 +1,145 @@
+"""
+Monthly rollups of transactions.
+
+monthly_rollups holds the count and amount of each owner's transactions per
+(month, category, type, matched). Every write to transactions calls track()
+with the rows as they were and as they are, in the same database transaction,
+so summaries read a few rollup rows however long the history is. Pairs moved to
+the cold archive stay counted.
+
+rebuild() recomputes an owner's rollups from the transactions and the archive,
+for drift repair:
+
+    python -m backend.rollups rebuild --users 1,2
+"""
+import argparse
+from collections import Counter
+from datetime import date
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from . import models, database, cold_archive
+from .utils.sql import dialect_insert, month_start
+
+class RollupKey(NamedTuple):
+    month: date
+    category: str
+    type: str
+    matched: bool
+
+def snapshot(transaction) -> Tuple[RollupKey, int]:
+    """The rollup key and amount of a transaction, or of a row with the same columns."""
+    return RollupKey(
+        transaction.date.replace(day=1),
+        transaction.category,
+        getattr(transaction.type, "value", transaction.type),
+        bool(transaction.matched)
+    ), transaction.amount_cents
+
+def track(db: Session, owner_id: int, removed: Iterable[Tuple[RollupKey, int]] = (),
+          added: Iterable[Tuple[RollupKey, int]] = ()):
+    """
+    Apply a change of the owner's transactions to the rollups: removed are
+    snapshots of the rows before the write, added after it. The caller commits.
+    """
+    counts, amounts = Counter(), Counter()
+    for sign, snapshots in ((-1, removed), (1, added)):
+        for key, amount_cents in snapshots:
+            counts[key] += sign
+            amounts[key] += sign * amount_cents
+    rows = [
+        {"owner_id": owner_id, **key._asdict(), "count": counts[key], "amount_cents": amounts[key]}
+        for key in counts if counts[key] or amounts[key]
+    ]
+    if rows:
+        _add(db, rows)
+        db.execute(delete(models.MonthlyRollup).where(
+            models.MonthlyRollup.owner_id == owner_id,
+            models.MonthlyRollup.count == 0
+        ))
+
+def _add(db: Session, rows: List[dict]):
+    table = models.MonthlyRollup.__table__
+    # Upsert that adds to an existing rollup row
+    statement = dialect_insert(db, table)
+    statement = statement.on_conflict_do_update(
+        index_elements=["owner_id", "month", "category", "type", "matched"],
+        set_={
+            "count": table.c.count + statement.excluded.count,
+            "amount_cents": table.c.amount_cents + statement.excluded.amount_cents,
+        }
+    )
+    db.execute(statement, rows)
+
+def snapshots_of(db: Session, transaction_ids: List[int]) -> List[Tuple[RollupKey, int]]:
+    """Snapshots of transactions by id, read in one query per 500 ids."""
+    T = models.Transaction
+    snapshots = []
+    for start in range(0, len(transaction_ids), 500):
+        snapshots.extend(snapshot(row) for row in db.execute(
+            select(T.date, T.category, T.type, T.matched, T.amount_cents).where(T.id.in_(transaction_ids[start:start + 500]))
+        ))
+    return snapshots
+
+def _computed(db: Session, owner_id: int) -> Dict[RollupKey, List[int]]:
+    """[count, amount] per rollup key of the owner, counted from the transactions and the archive."""
+    T = models.Transaction
+    month = month_start(T.date)
+    matched = func.coalesce(T.matched, False)
+    totals = {}
+    for row in db.execute(
+        select(month, T.category, T.type, matched, func.count(T.id), func.sum(T.amount_cents))
+        .where(T.owner_id == owner_id)
+        .group_by(month, T.category, T.type, matched)
+    ):
+        key = RollupKey(row[0], row[1], getattr(row[2], "value", row[2]), bool(row[3]))
+        totals[key] = [row[4], row[5]]
+    archived = cold_archive.archived_rows(owner_id, "transactions", ["date", "category", "type", "matched", "amount_cents"])
+    for day, category, kind, is_matched, amount_cents in archived.itertuples(index=False):
+        key = RollupKey(day.replace(day=1), category, kind, bool(is_matched))
+        count, amount = totals.get(key, [0, 0])
+        totals[key] = [count + 1, amount + int(amount_cents)]
+    return totals
+
+def rebuild(db: Session, owner_id: int) -> int:
+    """
+    Recompute the owner's rollups from scratch and commit. Returns how many
+    rollup rows were wrong or missing before.
+    """
+    R = models.MonthlyRollup
+    stored = {
+        RollupKey(row.month, row.category, row.type, row.matched): [row.count, row.amount_cents]
+        for row in db.query(R).filter(R.owner_id == owner_id)
+    }
+    computed = _computed(db, owner_id)
+    drift = sum(1 for key in stored.keys() | computed.keys() if stored.get(key) != computed.get(key))
+    db.execute(delete(R).where(R.owner_id == owner_id))
+    rows = [
+        {"owner_id": owner_id, **key._asdict(), "count": count, "amount_cents": amount_cents}
+        for key, (count, amount_cents) in computed.items()
+    ]
+    if rows:
+        db.execute(models.MonthlyRollup.__table__.insert(), rows)
+    db.commit()
+    return drift
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recompute the monthly rollups of transactions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild", help="Rebuild the rollups and report the rows that had drifted")
+    rebuild_parser.add_argument("--users", type=lambda value: [int(x) for x in value.split(",")], default=None,
+                                help="Comma-separated user ids (default: all users)")
+    args = parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        query = db.query(models.User.id)
+        if args.users:
+            query = query.filter(models.User.id.in_(args.users))
+        for user_id, in query.order_by(models.User.id).all():
+            print(f"user {user_id}: {rebuild(db, user_id)} rollup rows repaired")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,95 +1,135 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-import os
-from datetime import datetime, timedelta
-from .. import models, schemas, database, auth
-from ..utils.bank_parser import parse_bank_csv, cleanup_upload
-from ..schemas.bank import BankTransaction, BankMatchResult, BankMatchSummary
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from .. import models, database, auth, statements
+from ..executor import iterate_blocking, run_blocking, run_with_read_session
+from ..utils.bank_formats import check_date_format
+from ..utils.bank_parser import iter_statement, statement_reader, supported_extensions
+from ..utils.money import from_cents
+from ..schemas.bank import BankMatchLine, BankMatchSummary
 
 router = APIRouter()
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Statement lines parsed, matched and streamed back at a time by the preview
+PREVIEW_CHUNK_SIZE = 10_000
+
+def build_transaction_index(rows, index: Optional[Dict[int, List[int]]] = None) -> Dict[int, List[int]]:
+    """
+    Index (date, amount_cents) rows by amount in cents, or add them to an index
+    built before. Each entry holds the date ordinals in ascending order.
+    """
+    index = {} if index is None else index
+    touched = set()
+    for tx_date, cents in rows:
+        index.setdefault(cents, []).append(tx_date.toordinal())
+        touched.add(cents)
+    for cents in touched:
+        index[cents].sort()
+    return index
 
-def match_transactions(bank_tx: dict, db_transactions: List[models.Transaction], date_tolerance: int = 1) -> bool:
+def match_transactions(bank_tx: dict, index: Dict[int, List[int]], date_tolerance: int = 1) -> bool:
     """
     Match a bank transaction with user transactions.
     Uses date tolerance to account for slight date differences.
     """
-    bank_date = bank_tx['date']
-    bank_amount = bank_tx['amount']
-    
-    for tx in db_transactions:
-        # Check if dates are within tolerance
-        date_diff = abs((bank_date - tx.date).days)
-        if date_diff <= date_tolerance and abs(tx.amount - bank_amount) < 0.01:
-            return True
-    return False
+    ordinals = index.get(bank_tx['amount_cents'])
+    if not ordinals:
+        return False
+    bank_date = bank_tx['date'].toordinal()
+    return bisect_left(ordinals, bank_date - date_tolerance) < bisect_right(ordinals, bank_date + date_tolerance)
+
+def _missing_ranges(loaded: Optional[Tuple[date, date]], start: date, end: date) -> List[Tuple[date, date]]:
+    """The parts of [start, end] outside the loaded date range."""
+    if loaded is None:
+        return [(start, end)]
+    ranges = []
+    if start < loaded[0]:
+        ranges.append((start, loaded[0] - timedelta(days=1)))
+    if end > loaded[1]:
+        ranges.append((loaded[1] + timedelta(days=1), end))
+    return ranges
 
-@router.post("/upload", response_model=BankMatchResult)
-async def upload_bank_csv(
+@router.post("/preview", response_class=StreamingResponse)
+async def preview_bank_csv(
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    date_tolerance: int = Query(1, ge=0, description="Days a bank date may differ from the transaction date"),
+    bank_name: Optional[str] = Query(None, description="Bank whose stored statement format to read the file with"),
+    date_format: Optional[str] = Query(None, description="strptime format of the statement dates, e.g. %d/%m/%Y, when they would be read wrongly"),
+    decimal_separator: Optional[str] = Query(None, pattern="^[.,]$", description="Decimal point of the amounts, . or ,, when they would be read wrongly"),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files are allowed")
-    
-    # Create uploads directory if it doesn't exist
-    upload_dir = os.path.join("backend", "uploads")
-    os.makedirs(upload_dir, exist_ok=True)
+    """
+    Dry-run reconciliation of a bank statement against the user's transactions.
+    Nothing is stored; each statement line is streamed back as a JSON line
+    carrying a matched flag, in statement order.
+    """
+    if statement_reader(file.filename) is None:
+        raise HTTPException(status_code=400, detail=f"Only {', '.join(supported_extensions())} files are allowed")
     
-    # Save uploaded file
-    file_path = os.path.join(upload_dir, f"{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    # The statement is read from the spooled upload PREVIEW_CHUNK_SIZE lines at a time, in
+    # the blocking pool. The first chunk is read before the response starts, so a statement
+    # that cannot be parsed is still a 400.
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Parse CSV
-        bank_data = parse_bank_csv(file_path)
-        
-        # Get user's transactions
-        db_transactions = db.query(models.Transaction).filter(
-            models.Transaction.owner_id == current_user.id
-        ).all()
-        
-        # Match transactions
-        matched = []
-        unmatched = []
-        
-        for bank_tx in bank_data:
-            if match_transactions(bank_tx, db_transactions):
-                matched.append(BankTransaction(**bank_tx))
-            else:
-                unmatched.append(BankTransaction(**bank_tx))
-        
-        return BankMatchResult(matched=matched, unmatched=unmatched)
-    
+        if date_format:
+            check_date_format(date_format)
+        profiles = await run_with_read_session(statements.format_profiles, current_user.id, bank_name)
+        chunks = iter_statement(file.file, file.filename, PREVIEW_CHUNK_SIZE, profiles, date_format, decimal_separator)
+        first_chunk = await run_blocking(next, chunks, None)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    
-    finally:
-        # Clean up the uploaded file
-        cleanup_upload(file_path)
+
+    async def stream_results():
+        # Only the transactions in the date range of the chunks read so far are loaded, as
+        # (date, amount) pairs; a chunk reaching past that range loads the days it adds
+        index: Dict[int, List[int]] = {}
+        loaded = None
+        rest = iterate_blocking(chunks)
+        try:
+            chunk = first_chunk
+            while chunk:
+                start = min(tx['date'] for tx in chunk) - timedelta(days=date_tolerance)
+                end = max(tx['date'] for tx in chunk) + timedelta(days=date_tolerance)
+                for low, high in _missing_ranges(loaded, start, end):
+                    result = await db.execute(select(models.Transaction.date, models.Transaction.amount_cents).filter(
+                        models.Transaction.owner_id == current_user.id,
+                        models.Transaction.date.between(low, high)
+                    ))
+                    index = await run_blocking(build_transaction_index, result.all(), index)
+                loaded = (min(start, loaded[0]), max(end, loaded[1])) if loaded else (start, end)
+
+                yield "".join(
+                    BankMatchLine(
+                        date=bank_tx['date'],
+                        description=bank_tx['description'],
+                        amount=from_cents(bank_tx['amount_cents']),
+                        matched=match_transactions(bank_tx, index, date_tolerance)
+                    ).model_dump_json() + "\n"
+                    for bank_tx in chunk
+                )
+                chunk = await anext(rest, None)
+        finally:
+            await rest.aclose()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
 
 @router.get("/summary", response_model=BankMatchSummary)
 async def get_match_summary(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
     """Get a summary of matched vs unmatched transactions"""
-    # Get all user transactions
-    user_transactions = db.query(models.Transaction).filter(
-        models.Transaction.owner_id == current_user.id
-    ).all()
-    
-    total = len(user_transactions)
+    # Summed from the monthly rollups, a few rows per month whatever the number of transactions
+    result = await db.execute(select(
+        func.sum(models.MonthlyRollup.count),
+        func.sum(case((models.MonthlyRollup.matched == True, models.MonthlyRollup.count), else_=0))
+    ).filter(models.MonthlyRollup.owner_id == current_user.id))
+    total, matched_count = result.one()
+    total, matched_count = total or 0, matched_count or 0
     if total == 0:
         return BankMatchSummary(
             total_transactions=0,
@@ -98,8 +138,6 @@ async def get_match_summary(
             match_percentage=0.0
         )
     
-    # Count matched transactions (you might want to add a 'matched' flag to your Transaction model)
-    matched_count = sum(1 for tx in user_transactions if hasattr(tx, 'matched') and tx.matched)
     unmatched_count = total - matched_count
     
     return BankMatchSummary(
@@ -107,4 +145,4 @@ async def get_match_summary(
         matched_count=matched_count,
         unmatched_count=unmatched_count,
         match_percentage=(matched_count / total) * 100
-    ) 
\ No newline at end of file
+    )
\ No newline at end of file
@@ -1,95 +1,101 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import os
-from datetime import datetime, date
-import pandas as pd
-from fastapi.responses import FileResponse
-from .. import models, database, auth
-from ..schemas.bank_transaction import BankTransactionBase, BankTransactionCreate, BankTransactionOut
-from ..utils.bank_parser import parse_bank_csv, cleanup_upload
-from sqlalchemy import extract
+import uuid
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from .. import models, database, auth, candidates, cold_archive, description_index, jobs, statements, reports
+from ..executor import iterate_blocking, run_blocking, run_with_session, run_with_read_session
+from ..filters import ListingFilters, bank_transaction_filters
+from ..pagination import set_page_headers
+from ..schemas.bank_transaction import BankTransactionBase, BankTransactionCreate, BankTransactionOut, ArchiveImportResult
+from ..schemas.job import JobOut
+from sqlalchemy import select
+from ..utils.bank_formats import check_date_format
+from ..utils.bank_parser import save_upload, cleanup_upload
+from .jobs import queue_statement_import, submit_job
 
 router = APIRouter()
 
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=BankTransactionOut)
-def create_bank_transaction(bank_transaction: BankTransactionCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def create_bank_transaction(bank_transaction: BankTransactionCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_bank_transaction = models.BankTransaction(**bank_transaction.dict(), owner_id=current_user.id)
     db.add(db_bank_transaction)
+    db.flush()
+    statements.assign_fingerprints(db, current_user.id, [db_bank_transaction])
+    description_index.index_bank_transactions(db, [db_bank_transaction])
+    candidates.refresh_bank_transactions(db, current_user.id, [db_bank_transaction])
+    reports.invalidate(db, current_user.id)
     db.commit()
     db.refresh(db_bank_transaction)
     return db_bank_transaction
 
-@router.post("/bulk/upload", response_model=List[BankTransactionOut])
+@router.post("/bulk/upload", response_model=JobOut, status_code=202)
 async def bulk_upload_bank_transactions(
     file: UploadFile = File(...),
     bank_name: str = Form(...),
     account_number: str = Form(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    date_format: Optional[str] = Form(None, description="strptime format of the statement dates, e.g. %d/%m/%Y, when they would be read wrongly"),
+    decimal_separator: Optional[str] = Form(None, pattern="^[.,]$", description="Decimal point of the amounts, . or ,, when they would be read wrongly"),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="Only CSV files are allowed")
-    
-    # The validation for bank_name and account_number will now be handled by FastAPI's Form(...) declaration
+    """
+    Queue the import of a statement, as POST /api/jobs/bank-import does. The job's
+    result holds the IDs of the stored rows and the counts of inserted and duplicate rows.
+    """
+    return await queue_statement_import(file, current_user.id, bank_name, account_number, date_format, decimal_separator)
+
+@router.post("/bulk/archive", response_model=ArchiveImportResult)
+async def bulk_upload_archive(
+    file: UploadFile = File(...),
+    date_format: Optional[str] = Form(None, description="strptime format of the statement dates, e.g. %d/%m/%Y, when they would be read wrongly"),
+    decimal_separator: Optional[str] = Form(None, pattern="^[.,]$", description="Decimal point of the amounts, . or ,, when they would be read wrongly"),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    """
+    Import a ZIP of statements. Each file is tagged with its bank and account by a
+    manifest.csv (columns file, bank_name, account_number) or by its name,
+    <bank>_<account>.<ext>. Files are parsed in parallel; the result lists every
+    file, with the error of those that could not be imported. date_format and
+    decimal_separator apply to every file.
+    """
+    if not file.filename.lower().endswith('.zip'):
+        raise HTTPException(status_code=400, detail="Only ZIP archives are allowed")
+    try:
+        if date_format:
+            check_date_format(date_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Create uploads directory if it doesn't exist
+    # The parsing processes read the archive from disk
     upload_dir = os.path.join("backend", "uploads")
     os.makedirs(upload_dir, exist_ok=True)
-    
-    # Save uploaded file
-    file_path = os.path.join(upload_dir, f"{current_user.id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+    file_path = os.path.join(upload_dir, f"{current_user.id}_{uuid.uuid4().hex}.zip")
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
-        
-        # Parse CSV
-        bank_data = parse_bank_csv(file_path)
-        
-        # Convert to BankTransactionCreate objects
-        bank_transactions = []
-        for tx in bank_data:
-            bank_transaction = BankTransactionCreate(
-                date=tx['date'],
-                description=tx['description'],
-                amount=tx['amount'],
-                bank_name=bank_name,
-                account_number=account_number
-            )
-            bank_transactions.append(bank_transaction)
-        
-        # Create bank transactions in bulk
-        db_bank_transactions = []
-        for bank_transaction in bank_transactions:
-            db_bank_transaction = models.BankTransaction(**bank_transaction.dict(), owner_id=current_user.id)
-            db.add(db_bank_transaction)
-            db_bank_transactions.append(db_bank_transaction)
-        
-        db.commit()
-        for db_bank_transaction in db_bank_transactions:
-            db.refresh(db_bank_transaction)
-        
-        return db_bank_transactions
-    
-    except Exception as e:
+        await run_blocking(save_upload, file.file, file_path)
+        files = await run_with_session(statements.import_archive, current_user.id, file_path, date_format=date_format,
+                                       decimal=decimal_separator)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    
     finally:
-        # Clean up the uploaded file
         cleanup_upload(file_path)
+    if any(result["inserted"] for result in files):
+        await run_with_session(jobs.queue_indexing, current_user.id)
+    
+    formats = {result["date_format_used"] for result in files if result["date_format_used"]}
+    return ArchiveImportResult(
+        inserted=sum(result["inserted"] for result in files),
+        duplicates=sum(result["duplicates"] for result in files),
+        date_format_used=formats.pop() if len(formats) == 1 else None,
+        ambiguous_dates=any(result["ambiguous_dates"] for result in files),
+        files=files
+    )
 
 @router.post("/bulk", response_model=List[BankTransactionOut])
 def create_bank_transactions(
     bank_transactions: List[BankTransactionCreate],
-    db: Session = Depends(get_db),
+    db: Session = Depends(database.get_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     db_bank_transactions = []
@@ -98,6 +104,11 @@ def create_bank_transactions(
         db.add(db_bank_transaction)
         db_bank_transactions.append(db_bank_transaction)
     
+    db.flush()
+    statements.assign_fingerprints(db, current_user.id, db_bank_transactions)
+    description_index.index_bank_transactions(db, db_bank_transactions)
+    candidates.refresh_bank_transactions(db, current_user.id, db_bank_transactions)
+    reports.invalidate(db, current_user.id)
     db.commit()
     for db_bank_transaction in db_bank_transactions:
         db.refresh(db_bank_transaction)
@@ -105,137 +116,102 @@ def create_bank_transactions(
     return db_bank_transactions
 
 @router.get("/", response_model=List[BankTransactionOut])
-def read_bank_transactions(
-    skip: int = 0,
-    limit: int = 100,
-    filter_type: Optional[str] = Query(None, description="Type of filter (date, month, week, year)"),
-    filter_value: Optional[str] = Query(None, description="Value for the filter"),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+async def read_bank_transactions(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    total: Optional[str] = Query(None, pattern="^(exact|estimate)$", description="Return X-Total-Count, counted or estimated"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging; use cursor"),
+    filters: ListingFilters = Depends(bank_transaction_filters),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    query = db.query(models.BankTransaction).filter(models.BankTransaction.owner_id == current_user.id)
-
-    if filter_type and filter_value:
-        if filter_type == "date":
-            try:
-                filter_date = datetime.strptime(filter_value, "%Y-%m-%d").date()
-                query = query.filter(models.BankTransaction.date == filter_date)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD.")
-        elif filter_type == "month":
-            try:
-                filter_month = datetime.strptime(filter_value, "%Y-%m").month
-                filter_year = datetime.strptime(filter_value, "%Y-%m").year
-                query = query.filter(
-                    extract('month', models.BankTransaction.date) == filter_month,
-                    extract('year', models.BankTransaction.date) == filter_year
-                )
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM.")
-        elif filter_type == "year":
-            try:
-                filter_year = int(filter_value)
-                query = query.filter(extract('year', models.BankTransaction.date) == filter_year)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid year format. Use YYYY.")
-        elif filter_type == "week":
-            try:
-                filter_year, filter_week = map(int, filter_value.split('-'))
-                # This is a basic week filter, for more robust week filtering, consider ISO week dates or date ranges.
-                # For simplicity, we'll check if the date falls within that week.
-                # A more precise implementation would calculate the start and end of the week.
-                start_of_week = date.fromisocalendar(filter_year, filter_week, 1)
-                end_of_week = date.fromisocalendar(filter_year, filter_week, 7)
-                query = query.filter(models.BankTransaction.date.between(start_of_week, end_of_week))
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid week format. Use YYYY-WW (e.g., 2023-01).")
-        else:
-            raise HTTPException(status_code=400, detail="Invalid filter_type. Must be date, month, week, or year.")
-
-    return query.offset(skip).limit(limit).all()
+    query = select(models.BankTransaction).filter(models.BankTransaction.owner_id == current_user.id, *filters.predicates)
+    rows = await cold_archive.listing_page(db, query, "bank_transactions", current_user.id, filters, cursor, limit, skip)
+    await set_page_headers(response, db, query, rows, limit, total,
+                           archived=lambda: cold_archive.listing_total(current_user.id, "bank_transactions", filters))
+    return rows
 
 @router.get("/{bank_transaction_id}", response_model=BankTransactionOut)
-def read_bank_transaction(bank_transaction_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def read_bank_transaction(bank_transaction_id: int, db: Session = Depends(database.get_read_db), current_user: models.User = Depends(auth.get_current_user)):
     bank_transaction = db.query(models.BankTransaction).filter(models.BankTransaction.id == bank_transaction_id, models.BankTransaction.owner_id == current_user.id).first()
+    if not bank_transaction:
+        bank_transaction = cold_archive.find_archived(current_user.id, "bank_transactions", bank_transaction_id)
     if not bank_transaction:
         raise HTTPException(status_code=404, detail="Bank transaction not found")
     return bank_transaction
 
+@router.post("/{bank_transaction_id}/restore", response_model=BankTransactionOut)
+def restore_bank_transaction(bank_transaction_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    """Move an archived bank transaction and its transaction back to the database, so they can be edited"""
+    transaction = cold_archive.restore_pair(db, current_user.id, bank_transaction_id=bank_transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Archived bank transaction not found")
+    return db.get(models.BankTransaction, bank_transaction_id)
+
 @router.put("/{bank_transaction_id}", response_model=BankTransactionOut)
-def update_bank_transaction(bank_transaction_id: int, bank_transaction: BankTransactionCreate, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def update_bank_transaction(bank_transaction_id: int, bank_transaction: BankTransactionCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_bank_transaction = db.query(models.BankTransaction).filter(models.BankTransaction.id == bank_transaction_id, models.BankTransaction.owner_id == current_user.id).first()
     if not db_bank_transaction:
         raise HTTPException(status_code=404, detail="Bank transaction not found")
     for key, value in bank_transaction.dict().items():
         setattr(db_bank_transaction, key, value)
+    statements.assign_fingerprints(db, current_user.id, [db_bank_transaction])
+    description_index.index_bank_transactions(db, [db_bank_transaction])
+    candidates.refresh_bank_transactions(db, current_user.id, [db_bank_transaction])
+    reports.invalidate(db, current_user.id)
     db.commit()
     db.refresh(db_bank_transaction)
     return db_bank_transaction
 
 @router.delete("/{bank_transaction_id}")
-def delete_bank_transaction(bank_transaction_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(auth.get_current_user)):
+def delete_bank_transaction(bank_transaction_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_bank_transaction = db.query(models.BankTransaction).filter(models.BankTransaction.id == bank_transaction_id, models.BankTransaction.owner_id == current_user.id).first()
     if not db_bank_transaction:
         raise HTTPException(status_code=404, detail="Bank transaction not found")
+    candidates.remove_bank_transactions(db, [db_bank_transaction.id])
+    description_index.remove_bank_transactions(db, [db_bank_transaction.id])
     db.delete(db_bank_transaction)
+    reports.invalidate(db, current_user.id)
     db.commit()
     return {"ok": True}
 
+def _report_job(db: Session, owner_id: int, fmt: str) -> JobOut:
+    payload = {"format": fmt}
+    job = jobs.find_active(db, owner_id, "unmatched_report", payload)
+    return jobs.describe(job) if job else submit_job(db, owner_id, "unmatched_report", payload)
+
 @router.get("/unmatched/report")
 async def generate_unmatched_report(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user)
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$", description="xlsx, or csv streamed as it is read"),
+    current_user: models.User = Depends(auth.get_current_user_async)
 ):
-    # Get unmatched bank transactions
-    unmatched_bank_transactions = db.query(models.BankTransaction).filter(
-        models.BankTransaction.owner_id == current_user.id,
-        models.BankTransaction.is_matched == False
-    ).all()
-    
-    # Get unmatched regular transactions
-    unmatched_transactions = db.query(models.Transaction).filter(
-        models.Transaction.owner_id == current_user.id,
-        models.Transaction.matched == False
-    ).all()
-    
-    # Create DataFrames
-    bank_df = pd.DataFrame([{
-        'Date': tx.date,
-        'Description': tx.description,
-        'Amount': tx.amount,
-        'Bank Name': tx.bank_name,
-        'Account Number': tx.account_number,
-        'Type': 'Bank Transaction'
-    } for tx in unmatched_bank_transactions])
-    
-    transaction_df = pd.DataFrame([{
-        'Date': tx.date,
-        'Description': tx.note or tx.category,
-        'Amount': tx.amount,
-        'Category': tx.category,
-        'Type': tx.type,
-        'Type': 'User Transaction'
-    } for tx in unmatched_transactions])
-    
-    # Create Excel writer
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"unmatched_transactions_{current_user.id}_{timestamp}.xlsx"
-    filepath = os.path.join("backend", "reports", filename)
-    os.makedirs(os.path.dirname(filepath), exist_ok=True)
-    
-    with pd.ExcelWriter(filepath) as writer:
-        bank_df.to_excel(writer, sheet_name='Unmatched Bank Transactions', index=False)
-        transaction_df.to_excel(writer, sheet_name='Unmatched User Transactions', index=False)
-        
-        # Add summary sheet
-        summary_data = {
-            'Metric': ['Total Unmatched Bank Transactions', 'Total Unmatched User Transactions'],
-            'Count': [len(unmatched_bank_transactions), len(unmatched_transactions)]
-        }
-        pd.DataFrame(summary_data).to_excel(writer, sheet_name='Summary', index=False)
+    """
+    The unmatched bank and user transactions. A report is built once per version of
+    the owner's data; downloading it again before anything changes serves the same file.
+    An xlsx report not built yet is queued as an unmatched_report job, returned with a 202.
+    """
+    if format == "csv":
+        version, filepath = await run_with_read_session(reports.cached_report, current_user.id, "csv")
+        if filepath is None:
+            filename = os.path.basename(reports.report_path(current_user.id, version, "csv"))
+            return StreamingResponse(
+                iterate_blocking(reports.stream_unmatched_csv(current_user.id, version)),
+                media_type=reports.MEDIA_TYPES["csv"],
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
+        filename = os.path.basename(filepath)
+    else:
+        # A workbook is built by a job; until it is cached, the response is that job (202),
+        # whose result is the file, and asking again waits for the same job
+        version, filepath = await run_with_read_session(reports.cached_report, current_user.id, "xlsx")
+        if filepath is None:
+            job = await run_with_session(_report_job, current_user.id, "xlsx")
+            return JSONResponse(status_code=202, content=job.model_dump(mode="json"))
+        filename = os.path.basename(filepath)
     
     return FileResponse(
         path=filepath,
         filename=filename,
-        media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        media_type=reports.MEDIA_TYPES[format]
     ) 
\ No newline at end of file
@@ -0,0 +1,135 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from typing import List, Optional
+import json
+import os
+import uuid
+from .. import models, database, auth, jobs, reports, statements
+from ..executor import run_blocking, run_with_session, run_with_read_session
+from ..schemas.job import JobOut
+from ..utils.bank_formats import check_date_format
+from ..utils.bank_parser import statement_reader, supported_extensions, save_upload, cleanup_upload
+
+router = APIRouter()
+
+def submit_job(db: Session, owner_id: int, kind: str, payload: dict) -> JobOut:
+    """Queue a job for a request; a full queue is a 429."""
+    try:
+        return jobs.describe(jobs.submit(db, owner_id, kind, payload))
+    except jobs.JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+async def queue_statement_import(file: UploadFile, owner_id: int, bank_name: str, account_number: str,
+                                 date_format: Optional[str], decimal_separator: Optional[str]) -> JobOut:
+    """
+    Save an uploaded statement and queue its import as a bank_import job. The first
+    lines are parsed before it is queued, so a statement the job would reject is a
+    400 right away; the file is removed unless the job took it.
+    """
+    if statement_reader(file.filename) is None:
+        raise HTTPException(status_code=400, detail=f"Only {', '.join(supported_extensions())} files are allowed")
+    try:
+        if date_format:
+            check_date_format(date_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # The file outlives the request; the job removes it when it ends
+    upload_dir = os.path.join("backend", "uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    # The extension is kept; it tells the job which reader to use
+    extension = os.path.splitext(file.filename)[1].lower()
+    file_path = os.path.join(upload_dir, f"{owner_id}_{uuid.uuid4().hex}{extension}")
+    queued = False
+    try:
+        await run_blocking(save_upload, file.file, file_path)
+        await run_with_read_session(statements.check_statement, owner_id, file_path, bank_name,
+                                    date_format=date_format, decimal=decimal_separator)
+        job = await run_with_session(submit_job, owner_id, "bank_import", {
+            "file_path": file_path,
+            "bank_name": bank_name,
+            "account_number": account_number,
+            "date_format": date_format,
+            "decimal_separator": decimal_separator
+        })
+        queued = True
+        return job
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if not queued:
+            cleanup_upload(file_path)
+
+def _get_job(db: Session, job_id: str, owner_id: int) -> models.Job:
+    job = db.query(models.Job).filter(models.Job.id == job_id, models.Job.owner_id == owner_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/match", response_model=JobOut, status_code=202)
+def submit_match(
+    time_window_days: int = Query(0, ge=0, description="Days to look before and after each transaction date"),
+    amount_tolerance: float = Query(0.0, ge=0, description="Relative amount tolerance (0.01 means 1%)"),
+    backend: Optional[str] = Query(None, pattern="^(python|sql)$", description="Matching engine (default: the configured one)"),
+    strategy: str = Query("greedy", pattern="^(greedy|optimal)$", description="greedy: closest date and amount first; optimal: highest total similarity, one to one"),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    return submit_job(db, current_user.id, "match", {
+        "time_window_days": time_window_days,
+        "amount_tolerance": amount_tolerance,
+        "backend": backend,
+        "strategy": strategy
+    })
+
+@router.post("/bank-import", response_model=JobOut, status_code=202)
+async def submit_bank_import(
+    file: UploadFile = File(...),
+    bank_name: str = Form(...),
+    account_number: str = Form(...),
+    date_format: Optional[str] = Form(None, description="strptime format of the statement dates, e.g. %d/%m/%Y, when they would be read wrongly"),
+    decimal_separator: Optional[str] = Form(None, pattern="^[.,]$", description="Decimal point of the amounts, . or ,, when they would be read wrongly"),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    return await queue_statement_import(file, current_user.id, bank_name, account_number, date_format, decimal_separator)
+
+@router.post("/unmatched-report", response_model=JobOut, status_code=202)
+def submit_unmatched_report(
+    format: str = Query("xlsx", pattern="^(xlsx|csv)$", description="xlsx or csv"),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    return submit_job(db, current_user.id, "unmatched_report", {"format": format})
+
+@router.get("/", response_model=List[JobOut])
+def read_jobs(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    job_list = db.query(models.Job).filter(models.Job.owner_id == current_user.id).order_by(models.Job.created_at.desc()).all()
+    return [jobs.describe(job) for job in job_list]
+
+@router.get("/{job_id}", response_model=JobOut)
+def read_job(job_id: str, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    return jobs.describe(_get_job(db, job_id, current_user.id))
+
+@router.post("/{job_id}/cancel", response_model=JobOut)
+def cancel_job(job_id: str, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    job = _get_job(db, job_id, current_user.id)
+    return jobs.describe(jobs.cancel(db, job))
+
+@router.get("/{job_id}/result")
+def read_job_result(job_id: str, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    job = _get_job(db, job_id, current_user.id)
+    if job.status != models.JobStatus.succeeded:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status.value}")
+    
+    result = json.loads(job.result)
+    if job.kind == "unmatched_report":
+        # Reports are evicted from the cache after a while, or once the data they show changes
+        if not os.path.exists(result["path"]):
+            raise HTTPException(status_code=410, detail="Report file is no longer available")
+        return FileResponse(
+            path=result["path"],
+            filename=result["filename"],
+            media_type=result.get("media_type", reports.MEDIA_TYPES["xlsx"])
+        )
+    return result
@@ -1,49 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, database, auth, matching
-from ..schemas.matching import MatchCreate, MatchOut
+from typing import List, Dict, Optional
+from .. import models, database, auth, matching, candidates, description_index, reports, rollups
+from ..schemas.job import JobOut
+from ..schemas.matching import MatchCreate, MatchOut, MatchCandidateOut, PotentialMatchBatchRequest, BulkMatchRequest, BulkMatchResult, MatchConflict
+from .jobs import submit_job
 
 router = APIRouter()
 
-@router.post("/match", response_model=List[MatchOut])
-def match_transactions(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    # Get all unmatched transactions
-    transactions = db.query(models.Transaction).filter(
-        models.Transaction.owner_id == current_user.id,
-        models.Transaction.bank_transaction_id == None
-    ).all()
-    
-    # Get all unmatched bank transactions
-    bank_transactions = db.query(models.BankTransaction).filter(
-        models.BankTransaction.owner_id == current_user.id,
-        models.BankTransaction.transaction_id == None
-    ).all()
-    
-    # Find matches
-    matches = matching.find_matches(transactions, bank_transactions)
-    
-    # Create match records
-    match_records = []
-    for transaction, bank_transaction in matches:
-        match_record = models.Match(
-            transaction_id=transaction.id,
-            bank_transaction_id=bank_transaction.id,
-            match_date=bank_transaction.date,
-            match_amount=bank_transaction.amount,
-            owner_id=current_user.id
-        )
-        db.add(match_record)
-        match_records.append(match_record)
-    
-    db.commit()
-    for match_record in match_records:
-        db.refresh(match_record)
-    
-    return match_records
+@router.post("/match", response_model=JobOut, status_code=202)
+def match_transactions(
+    time_window_days: int = Query(0, ge=0, description="Days to look before and after each transaction date"),
+    amount_tolerance: float = Query(0.0, ge=0, description="Relative amount tolerance (0.01 means 1%)"),
+    backend: Optional[str] = Query(None, pattern="^(python|sql)$", description="Matching engine (default: the configured one)"),
+    strategy: str = Query("greedy", pattern="^(greedy|optimal)$", description="greedy: closest date and amount first; optimal: highest total similarity, one to one"),
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """
+    Queue a matching run, as POST /api/jobs/match does; the IDs of the proposed
+    matches are the job's result, and the matches are listed by GET /matches.
+    """
+    return submit_job(db, current_user.id, "match", {
+        "time_window_days": time_window_days,
+        "amount_tolerance": amount_tolerance,
+        "backend": backend,
+        "strategy": strategy
+    })
 
 @router.get("/matches", response_model=List[MatchOut])
-def get_matches(db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def get_matches(db: Session = Depends(database.get_read_db), current_user: models.User = Depends(auth.get_current_user)):
     return db.query(models.Match).filter(models.Match.owner_id == current_user.id).all()
 
 @router.post("/matches/{match_id}/confirm")
@@ -54,11 +40,19 @@ def confirm_match(match_id: int, db: Session = Depends(database.get_db), current
     
     # Update transaction with bank transaction reference
     transaction = db.query(models.Transaction).filter(models.Transaction.id == match.transaction_id).first()
+    before = rollups.snapshot(transaction)
     transaction.bank_transaction_id = match.bank_transaction_id
+    transaction.matched = True
+    rollups.track(db, current_user.id, removed=[before], added=[rollups.snapshot(transaction)])
     
     # Update bank transaction with transaction reference
     bank_transaction = db.query(models.BankTransaction).filter(models.BankTransaction.id == match.bank_transaction_id).first()
     bank_transaction.transaction_id = match.transaction_id
+    bank_transaction.is_matched = True
+    reports.invalidate(db, current_user.id)
+    
+    # Neither side is a candidate for anything else any more
+    candidates.remove_matched(db, match.transaction_id, match.bank_transaction_id)
     
     # Delete the match record
     db.delete(match)
@@ -66,6 +60,38 @@ def confirm_match(match_id: int, db: Session = Depends(database.get_db), current
     db.commit()
     return {"ok": True}
 
+def _bulk_result(match_ids: List[int], conflicts) -> BulkMatchResult:
+    return BulkMatchResult(
+        match_ids=match_ids,
+        conflicts=[MatchConflict(match_id=match_id, reason=reason) for match_id, reason in conflicts]
+    )
+
+@router.post("/matches/confirm", response_model=BulkMatchResult)
+def confirm_matches(
+    request: BulkMatchRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Confirm many matches at once; conflicting ones are reported and skipped"""
+    if request.match_ids is None and request.min_score is None:
+        raise HTTPException(status_code=400, detail="Provide match_ids or min_score")
+    
+    confirmed, conflicts = matching.confirm_matches(db, current_user.id, request.match_ids, request.min_score)
+    return _bulk_result(confirmed, conflicts)
+
+@router.post("/matches/reject", response_model=BulkMatchResult)
+def reject_matches(
+    request: BulkMatchRequest,
+    db: Session = Depends(database.get_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Discard many matches at once"""
+    if request.match_ids is None and request.min_score is None:
+        raise HTTPException(status_code=400, detail="Provide match_ids or min_score")
+    
+    rejected, conflicts = matching.reject_matches(db, current_user.id, request.match_ids, request.min_score)
+    return _bulk_result(rejected, conflicts)
+
 @router.delete("/matches/{match_id}")
 def delete_match(match_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     match = db.query(models.Match).filter(models.Match.id == match_id, models.Match.owner_id == current_user.id).first()
@@ -81,7 +107,7 @@ def get_potential_matches(
     transaction_id: int,
     time_window_days: int = 1,
     amount_tolerance: float = 0.01,
-    db: Session = Depends(database.get_db),
+    db: Session = Depends(database.get_read_db),
     current_user: models.User = Depends(auth.get_current_user)
 ):
     # Get the transaction
@@ -117,6 +143,95 @@ def get_potential_matches(
     
     return matches
 
+@router.post("/potential/batch", response_model=Dict[int, List[MatchOut]])
+def get_potential_matches_batch(
+    request: PotentialMatchBatchRequest,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Potential matches for many transactions at once, grouped by transaction and ranked"""
+    if request.transaction_ids is None and request.date_from is None and request.date_to is None:
+        raise HTTPException(status_code=400, detail="Provide transaction_ids or a date range")
+    
+    grouped = matching.find_potential_matches_batch(
+        db,
+        current_user.id,
+        transaction_ids=request.transaction_ids,
+        date_from=request.date_from,
+        date_to=request.date_to,
+        time_window_days=request.time_window_days,
+        amount_tolerance=request.amount_tolerance,
+        limit=request.limit_per_transaction
+    )
+    
+    return {
+        transaction_id: [
+            MatchOut(
+                id=0,  # This is a potential match, not a confirmed one
+                transaction_id=transaction_id,
+                bank_transaction_id=bank_transaction.id,
+                match_date=bank_transaction.date,
+                match_amount=bank_transaction.amount,
+                owner_id=current_user.id,
+                is_confirmed=False
+            )
+            for bank_transaction in bank_transactions
+        ]
+        for transaction_id, bank_transactions in grouped.items()
+    }
+
+@router.get("/candidates", response_model=List[MatchCandidateOut])
+def get_candidates(
+    min_score: float = 0.0,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Precomputed candidate pairs, best first within each transaction"""
+    return db.query(models.MatchCandidate).filter(
+        models.MatchCandidate.owner_id == current_user.id,
+        models.MatchCandidate.score >= min_score
+    ).order_by(models.MatchCandidate.transaction_id, models.MatchCandidate.score.desc()).all()
+
+@router.get("/candidates/{transaction_id}", response_model=List[MatchCandidateOut])
+def get_transaction_candidates(
+    transaction_id: int,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    return db.query(models.MatchCandidate).filter(
+        models.MatchCandidate.owner_id == current_user.id,
+        models.MatchCandidate.transaction_id == transaction_id
+    ).order_by(models.MatchCandidate.score.desc()).all()
+
+@router.get("/similar/{transaction_id}", response_model=List[MatchCandidateOut])
+def get_similar_descriptions(
+    transaction_id: int,
+    min_score: float = 0.3,
+    limit: int = 20,
+    db: Session = Depends(database.get_read_db),
+    current_user: models.User = Depends(auth.get_current_user)
+):
+    """Bank transactions whose description resembles the transaction note, by shared n-grams"""
+    transaction = db.query(models.Transaction).filter(
+        models.Transaction.id == transaction_id,
+        models.Transaction.owner_id == current_user.id
+    ).first()
+    
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    
+    hits = description_index.search(
+        db,
+        current_user.id,
+        transaction.note or transaction.category,
+        min_score=min_score,
+        limit=limit
+    )
+    return [
+        MatchCandidateOut(transaction_id=transaction.id, bank_transaction_id=bank_transaction_id, score=score)
+        for bank_transaction_id, score in hits
+    ]
+
 @router.post("/confirm", response_model=MatchOut)
 def confirm_match(
     match: MatchCreate,
@@ -1,8 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from datetime import date
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from .. import models, database, auth
-from ..schemas.transaction import TransactionBase, TransactionCreate, TransactionOut
+from typing import List, Optional
+from .. import models, database, auth, candidates, cold_archive, reports, rollups
+from ..filters import ListingFilters, transaction_filters
+from ..pagination import set_page_headers
+from ..schemas.transaction import TransactionBase, TransactionCreate, TransactionOut, MonthlySummary, CategorySummary
+from ..utils.money import from_cents
 
 router = APIRouter()
 
@@ -10,28 +16,113 @@ router = APIRouter()
 def create_transaction(transaction: TransactionCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_transaction = models.Transaction(**transaction.dict(), owner_id=current_user.id)
     db.add(db_transaction)
+    db.flush()
+    candidates.refresh_transaction(db, db_transaction)
+    rollups.track(db, current_user.id, added=[rollups.snapshot(db_transaction)])
+    reports.invalidate(db, current_user.id)
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
 
 @router.get("/", response_model=List[TransactionOut])
-def read_transactions(skip: int = 0, limit: int = 100, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
-    return db.query(models.Transaction).filter(models.Transaction.owner_id == current_user.id).offset(skip).limit(limit).all()
+async def read_transactions(
+    response: Response,
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor of the previous page"),
+    limit: int = Query(100, ge=1, le=1000),
+    total: Optional[str] = Query(None, pattern="^(exact|estimate)$", description="Return X-Total-Count, counted or estimated"),
+    skip: int = Query(0, ge=0, deprecated=True, description="Offset paging; use cursor"),
+    filters: ListingFilters = Depends(transaction_filters),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    """Transactions newest first, a page at a time; X-Next-Cursor is set while more pages follow."""
+    query = select(models.Transaction).filter(models.Transaction.owner_id == current_user.id, *filters.predicates)
+    rows = await cold_archive.listing_page(db, query, "transactions", current_user.id, filters, cursor, limit, skip)
+    await set_page_headers(response, db, query, rows, limit, total,
+                           archived=lambda: cold_archive.listing_total(current_user.id, "transactions", filters))
+    return rows
+
+def _rollups_in(owner_id: int, from_month: Optional[str], to_month: Optional[str]):
+    R = models.MonthlyRollup
+    conditions = [R.owner_id == owner_id]
+    if from_month:
+        conditions.append(R.month >= date.fromisoformat(f"{from_month}-01"))
+    if to_month:
+        conditions.append(R.month <= date.fromisoformat(f"{to_month}-01"))
+    return conditions
+
+MONTH_PATTERN = r"^\d{4}-(0[1-9]|1[0-2])$"
+
+@router.get("/summary/monthly", response_model=List[MonthlySummary])
+async def monthly_summary(
+    from_month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="First month, YYYY-MM"),
+    to_month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="Last month, YYYY-MM, inclusive"),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    """Income, expense and reconciliation per month, from the monthly rollups"""
+    R = models.MonthlyRollup
+    result = await db.execute(select(
+        R.month,
+        func.sum(case((R.type == models.TransactionType.income.value, R.amount_cents), else_=0)),
+        func.sum(case((R.type == models.TransactionType.expense.value, R.amount_cents), else_=0)),
+        func.sum(R.count),
+        func.sum(case((R.matched == True, R.count), else_=0))
+    ).filter(*_rollups_in(current_user.id, from_month, to_month)).group_by(R.month).order_by(R.month))
+    return [
+        MonthlySummary(month=month, income=from_cents(income), expense=from_cents(expense), count=count, matched_count=matched_count)
+        for month, income, expense, count, matched_count in result
+    ]
+
+@router.get("/summary/categories", response_model=List[CategorySummary])
+async def category_summary(
+    from_month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="First month, YYYY-MM"),
+    to_month: Optional[str] = Query(None, pattern=MONTH_PATTERN, description="Last month, YYYY-MM, inclusive"),
+    db: AsyncSession = Depends(database.get_async_read_db),
+    current_user: models.User = Depends(auth.get_current_user_async)
+):
+    """Totals per category and type over a range of months, from the monthly rollups"""
+    R = models.MonthlyRollup
+    result = await db.execute(select(
+        R.category,
+        R.type,
+        func.sum(R.amount_cents),
+        func.sum(R.count),
+        func.sum(case((R.matched == True, R.count), else_=0))
+    ).filter(*_rollups_in(current_user.id, from_month, to_month)).group_by(R.category, R.type).order_by(R.category, R.type))
+    return [
+        CategorySummary(category=category, type=kind, amount=from_cents(amount), count=count, matched_count=matched_count)
+        for category, kind, amount, count, matched_count in result
+    ]
 
 @router.get("/{transaction_id}", response_model=TransactionOut)
-def read_transaction(transaction_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+def read_transaction(transaction_id: int, db: Session = Depends(database.get_read_db), current_user: models.User = Depends(auth.get_current_user)):
     transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id, models.Transaction.owner_id == current_user.id).first()
+    if not transaction:
+        transaction = cold_archive.find_archived(current_user.id, "transactions", transaction_id)
     if not transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
     return transaction
 
+@router.post("/{transaction_id}/restore", response_model=TransactionOut)
+def restore_transaction(transaction_id: int, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
+    """Move an archived transaction and its bank transaction back to the database, so they can be edited"""
+    transaction = cold_archive.restore_pair(db, current_user.id, transaction_id=transaction_id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Archived transaction not found")
+    return transaction
+
 @router.put("/{transaction_id}", response_model=TransactionOut)
 def update_transaction(transaction_id: int, transaction: TransactionCreate, db: Session = Depends(database.get_db), current_user: models.User = Depends(auth.get_current_user)):
     db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id, models.Transaction.owner_id == current_user.id).first()
     if not db_transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    before = rollups.snapshot(db_transaction)
     for key, value in transaction.dict().items():
         setattr(db_transaction, key, value)
+    candidates.refresh_transaction(db, db_transaction)
+    rollups.track(db, current_user.id, removed=[before], added=[rollups.snapshot(db_transaction)])
+    reports.invalidate(db, current_user.id)
     db.commit()
     db.refresh(db_transaction)
     return db_transaction
@@ -41,6 +132,9 @@ def delete_transaction(transaction_id: int, db: Session = Depends(database.get_d
     db_transaction = db.query(models.Transaction).filter(models.Transaction.id == transaction_id, models.Transaction.owner_id == current_user.id).first()
     if not db_transaction:
         raise HTTPException(status_code=404, detail="Transaction not found")
+    candidates.remove_transaction(db, db_transaction.id)
+    rollups.track(db, current_user.id, removed=[rollups.snapshot(db_transaction)])
     db.delete(db_transaction)
+    reports.invalidate(db, current_user.id)
     db.commit()
     return {"ok": True}
\ No newline at end of file
@@ -1,8 +1,9 @@
 from .transaction import TransactionBase, TransactionCreate, TransactionOut
-from .bank_transaction import BankTransactionBase, BankTransactionCreate, BankTransactionOut
-from .matching import MatchCreate, MatchOut
+from .bank_transaction import BankTransactionBase, BankTransactionCreate, BankTransactionOut, BankImportResult, ArchiveFileResult, ArchiveImportResult
+from .matching import MatchCreate, MatchOut, MatchCandidateOut, PotentialMatchBatchRequest, BulkMatchRequest, MatchConflict, BulkMatchResult
 from .auth import Token, TokenData
 from .user import UserBase, UserCreate, UserOut
+from .job import JobOut
 
 # Update forward references
 TransactionOut.model_rebuild()
@@ -7,6 +7,9 @@ class BankTransaction(BaseModel):
     description: str
     amount: float
 
+class BankMatchLine(BankTransaction):
+    matched: bool
+
 class BankMatchResult(BaseModel):
     matched: List[BankTransaction]
     unmatched: List[BankTransaction]
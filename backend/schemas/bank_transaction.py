@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class BankTransactionBase(BaseModel):
     date: datetime
@@ -19,4 +19,31 @@ class BankTransactionOut(BankTransactionBase):
     is_matched: bool = False
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class BankImportResult(BaseModel):
+    inserted: int
+    duplicates: int
+    # The date format the statement was read with, and whether its dates also read
+    # another way (settled by date_format or the bank's earlier statements)
+    date_format_used: Optional[str] = None
+    ambiguous_dates: bool = False
+
+class ArchiveFileResult(BaseModel):
+    file: str
+    bank_name: Optional[str] = None
+    account_number: Optional[str] = None
+    inserted: int = 0
+    duplicates: int = 0
+    error: Optional[str] = None
+    date_format_used: Optional[str] = None
+    ambiguous_dates: bool = False
+
+class ArchiveImportResult(BaseModel):
+    inserted: int
+    duplicates: int
+    # The date format shared by every imported file (None when they differ), and
+    # whether any file's dates also read another way
+    date_format_used: Optional[str] = None
+    ambiguous_dates: bool = False
+    files: List[ArchiveFileResult]
\ No newline at end of file
@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime, date
 
 class MatchCreate(BaseModel):
     transaction_id: int
@@ -11,7 +11,36 @@ class MatchCreate(BaseModel):
 class MatchOut(MatchCreate):
     id: int
     owner_id: int
+    score: Optional[float] = None
     is_confirmed: bool = False
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+class MatchCandidateOut(BaseModel):
+    transaction_id: int
+    bank_transaction_id: int
+    score: float
+
+    class Config:
+        from_attributes = True
+
+class PotentialMatchBatchRequest(BaseModel):
+    transaction_ids: Optional[List[int]] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    time_window_days: int = Field(1, ge=0)
+    amount_tolerance: float = Field(0.01, ge=0)
+    limit_per_transaction: Optional[int] = Field(None, ge=1)
+
+class BulkMatchRequest(BaseModel):
+    match_ids: Optional[List[int]] = None
+    min_score: Optional[float] = Field(None, ge=0, le=1)
+
+class MatchConflict(BaseModel):
+    match_id: int
+    reason: str
+
+class BulkMatchResult(BaseModel):
+    match_ids: List[int]
+    conflicts: List[MatchConflict]
\ No newline at end of file
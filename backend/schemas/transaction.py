@@ -25,4 +25,17 @@ class TransactionOut(TransactionBase):
     matched: bool = False
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True 
+class MonthlySummary(BaseModel):
+    month: date
+    income: float
+    expense: float
+    count: int
+    matched_count: int
+
+class CategorySummary(BaseModel):
+    category: str
+    type: TransactionType
+    amount: float
+    count: int
+    matched_count: int
@@ -0,0 +1,151 @@
+"""
+Matching engine that runs inside the database.
+
+Pairs are chosen and written with INSERT ... SELECT into matches, so the owner's
+rows never leave the database. Results are the same as matching.find_matches:
+
+- exact mode ranks the rows sharing a (date, amount_cents) on each side by id
+  and pairs them up by that rank;
+- tolerance mode repeatedly inserts the pairs that are each other's closest
+  candidate (day difference, then amount difference, then id). Every round is the
+  next step of the Python engine's greedy, so a few rounds reach the same result.
+"""
+from datetime import date
+from typing import List, Optional
+from sqlalchemy import select, insert, and_, func, exists, literal, case
+from sqlalchemy.orm import Session
+from . import models
+from .utils.sql import date_shift, days_between
+from .utils.matching import DATE_WINDOW_DAYS
+
+T = models.Transaction
+B = models.BankTransaction
+M = models.Match
+
+_MATCH_COLUMNS = ["transaction_id", "bank_transaction_id", "match_date", "match_amount_cents", "score", "owner_id"]
+
+def _score(day_diff, amount_diff_cents):
+    # Same formula as matching.match_score
+    amount_factor = case((amount_diff_cents == 0, 1.0), else_=0.0)
+    date_factor = case((day_diff <= DATE_WINDOW_DAYS, 1.0 - day_diff / float(DATE_WINDOW_DAYS)), else_=0.0)
+    return (amount_factor + date_factor) / 2
+
+def _unmatched_transactions(owner_id: int, date_from: Optional[date], date_to: Optional[date]):
+    conditions = [
+        T.owner_id == owner_id,
+        T.bank_transaction_id == None,
+        ~exists().where(M.transaction_id == T.id)
+    ]
+    if date_from is not None:
+        conditions.append(T.date >= date_from)
+    if date_to is not None:
+        conditions.append(T.date <= date_to)
+    return conditions
+
+def _unmatched_bank_transactions(owner_id: int, date_from: Optional[date], date_to: Optional[date]):
+    conditions = [
+        B.owner_id == owner_id,
+        B.transaction_id == None,
+        ~exists().where(M.bank_transaction_id == B.id)
+    ]
+    if date_from is not None:
+        conditions.append(B.date >= date_from)
+    if date_to is not None:
+        conditions.append(B.date <= date_to)
+    return conditions
+
+def _exact_pairs(owner_id: int, date_from: Optional[date], date_to: Optional[date]):
+    # Every (date, amount_cents) group is joined with itself across the two sides, which
+    # is small; the k-th transaction of a group takes its k-th bank transaction
+    group = (T.date, T.amount_cents)
+    pairs = select(
+        T.id.label("transaction_id"),
+        B.id.label("bank_transaction_id"),
+        B.date,
+        B.amount_cents,
+        func.dense_rank().over(partition_by=group, order_by=T.id).label("transaction_rank"),
+        func.dense_rank().over(partition_by=group, order_by=B.id).label("bank_rank")
+    ).join_from(T, B, and_(
+        B.owner_id == T.owner_id,
+        B.date == T.date,
+        B.amount_cents == T.amount_cents
+    )).where(
+        *_unmatched_transactions(owner_id, date_from, date_to),
+        *_unmatched_bank_transactions(owner_id, date_from, date_to)
+    ).subquery()
+
+    return select(
+        pairs.c.transaction_id,
+        pairs.c.bank_transaction_id,
+        pairs.c.date,
+        pairs.c.amount_cents,
+        literal(1.0),
+        literal(owner_id)
+    ).where(pairs.c.transaction_rank == pairs.c.bank_rank)
+
+def _closest_pairs(owner_id: int, time_window_days: int, amount_tolerance: float,
+                   date_from: Optional[date], date_to: Optional[date]):
+    day_diff = func.abs(days_between(B.date, T.date))
+    amount_diff = func.abs(B.amount_cents - T.amount_cents)
+    candidates = select(
+        T.id.label("transaction_id"),
+        B.id.label("bank_transaction_id"),
+        B.date,
+        B.amount_cents,
+        _score(day_diff, amount_diff).label("score"),
+        func.row_number().over(partition_by=T.id, order_by=(day_diff, amount_diff, B.id)).label("transaction_rank"),
+        func.row_number().over(partition_by=B.id, order_by=(day_diff, amount_diff, T.id)).label("bank_rank")
+    ).join_from(T, B, and_(
+        B.owner_id == T.owner_id,
+        B.date.between(date_shift(T.date, -time_window_days), date_shift(T.date, time_window_days)),
+        amount_diff <= func.abs(T.amount_cents) * amount_tolerance
+    )).where(
+        *_unmatched_transactions(owner_id, date_from, date_to),
+        *_unmatched_bank_transactions(owner_id, date_from, date_to)
+    ).subquery()
+
+    return select(
+        candidates.c.transaction_id,
+        candidates.c.bank_transaction_id,
+        candidates.c.date,
+        candidates.c.amount_cents,
+        candidates.c.score,
+        literal(owner_id)
+    ).where(candidates.c.transaction_rank == 1, candidates.c.bank_rank == 1)
+
+def _insert_pairs(db: Session, pairs) -> List[int]:
+    statement = insert(M).from_select(_MATCH_COLUMNS, pairs).returning(M.id)
+    return [match_id for match_id, in db.execute(statement)]
+
+def count_unmatched(db: Session, owner_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+    """Number of transactions and bank transactions insert_matches would consider."""
+    transactions = db.scalar(select(func.count(T.id)).where(*_unmatched_transactions(owner_id, date_from, date_to)))
+    bank_transactions = db.scalar(select(func.count(B.id)).where(*_unmatched_bank_transactions(owner_id, date_from, date_to)))
+    return transactions + bank_transactions
+
+def insert_matches(db: Session, owner_id: int, time_window_days: int = 0, amount_tolerance: float = 0.0,
+                   date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[int]:
+    """
+    Write Match records for the owner's unmatched transactions and bank transactions.
+    Rows that already have a pending Match record are left alone. The caller commits.
+    
+    Args:
+        db: Database session
+        owner_id: ID of the owner
+        time_window_days: Number of days to look before and after the transaction date
+        amount_tolerance: Tolerance for amount matching (0.01 means 1% difference allowed)
+        date_from: Only rows on or after this date
+        date_to: Only rows on or before this date
+    
+    Returns:
+        IDs of the created Match records
+    """
+    if time_window_days == 0 and amount_tolerance == 0:
+        return _insert_pairs(db, _exact_pairs(owner_id, date_from, date_to))
+
+    match_ids = []
+    while True:
+        inserted = _insert_pairs(db, _closest_pairs(owner_id, time_window_days, amount_tolerance, date_from, date_to))
+        if not inserted:
+            return match_ids
+        match_ids.extend(inserted)
@@ -0,0 +1,422 @@
+"""
+Imports of bank statements, and the fingerprints that keep them from storing a line twice.
+
+Every bank transaction carries a fingerprint of its account, date, amount,
+normalized description and ordinal (see utils.fingerprint), unique per owner.
+Imports insert with ON CONFLICT DO NOTHING on it, so lines already stored, by
+an earlier statement or a concurrent import, are counted as duplicates. Rows
+entered or edited by hand take the lowest ordinal still free for their line.
+
+Each owner's statements are read with the format profile (see
+utils.bank_formats) stored for their bank and header, and the profile an
+import detected or corrected is stored for the next one.
+
+Imports store rows only; their description grams and match candidates are
+written afterwards by index_pending(), which the API queues as a job, so a long
+statement is stored in seconds and indexed in the background.
+
+index_pending() also indexes rows an interrupted job left behind, and
+fingerprint_existing() recomputes the fingerprints of an owner's stored rows,
+for rows written before every row had one:
+
+    python -m backend.statements index --users 1,2
+    python -m backend.statements fingerprint --users 1,2
+"""
+import argparse
+import json
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, wait
+from dataclasses import asdict, fields
+from datetime import date, datetime
+from typing import List, Dict, Callable, Iterable, Iterator, Optional, Tuple, Union, BinaryIO
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.orm import Session
+from . import models, database, candidates, cold_archive, description_index, reports
+from .executor import process_pool, process_workers
+from .utils import archive
+from .utils.bank_formats import FormatProfile
+from .utils.bank_parser import Profiles, iter_statement
+from .utils.descriptions import normalize_description
+from .utils.fingerprint import bank_fingerprint, statement_fingerprints
+from .utils.sql import dialect_insert
+
+# Rows parsed and inserted at a time; progress is reported after each chunk
+IMPORT_BATCH_SIZE = 5000
+
+# Unindexed rows taken at a time by index_pending(), each batch in its own transaction
+INDEX_BATCH_SIZE = 5000
+
+# Columns of unindexed rows read by index_pending(), enough for the description index and candidate scoring
+_INDEXED_COLUMNS = (
+    models.BankTransaction.id,
+    models.BankTransaction.date,
+    models.BankTransaction.amount_cents,
+    models.BankTransaction.description,
+    models.BankTransaction.normalized_description,
+    models.BankTransaction.owner_id,
+    models.BankTransaction.is_matched,
+    models.BankTransaction.transaction_id,
+)
+
+# Ordinals looked up at a time when searching for the lowest free one
+_ORDINAL_BATCH = 8
+
+# Columns of statement_profiles that hold a FormatProfile
+_PROFILE_FIELDS = [field.name for field in fields(FormatProfile)]
+
+def format_profiles(db: Session, owner_id: int, bank_name: Optional[str]) -> Profiles:
+    """The format profiles stored for the owner's statements of a bank, by header."""
+    P = models.StatementProfile
+    if bank_name is None:
+        return {}
+    return {
+        tuple(json.loads(row.header)): FormatProfile(**{name: getattr(row, name) for name in _PROFILE_FIELDS})
+        for row in db.execute(select(P).where(P.owner_id == owner_id, P.bank_name == bank_name)).scalars()
+    }
+
+def store_profiles(db: Session, owner_id: int, bank_name: str, profiles: Profiles, stored: Profiles):
+    """Store the profiles that are new or differ from stored, as read by format_profiles(); the caller commits."""
+    table = models.StatementProfile.__table__
+    rows = [
+        {"owner_id": owner_id, "bank_name": bank_name, "header": json.dumps(list(header)),
+         "updated_at": datetime.utcnow(), **asdict(profile)}
+        for header, profile in profiles.items() if stored.get(header) != profile
+    ]
+    if rows:
+        # A concurrent import of the same bank may have stored one meanwhile; the later one wins
+        statement = dialect_insert(db, table)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=["owner_id", "bank_name", "header"],
+            set_={name: statement.excluded[name] for name in _PROFILE_FIELDS + ["updated_at"]}
+        ), rows)
+
+def _line_fingerprints(owner_id: int, account_number: str, day: date, amount_cents: int, normalized: str,
+                       first: int, count: int) -> List[str]:
+    return [bank_fingerprint(owner_id, account_number, day, amount_cents, normalized, ordinal)
+            for ordinal in range(first, first + count)]
+
+def assign_fingerprints(db: Session, owner_id: int, bank_transactions: List[models.BankTransaction]):
+    """
+    Give bank transactions entered or edited by hand the fingerprint of their line
+    with the lowest ordinal no other row, stored or archived, holds. The caller commits.
+    """
+    B = models.BankTransaction
+    db.flush()
+    taken = set()
+    for bank_transaction in bank_transactions:
+        # The API hands dates over as datetimes
+        day = bank_transaction.date.date() if isinstance(bank_transaction.date, datetime) else bank_transaction.date
+        first = 0
+        while True:
+            fingerprints = _line_fingerprints(
+                owner_id, bank_transaction.account_number, day, bank_transaction.amount_cents,
+                bank_transaction.normalized_description, first, _ORDINAL_BATCH
+            )
+            used = taken | set(db.execute(select(B.fingerprint).where(
+                B.owner_id == owner_id, B.fingerprint.in_(fingerprints), B.id != bank_transaction.id
+            )).scalars())
+            used |= cold_archive.archived_fingerprints(owner_id, set(fingerprints) - used, [day])
+            free = next((fingerprint for fingerprint in fingerprints if fingerprint not in used), None)
+            if free:
+                break
+            first += _ORDINAL_BATCH
+        bank_transaction.fingerprint = free
+        taken.add(free)
+    db.flush()
+
+def _insert_statement(db: Session, owner_id: int, chunks: Iterable[List[Dict]], bank_name: str, account_number: str,
+                      progress: Optional[Callable[[int, Optional[int]], None]] = None) -> Tuple[List[int], int]:
+    """
+    Insert the parsed chunks of one statement, skipping rows stored before: the
+    fingerprints of archived rows are looked up, those of stored rows conflict.
+    Rows are stored unindexed (gram_count NULL) for index_pending().
+    Returns (IDs of the stored rows, duplicates skipped); the caller commits.
+    """
+    table = models.BankTransaction.__table__
+    bank_transaction_ids = []
+    duplicates = 0
+    read = 0
+    seen = Counter()
+    for chunk in chunks:
+        read += len(chunk)
+        normalized = [normalize_description(tx['description']) for tx in chunk]
+        fingerprints = statement_fingerprints(owner_id, account_number, chunk, seen, normalized)
+        # Rows of archived months may have moved out of the table
+        existing = cold_archive.archived_fingerprints(owner_id, set(fingerprints), (tx['date'] for tx in chunk))
+
+        rows = []
+        for tx, normalized_description, fingerprint in zip(chunk, normalized, fingerprints):
+            if fingerprint in existing:
+                duplicates += 1
+                continue
+            # Core inserts skip the model validators, so the derived columns are filled here
+            rows.append({
+                "date": tx['date'],
+                "description": tx['description'],
+                "amount_cents": tx['amount_cents'],
+                "bank_name": bank_name,
+                "account_number": account_number,
+                "normalized_description": normalized_description,
+                "gram_count": None,
+                "fingerprint": fingerprint,
+                "is_matched": False,
+                "owner_id": owner_id,
+            })
+
+        if rows:
+            # In date order, the date-led indexes take each chunk in a few runs rather than row by row
+            rows.sort(key=lambda row: row["date"])
+            # Lines stored before, or meanwhile by a concurrent import, conflict and are skipped
+            inserted = db.execute(
+                dialect_insert(db, table).on_conflict_do_nothing(index_elements=["owner_id", "fingerprint"])
+                .returning(table.c.id),
+                rows
+            ).scalars().all()
+            duplicates += len(rows) - len(inserted)
+            bank_transaction_ids.extend(inserted)
+        if progress:
+            progress(read, None)
+    return bank_transaction_ids, duplicates
+
+def import_statement(db: Session, owner_id: int, source: Union[str, BinaryIO], bank_name: str, account_number: str,
+                     progress: Optional[Callable[[int, Optional[int]], None]] = None,
+                     filename: Optional[str] = None, date_format: Optional[str] = None,
+                     decimal: Optional[str] = None) -> Tuple[List[int], int, Optional[FormatProfile]]:
+    """
+    Stream a bank statement (CSV, OFX/QFX, QIF or XLSX) into bank transactions of the owner.
+
+    The statement is parsed, checked and inserted one chunk of IMPORT_BATCH_SIZE rows
+    at a time with a single multi-row INSERT, so memory stays flat however long the
+    file is. Rows already stored by an earlier, overlapping statement are skipped.
+    Everything is committed at the end, or not at all. The description grams and
+    match candidates of the new rows are left to index_pending(), which the API
+    runs as a job right after.
+
+    Args:
+        db: Database session
+        owner_id: ID of the owner
+        source: Path of a saved statement, or an open binary file such as an upload's spooled file
+        bank_name: Bank the statement belongs to
+        account_number: Account the statement belongs to
+        progress: Called as progress(rows read, None) after each chunk
+        filename: Name whose extension gives the format; defaults to source when it is a path
+        date_format: strptime format of the dates, instead of the stored or detected one
+        decimal: Decimal point of the amounts ("." or ","), instead of the stored or detected one
+
+    Returns:
+        Tuple of (IDs of the stored bank transactions, number of duplicate rows skipped,
+        profile the statement was read with, or None when it had no rows)
+    """
+    stored = format_profiles(db, owner_id, bank_name)
+    profiles = dict(stored)
+    chunks = iter_statement(source, filename or source, IMPORT_BATCH_SIZE, profiles, date_format, decimal)
+    bank_transaction_ids, duplicates = _insert_statement(db, owner_id, chunks, bank_name, account_number, progress)
+    store_profiles(db, owner_id, bank_name, profiles, stored)
+    if bank_transaction_ids:
+        reports.invalidate(db, owner_id)
+    db.commit()
+    read_with = _read_with(profiles) if bank_transaction_ids or duplicates else None
+    return bank_transaction_ids, duplicates, read_with
+
+def _read_with(profiles: Profiles) -> FormatProfile:
+    # iter_statement puts the profile it read the statement with last
+    return next(reversed(profiles.values()))
+
+def profile_result(profile: Optional[FormatProfile]) -> Dict:
+    """How a statement's dates were read, as import results report it."""
+    return {
+        "date_format_used": profile.date_format if profile else None,
+        "ambiguous_dates": bool(profile and profile.dates_ambiguous),
+    }
+
+def check_statement(db: Session, owner_id: int, source: Union[str, BinaryIO], bank_name: str,
+                    filename: Optional[str] = None, date_format: Optional[str] = None, decimal: Optional[str] = None):
+    """
+    Parse the first chunk of a statement the way import_statement would, with the
+    bank's stored profiles, so that a file it would reject is rejected before its
+    import is queued. Raises ValueError like import_statement; nothing is stored.
+    """
+    profiles = dict(format_profiles(db, owner_id, bank_name))
+    chunks = iter_statement(source, filename or source, IMPORT_BATCH_SIZE, profiles, date_format, decimal)
+    next(iter(chunks), None)
+
+def _batches(rows: List[Dict]) -> Iterator[List[Dict]]:
+    for start in range(0, len(rows), IMPORT_BATCH_SIZE):
+        yield rows[start:start + IMPORT_BATCH_SIZE]
+
+def import_archive(db: Session, owner_id: int, zip_path: str,
+                   progress: Optional[Callable[[int, Optional[int]], None]] = None,
+                   date_format: Optional[str] = None, decimal: Optional[str] = None) -> List[Dict]:
+    """
+    Import every statement of a ZIP archive (see utils.archive for how files are
+    tagged with their bank and account).
+
+    Statements are parsed in parallel in the process pool while this thread
+    inserts each one as soon as it is parsed, through the same path as
+    import_statement. Only about as many files as there are worker processes
+    are parsed or waiting at a time, so memory holds a few files' rows however
+    large the archive is. A file that does not parse is reported and
+    skipped; the rest is committed at the end in one transaction, and left to
+    index_pending() like a single statement. date_format and decimal apply to every file.
+
+    Returns:
+        One result per archive member, in archive order: file, bank_name,
+        account_number, inserted, duplicates, error (None on success), and
+        date_format_used and ambiguous_dates as profile_result gives them
+    """
+    entries, rejected = archive.list_entries(zip_path)
+    stored = {bank_name: format_profiles(db, owner_id, bank_name) for bank_name in {entry.bank_name for entry in entries}}
+    profiles = {bank_name: dict(bank_profiles) for bank_name, bank_profiles in stored.items()}
+    # Files of one account are parsed, and mostly inserted, one after the other
+    by_account = defaultdict(list)
+    for entry in entries:
+        by_account[(entry.bank_name, entry.account_number)].append(entry)
+    queued = iter([entry for account_entries in by_account.values() for entry in account_entries])
+    pool = process_pool()
+    parsing = {}
+
+    def parse_next():
+        entry = next(queued, None)
+        if entry is not None:
+            parsing[pool.submit(archive.parse_member, zip_path, entry.name, stored[entry.bank_name], date_format,
+                                decimal)] = entry
+
+    results = {
+        name: {"file": name, "bank_name": None, "account_number": None, "inserted": 0, "duplicates": 0, "error": reason,
+               **profile_result(None)}
+        for name, reason in rejected.items()
+    }
+    bank_transaction_ids = []
+    done = 0
+    try:
+        for _ in range(process_workers()):
+            parse_next()
+        while parsing:
+            finished, _ = wait(parsing, return_when=FIRST_COMPLETED)
+            for future in finished:
+                entry = parsing.pop(future)
+                # The next file is parsed while this one is inserted
+                parse_next()
+                result = {"file": entry.name, "bank_name": entry.bank_name, "account_number": entry.account_number,
+                          "inserted": 0, "duplicates": 0, "error": None, **profile_result(None)}
+                results[entry.name] = result
+                try:
+                    rows, read_with = future.result()
+                except Exception as e:
+                    result["error"] = str(e)
+                else:
+                    profiles[entry.bank_name].update(read_with)
+                    ids, duplicates = _insert_statement(db, owner_id, _batches(rows), entry.bank_name,
+                                                        entry.account_number)
+                    result["inserted"], result["duplicates"] = len(ids), duplicates
+                    if rows:
+                        result.update(profile_result(_read_with(read_with)))
+                    bank_transaction_ids.extend(ids)
+                    del rows
+                done += 1
+                if progress:
+                    progress(done, len(entries))
+    finally:
+        # Parses still running are dropped when the import fails or is cancelled
+        for future in parsing:
+            future.cancel()
+
+    for bank_name, bank_profiles in profiles.items():
+        store_profiles(db, owner_id, bank_name, bank_profiles, stored[bank_name])
+    if bank_transaction_ids:
+        reports.invalidate(db, owner_id)
+    db.commit()
+    return [results[entry.name] for entry in entries] + [results[name] for name in rejected]
+
+def index_pending(db: Session, owner_id: int, progress: Optional[Callable[[int, Optional[int]], None]] = None) -> int:
+    """
+    Write the description grams and score the match candidates of the owner's
+    imported rows still waiting for it, INDEX_BATCH_SIZE rows per transaction in
+    date order, so each batch only reads the transactions around its dates.
+    Batches already committed stay indexed when a later one fails. Returns the
+    number of rows indexed.
+    """
+    B = models.BankTransaction
+    pending = (B.owner_id == owner_id, B.gram_count.is_(None))
+    total = db.execute(select(func.count()).select_from(B).where(*pending)).scalar()
+    by_id = B.__table__.update().where(B.__table__.c.id == bindparam("row_id"))
+    done = 0
+    while True:
+        # One indexer per owner at a time; another one waits here, then finds these rows done
+        db.execute(select(models.User.id).where(models.User.id == owner_id).with_for_update())
+        rows = db.execute(
+            select(*_INDEXED_COLUMNS).where(*pending).order_by(B.date, B.id).limit(INDEX_BATCH_SIZE)
+        ).all()
+        if not rows:
+            db.commit()
+            return done
+        gram_counts = description_index.index_bank_transactions(db, rows)
+        candidates.refresh_bank_transactions(db, owner_id, rows)
+        db.execute(by_id.values(gram_count=bindparam("gram_count")),
+                   [{"row_id": row_id, "gram_count": count} for row_id, count in gram_counts.items()])
+        db.commit()
+        done += len(rows)
+        if progress:
+            progress(done, total)
+
+def fingerprint_existing(db: Session, owner_id: int) -> int:
+    """
+    Recompute the fingerprints of all the owner's stored bank transactions and commit.
+    Identical lines are numbered in the order they were stored, skipping ordinals
+    held by archived rows. Returns how many fingerprints changed.
+    """
+    B = models.BankTransaction
+    lines = defaultdict(list)
+    for row in db.execute(
+        select(B.id, B.account_number, B.date, B.amount_cents, B.description, B.fingerprint)
+        .where(B.owner_id == owner_id).order_by(B.id)
+    ):
+        lines[(row.account_number.strip(), row.date, row.amount_cents, normalize_description(row.description))].append(row)
+
+    changed = []
+    for (account_number, day, amount_cents, normalized), rows in lines.items():
+        fingerprints, first = [], 0
+        while len(fingerprints) < len(rows):
+            batch = _line_fingerprints(owner_id, account_number, day, amount_cents, normalized, first, len(rows))
+            archived = cold_archive.archived_fingerprints(owner_id, set(batch), [day])
+            fingerprints += [fingerprint for fingerprint in batch if fingerprint not in archived]
+            first += len(rows)
+        changed += [{"row_id": row.id, "fingerprint": fingerprint}
+                    for row, fingerprint in zip(rows, fingerprints) if row.fingerprint != fingerprint]
+
+    table = B.__table__
+    by_id = table.update().where(table.c.id == bindparam("row_id"))
+    for start in range(0, len(changed), IMPORT_BATCH_SIZE):
+        batch = changed[start:start + IMPORT_BATCH_SIZE]
+        # Cleared first, so rows trading fingerprints never meet on the unique index halfway
+        db.execute(by_id.values(fingerprint=None), [{"row_id": row["row_id"]} for row in batch])
+    for start in range(0, len(changed), IMPORT_BATCH_SIZE):
+        db.execute(by_id.values(fingerprint=bindparam("fingerprint")), changed[start:start + IMPORT_BATCH_SIZE])
+    db.commit()
+    return len(changed)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain imported bank transactions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help in (("index", "Write the grams and candidates of imported rows still waiting for them"),
+                       ("fingerprint", "Recompute the fingerprints of stored bank transactions")):
+        command = commands.add_parser(name, help=help)
+        command.add_argument("--users", type=lambda value: [int(x) for x in value.split(",")], default=None,
+                             help="Comma-separated user ids (default: all users)")
+    args = parser.parse_args(argv)
+
+    db = database.SessionLocal()
+    try:
+        query = db.query(models.User.id)
+        if args.users:
+            query = query.filter(models.User.id.in_(args.users))
+        for user_id, in query.order_by(models.User.id).all():
+            if args.command == "index":
+                print(f"user {user_id}: {index_pending(db, user_id)} rows indexed")
+            else:
+                print(f"user {user_id}: {fingerprint_existing(db, user_id)} fingerprints recomputed")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
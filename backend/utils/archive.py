@@ -0,0 +1,93 @@
+import csv
+import io
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from .bank_parser import Profiles, parse_statement, statement_reader, supported_extensions
+
+# Optional member of an archive naming the bank and account of each statement
+MANIFEST_NAME = 'manifest.csv'
+MANIFEST_COLUMNS = ('file', 'bank_name', 'account_number')
+
+@dataclass(frozen=True)
+class ArchiveEntry:
+    """A statement in an archive and the account it belongs to."""
+    name: str
+    bank_name: str
+    account_number: str
+
+def _read_manifest(archive: zipfile.ZipFile) -> Dict[str, Tuple[str, str]]:
+    """(bank name, account number) per file name, from manifest.csv when the archive has one."""
+    names = {name.lower(): name for name in archive.namelist()}
+    if MANIFEST_NAME not in names:
+        return {}
+    text = archive.read(names[MANIFEST_NAME]).decode('utf-8-sig')
+    reader = csv.DictReader(io.StringIO(text))
+    header = [column.strip().lower() for column in reader.fieldnames or []]
+    missing = [column for column in MANIFEST_COLUMNS if column not in header]
+    if missing:
+        raise ValueError(f"{MANIFEST_NAME} is missing the column(s) {', '.join(missing)}")
+    reader.fieldnames = header
+    return {
+        row['file'].strip(): (row['bank_name'].strip(), row['account_number'].strip())
+        for row in reader if (row.get('file') or '').strip()
+    }
+
+def account_from_filename(name: str) -> Optional[Tuple[str, str]]:
+    """(bank name, account number) from a file named <bank>_<account>[_anything].<ext>."""
+    parts = os.path.splitext(os.path.basename(name))[0].split('_')
+    if len(parts) < 2 or not parts[0].strip() or not parts[1].strip():
+        return None
+    return parts[0].strip(), parts[1].strip()
+
+def list_entries(zip_path: str) -> Tuple[List[ArchiveEntry], Dict[str, str]]:
+    """
+    The statements of an archive, in archive order, with the account of each
+    taken from manifest.csv or else from the file name. Members that cannot be
+    imported are returned separately as {name: reason}. Directories and hidden
+    files (such as __MACOSX entries) are ignored. Raises ValueError when the file
+    is not a ZIP archive or its manifest is malformed.
+    """
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise ValueError("Not a ZIP archive")
+    with archive:
+        manifest = _read_manifest(archive)
+        entries = []
+        rejected = {}
+        for info in archive.infolist():
+            name = info.filename
+            base = os.path.basename(name)
+            if info.is_dir() or not base or base.startswith('.') or name.startswith('__MACOSX/'):
+                continue
+            if base.lower() == MANIFEST_NAME:
+                continue
+            if statement_reader(name) is None:
+                rejected[name] = f"Unsupported statement format; expected one of {', '.join(supported_extensions())}"
+                continue
+            account = manifest.get(name) or manifest.get(base) or account_from_filename(name)
+            if account is None:
+                rejected[name] = f"No bank name and account number; list the file in {MANIFEST_NAME} or name it <bank>_<account>{os.path.splitext(name)[1]}"
+                continue
+            entries.append(ArchiveEntry(name=name, bank_name=account[0], account_number=account[1]))
+
+        listed = {entry.name for entry in entries} | {os.path.basename(entry.name) for entry in entries} | set(rejected)
+        for name in manifest:
+            if name not in listed:
+                rejected[name] = f"Listed in {MANIFEST_NAME} but not in the archive"
+    return entries, rejected
+
+def parse_member(zip_path: str, name: str, profiles: Optional[Profiles] = None,
+                 date_format: Optional[str] = None, decimal: Optional[str] = None) -> Tuple[List[Dict], Profiles]:
+    """
+    Parse one statement of an archive into transactions, with the stored format
+    profiles of its bank. Returns the transactions and the profiles, with the one
+    the statement was read with. Runs in a worker process, so it only takes and
+    returns picklable values.
+    """
+    with zipfile.ZipFile(zip_path) as archive:
+        data = archive.read(name)
+    profiles = dict(profiles or {})
+    return parse_statement(io.BytesIO(data), profiles, name, date_format, decimal), profiles
@@ -0,0 +1,302 @@
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import List, Optional, Sequence, Tuple
+import pandas as pd
+from .money import series_to_cents
+
+# Header names (lowercased) each standard column is recognised by
+DATE_COLUMNS = ['date', 'transaction date', 'transaction_date', 'posting date', 'booking date', 'value date']
+DESCRIPTION_COLUMNS = ['description', 'details', 'transaction details', 'transaction_details', 'narration', 'memo', 'payee']
+AMOUNT_COLUMNS = ['amount', 'transaction amount', 'transaction_amount', 'debit/credit']
+DEBIT_COLUMNS = ['debit', 'debits', 'debit amount', 'withdrawal', 'withdrawals', 'money out', 'paid out']
+CREDIT_COLUMNS = ['credit', 'credits', 'credit amount', 'deposit', 'deposits', 'money in', 'paid in']
+
+# Tried in this order; a format is only used when it reads every sampled date
+DATE_FORMATS = [
+    '%Y-%m-%d', '%Y/%m/%d', '%Y%m%d',
+    '%d/%m/%Y', '%m/%d/%Y', '%d.%m.%Y', '%d-%m-%Y', '%m-%d-%Y',
+    '%d/%m/%y', '%m/%d/%y', '%d.%m.%y',
+    '%d %b %Y', '%d-%b-%Y', '%b %d, %Y', '%d %B %Y',
+    '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+]
+
+_SIGN_SUFFIX = re.compile(r'(?i)\s*(cr|dr)\.?$')
+_NOISE = re.compile(r'[^0-9.,\-]')
+
+@dataclass(frozen=True)
+class FormatProfile:
+    """How to read one bank's statement layout."""
+    date_column: str
+    description_column: str
+    amount_column: Optional[str]
+    debit_column: Optional[str]
+    credit_column: Optional[str]
+    date_format: str
+    decimal: str
+    thousands: Optional[str]
+    # The dates also read another way (day-first and month-first); date_format is the
+    # reading given by hand or taken from the bank's earlier statements
+    dates_ambiguous: bool = False
+
+    @property
+    def columns(self) -> List[str]:
+        return [c for c in (self.date_column, self.description_column, self.amount_column,
+                            self.debit_column, self.credit_column) if c]
+
+def normalize_header(columns: Sequence[str]) -> Tuple[str, ...]:
+    """Header names as profiles refer to them; also the header signature of a statement."""
+    return tuple(str(col).strip().lower() for col in columns)
+
+def check_date_format(date_format: str) -> str:
+    """
+    A date format given by hand, such as "%d/%m/%Y", checked to read back the
+    dates it writes. Raises ValueError otherwise.
+    """
+    sample = date(2024, 12, 31)
+    try:
+        readable = datetime.strptime(sample.strftime(date_format), date_format).date() == sample
+    except ValueError:
+        readable = False
+    if not readable:
+        raise ValueError(f"Date format '{date_format}' does not name a day, month and year, e.g. %d/%m/%Y")
+    return date_format
+
+def _find_column(header: Tuple[str, ...], names: List[str]) -> Optional[str]:
+    for name in names:
+        if name in header:
+            return name
+    return None
+
+def _sample_dates(values: pd.Series) -> pd.Series:
+    values = values.dropna().str.strip()
+    values = values[values != '']
+    if values.empty:
+        raise ValueError("No dates to detect the date format from")
+    return values
+
+def _check_dates(values: pd.Series, date_format: str):
+    """Raise ValueError naming the first sampled date that does not read as date_format."""
+    values = _sample_dates(values)
+    invalid = pd.to_datetime(values, format=date_format, errors='coerce').isna()
+    if invalid.any():
+        position = int(invalid.values.argmax())
+        raise ValueError(f"Date '{values.iloc[position]}' on line {int(values.index[position]) + 2} does not read as {date_format}")
+
+def _date_readings(values: pd.Series) -> List[Tuple[str, pd.Series]]:
+    """
+    The formats every sampled date reads with, each with the dates it gives, leaving
+    out formats that give the same dates as an earlier one. Raises ValueError naming
+    the first date the closest format cannot read when none fits.
+    """
+    values = _sample_dates(values)
+
+    readings = []
+    best = None
+    for date_format in DATE_FORMATS:
+        parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+        if parsed.notna().all():
+            if not any(parsed.equals(other) for _, other in readings):
+                readings.append((date_format, parsed))
+        elif best is None or parsed.notna().sum() > best.notna().sum():
+            best = parsed
+    if not readings:
+        position = int(best.isna().values.argmax())
+        raise ValueError(f"Unrecognised date '{values.iloc[position]}' on line {int(values.index[position]) + 2}")
+    return readings
+
+def _detect_date_format(values: pd.Series, known: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    The date format every sampled date reads with, and whether the dates also read
+    another way. Dates that read more than one
+    way (day-first and month-first both fit when no day is above 12) take known,
+    the format of the bank's earlier statements, when it is one of the readings;
+    otherwise they raise ValueError naming the readings, for date_format to settle.
+    """
+    readings = _date_readings(values)
+    if len(readings) == 1:
+        return readings[0][0], False
+    if known in [date_format for date_format, _ in readings]:
+        return known, True
+
+    (first_format, first), (second_format, second) = readings[:2]
+    position = int((first != second).values.argmax())
+    example = _sample_dates(values).iloc[position]
+    raise ValueError(
+        f"Dates such as '{example}' read both as {first_format} ({first.iloc[position]:%Y-%m-%d}) "
+        f"and as {second_format} ({second.iloc[position]:%Y-%m-%d}); pass date_format to choose"
+    )
+
+def ambiguous_dates(values: pd.Series) -> bool:
+    """Whether the dates read more than one way, such as both day-first and month-first."""
+    try:
+        return len(_date_readings(pd.Series(values.unique(), dtype=object))) > 1
+    except ValueError:
+        return False
+
+def _detect_separators(values: pd.Series, known: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """
+    Decimal and thousands separators. The last separator of a value is its decimal
+    point when the other kind comes before it ("1,234.50") or when it is not followed
+    by three digits ("12.50"); a separator that repeats ("1.234.567") separates
+    thousands. A lone separator followed by three digits ("1.234", "12.500") reads
+    either way, so when no value settles it, the statement takes known, the decimal
+    point of the bank's earlier statements, or raises ValueError for decimal_separator
+    to settle.
+    """
+    decimal_votes = {'.': 0, ',': 0}
+    undecided = None
+    for value in values.dropna().head(1000):
+        digits = _NOISE.sub('', value).lstrip('-').rstrip('-')
+        last = max(digits.rfind('.'), digits.rfind(','))
+        if last < 0:
+            continue
+        separator = digits[last]
+        other = ',' if separator == '.' else '.'
+        if other in digits[:last] or len(digits) - last - 1 != 3:
+            decimal_votes[separator] += 1
+        elif digits.count(separator) > 1:
+            decimal_votes[other] += 1
+        elif undecided is None:
+            undecided = digits
+
+    if decimal_votes['.'] or decimal_votes[','] or undecided is None:
+        decimal = ',' if decimal_votes[','] > decimal_votes['.'] else '.'
+    elif known:
+        decimal = known
+    else:
+        separator = ',' if ',' in undecided else '.'
+        raise ValueError(
+            f"Amounts such as '{undecided}' read both as {undecided.replace(separator, '.')} and as "
+            f"{undecided.replace(separator, '')}; pass decimal_separator ('.' or ',') to choose"
+        )
+    return decimal, ',' if decimal == '.' else '.'
+
+def detect_profile(df: pd.DataFrame, date_format: Optional[str] = None,
+                   known: Optional[FormatProfile] = None, decimal: Optional[str] = None) -> FormatProfile:
+    """
+    Work out the layout of a statement from a sample read with dtype=str and
+    normalized header names. date_format and decimal, when given, are used instead
+    of the detected date format and decimal point; known is the profile stored for
+    the same bank and header, which settles dates and amounts that read more than
+    one way. Raises ValueError when a column is missing, a date does not read, or
+    the dates or amounts read more than one way and nothing settles them.
+    """
+    header = tuple(df.columns)
+    date_column = _find_column(header, DATE_COLUMNS)
+    description_column = _find_column(header, DESCRIPTION_COLUMNS)
+    amount_column = _find_column(header, AMOUNT_COLUMNS)
+    debit_column = credit_column = None
+    if amount_column is None:
+        debit_column = _find_column(header, DEBIT_COLUMNS)
+        credit_column = _find_column(header, CREDIT_COLUMNS)
+
+    if date_column is None:
+        raise ValueError("No date column found")
+    if description_column is None:
+        raise ValueError("No description column found")
+    if amount_column is None and (debit_column is None or credit_column is None):
+        raise ValueError("No amount column, or debit and credit columns, found")
+
+    amounts = df[amount_column] if amount_column else pd.concat([df[debit_column], df[credit_column]])
+    if decimal:
+        thousands = ',' if decimal == '.' else '.'
+    else:
+        decimal, thousands = _detect_separators(amounts, known.decimal if known else None)
+    if date_format:
+        _check_dates(df[date_column], date_format)
+        dates_ambiguous = ambiguous_dates(df[date_column])
+    else:
+        date_format, dates_ambiguous = _detect_date_format(df[date_column], known.date_format if known else None)
+    return FormatProfile(
+        date_column=date_column,
+        description_column=description_column,
+        amount_column=amount_column,
+        debit_column=debit_column,
+        credit_column=credit_column,
+        date_format=date_format,
+        decimal=decimal,
+        thousands=thousands,
+        dates_ambiguous=dates_ambiguous,
+    )
+
+def _amount_pattern(decimal: str, thousands: Optional[str]) -> str:
+    d = re.escape(decimal)
+    number = rf'\d+(?:{d}\d+)?|{d}\d+'
+    if thousands:
+        number = rf'\d{{1,3}}(?:{re.escape(thousands)}\d{{3}})+(?:{d}\d+)?|' + number
+    return rf'-?(?:{number})-?'
+
+def to_amounts(values: pd.Series, decimal: str, thousands: Optional[str]) -> pd.Series:
+    """
+    Vectorized amount conversion. Understands "(12.50)", "12.50-" and a "DR" suffix
+    as negative, a "CR" suffix as positive, and ignores currency symbols and spaces.
+    Values that are unreadable, or whose separators do not fit the profile (such as
+    "1.234,50" when the decimal point is "."), become NaN rather than a wrong number.
+    """
+    # Plain numbers ("-12.50") are the common case and convert in one C pass
+    if decimal == '.':
+        try:
+            return values.astype('float64')
+        except (TypeError, ValueError):
+            pass
+        amounts = pd.to_numeric(values, errors='coerce')
+        rest = amounts.isna() & values.notna()
+        if rest.any():
+            amounts[rest] = _to_amounts_slow(values[rest], decimal, thousands)
+        return amounts
+    return _to_amounts_slow(values, decimal, thousands)
+
+def _to_amounts_slow(values: pd.Series, decimal: str, thousands: Optional[str]) -> pd.Series:
+    text = values.astype('string').str.strip()
+    negative = (
+        (text.str.startswith('(') & text.str.endswith(')'))
+        | text.str.endswith('-')
+        | text.str.upper().str.rstrip('.').str.endswith('DR')
+    ).fillna(False)
+    text = text.str.replace(_SIGN_SUFFIX, '', regex=True).str.replace(_NOISE, '', regex=True)
+    valid = text.str.fullmatch(_amount_pattern(decimal, thousands)).fillna(False)
+    if thousands:
+        text = text.str.replace(thousands, '', regex=False)
+    if decimal != '.':
+        text = text.str.replace(decimal, '.', regex=False)
+    text = text.str.rstrip('-')
+    amounts = pd.to_numeric(text.where(valid), errors='coerce').astype(float)
+    return amounts.where(~negative, -amounts.abs())
+
+def apply_profile(df: pd.DataFrame, profile: FormatProfile) -> pd.DataFrame:
+    """
+    Turn a raw frame (dtype=str, normalized header names) into date, description and
+    amount_cents columns. Raises ValueError naming the first line whose date or amount
+    does not read under the profile.
+    """
+    raw_dates = df[profile.date_column]
+    # A statement repeats each day many times over, so every distinct string is read once
+    days = pd.Series(raw_dates.dropna().unique(), dtype=object)
+    parsed = pd.to_datetime(days.str.strip(), format=profile.date_format, errors='coerce')
+    dates = raw_dates.map(dict(zip(days, parsed.dt.date)))
+    if profile.amount_column:
+        amounts = to_amounts(df[profile.amount_column], profile.decimal, profile.thousands)
+    else:
+        debits = to_amounts(df[profile.debit_column], profile.decimal, profile.thousands)
+        credits = to_amounts(df[profile.credit_column], profile.decimal, profile.thousands)
+        missing = debits.isna() & credits.isna()
+        amounts = (credits.fillna(0).abs() - debits.fillna(0).abs()).where(~missing)
+
+    # The index counts data rows from 0, after the header line
+    for name, invalid in (('date', dates.isna()), ('amount', amounts.isna())):
+        if invalid.any():
+            position = int(invalid.values.argmax())
+            expected = ""
+            if name == 'date':
+                expected = f" (expected {profile.date_format}"
+                if profile.dates_ambiguous:
+                    expected += ", chosen for first dates that also read another way; pass date_format to change it"
+                expected += ")"
+            raise ValueError(f"Invalid or missing {name} on line {int(df.index[position]) + 2}{expected}")
+
+    return pd.DataFrame({
+        'date': dates,
+        'description': df[profile.description_column].fillna('').astype(str),
+        'amount_cents': series_to_cents(amounts),
+    }, index=df.index)
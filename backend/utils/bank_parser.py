@@ -1,46 +1,181 @@
 import pandas as pd
-from typing import List, Dict
-from datetime import datetime
+from typing import List, Dict, Iterator, Union, BinaryIO, Optional, Tuple, Callable
 import os
+import shutil
+from dataclasses import replace
+from .bank_formats import FormatProfile, normalize_header, detect_profile, apply_profile, ambiguous_dates
+from .statement_readers import ofx_frames, qif_frames, xlsx_frames
 
-def parse_bank_csv(file_path: str) -> List[Dict]:
+# Statement readers by file extension, registered with @reader
+_readers: Dict[str, Callable[..., Iterator[List[Dict]]]] = {}
+
+# Format profiles of one bank by header signature, as stored by statements.format_profiles
+Profiles = Dict[Tuple[str, ...], FormatProfile]
+
+def _read_header(source: Union[str, BinaryIO]) -> Tuple[str, ...]:
+    """Normalized header of a statement; an open file is rewound afterwards."""
+    header = normalize_header(pd.read_csv(source, nrows=0).columns)
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    return header
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    # Plain Python values per column; much faster than DataFrame.to_dict for long frames
+    return [
+        {'date': day, 'description': description, 'amount_cents': cents}
+        for day, description, cents in zip(df['date'].tolist(), df['description'].tolist(), df['amount_cents'].tolist())
+    ]
+
+def parse_bank_csv(file_path: str, profiles: Optional[Profiles] = None, date_format: Optional[str] = None,
+                   decimal: Optional[str] = None) -> List[Dict]:
     """
     Parse a bank statement CSV file into a list of transactions.
     Handles common CSV formats and normalizes column names.
     """
+    rows = []
+    for chunk in iter_bank_csv(file_path, 100_000, profiles, date_format, decimal):
+        rows.extend(chunk)
+    return rows
+
+def parse_statement(source: Union[str, BinaryIO], profiles: Optional[Profiles] = None, filename: Optional[str] = None,
+                    date_format: Optional[str] = None, decimal: Optional[str] = None) -> List[Dict]:
+    """
+    Parse a statement of any supported format, picked by the extension of filename
+    (by default source, when it is a path).
+    """
+    rows = []
+    for chunk in iter_statement(source, filename or source, 100_000, profiles, date_format, decimal):
+        rows.extend(chunk)
+    return rows
+
+def reader(*extensions: str):
+    """Register a function as the statement reader for the given file extensions."""
+    def register(func: Callable):
+        for extension in extensions:
+            _readers[extension] = func
+        return func
+    return register
+
+def statement_reader(filename: str) -> Optional[Callable]:
+    """The reader for a file name, or None when its format is not supported."""
+    return _readers.get(os.path.splitext(filename or '')[1].lower())
+
+def supported_extensions() -> List[str]:
+    return sorted(_readers)
+
+def iter_statement(source: Union[str, BinaryIO], filename: str, chunk_size: int = 1000,
+                   profiles: Optional[Profiles] = None, date_format: Optional[str] = None,
+                   decimal: Optional[str] = None) -> Iterator[List[Dict]]:
+    """
+    Parse a statement in chunks with the reader registered for the extension of
+    filename; source is a path or an open binary file, as for iter_bank_csv.
+    Raises ValueError for an unsupported format.
+    """
+    read = statement_reader(filename)
+    if read is None:
+        raise ValueError(f"Unsupported statement format; expected one of {', '.join(supported_extensions())}")
+    return read(source, chunk_size, profiles, date_format, decimal)
+
+def _first_profile(df: pd.DataFrame, known: Optional[FormatProfile], date_format: Optional[str],
+                   decimal: Optional[str]) -> FormatProfile:
+    if known is not None and not date_format and not decimal:
+        # A stored layout that does not fit is detected again rather than trusted;
+        # the bank may have changed its format under the same header
+        try:
+            apply_profile(df, known)
+            return replace(known, dates_ambiguous=ambiguous_dates(df[known.date_column]))
+        except ValueError:
+            pass
+    return detect_profile(df, date_format, known, decimal)
+
+def _parse_frames(frames: Iterator[pd.DataFrame], kind: str, profiles: Optional[Profiles] = None,
+                  date_format: Optional[str] = None, decimal: Optional[str] = None,
+                  header: Optional[Tuple[str, ...]] = None) -> Iterator[List[Dict]]:
+    """
+    Normalize raw frames (strings, any header) into transactions.
+
+    The layout is taken from profiles, the bank's stored profiles by header, or
+    detected from the first frame; date_format and decimal override the date format
+    and decimal point of either. The profile used is put back into profiles, last,
+    for the caller to store and to tell which one read the statement.
+    A caller that read the header up front passes it; else the header comes from
+    the first frame, prefixed with kind so that formats whose readers produce fixed
+    column names do not share profiles with CSV statements.
+    """
+    profile = None
+    for df in frames:
+        df.columns = normalize_header(df.columns)
+        if profile is None:
+            if header is None:
+                header = (f'#{kind}',) + tuple(df.columns)
+            profile = _first_profile(df, (profiles or {}).get(header), date_format, decimal)
+            if profiles is not None:
+                profiles.pop(header, None)
+                profiles[header] = profile
+        yield _records(apply_profile(df, profile))
+
+@reader('.csv')
+def iter_bank_csv(source: Union[str, BinaryIO], chunk_size: int = 1000, profiles: Optional[Profiles] = None,
+                  date_format: Optional[str] = None, decimal: Optional[str] = None) -> Iterator[List[Dict]]:
+    """
+    Parse a bank statement CSV in chunks of at most chunk_size transactions, so
+    memory does not grow with the file. source is a path or an open binary file,
+    such as the spooled file of an upload.
+
+    The layout (columns, date format, separators, debit/credit split) is detected
+    from the first chunk, unless profiles holds one for the header, in which case
+    the statement is read with it directly: only the needed columns, as strings,
+    with an explicit date format and vectorized amount conversion.
+    """
     try:
-        df = pd.read_csv(file_path)
-        
-        # Normalize column names
-        df.columns = [col.strip().lower() for col in df.columns]
-        
-        # Map common column names to our standard format
-        column_mapping = {
-            'date': ['date', 'transaction date', 'transaction_date'],
-            'description': ['description', 'details', 'transaction details', 'transaction_details', 'narration'],
-            'amount': ['amount', 'transaction amount', 'transaction_amount', 'debit/credit']
-        }
-        
-        # Find matching columns
-        for standard_col, possible_names in column_mapping.items():
-            for col in possible_names:
-                if col in df.columns:
-                    df[standard_col] = df[col]
-                    break
-        
-        # Clean and convert amount
-        df['amount'] = df['amount'].apply(lambda x: float(str(x).replace(',', '').replace('+', '').replace('-', '-')))
-        
-        # Convert date to standard format
-        df['date'] = pd.to_datetime(df['date']).dt.date
-        
-        # Select and rename columns to standard format
-        df = df[['date', 'description', 'amount']]
-        
-        return df.to_dict(orient='records')
+        header = _read_header(source)
+        profile = (profiles or {}).get(header)
+        wanted = set(profile.columns) if profile else None
+        frames = pd.read_csv(
+            source,
+            dtype=str,
+            chunksize=chunk_size,
+            usecols=(lambda col: col.strip().lower() in wanted) if wanted else None
+        )
+        yield from _parse_frames(frames, 'csv', profiles, date_format, decimal, header)
     except Exception as e:
         raise ValueError(f"Error parsing CSV file: {str(e)}")
 
+@reader('.ofx', '.qfx')
+def iter_bank_ofx(source: Union[str, BinaryIO], chunk_size: int = 1000, profiles: Optional[Profiles] = None,
+                  date_format: Optional[str] = None, decimal: Optional[str] = None) -> Iterator[List[Dict]]:
+    """Parse the transactions of an OFX or QFX statement in chunks; see statement_readers.ofx_frames."""
+    try:
+        yield from _parse_frames(ofx_frames(source, chunk_size), 'ofx', profiles, date_format, decimal)
+    except Exception as e:
+        raise ValueError(f"Error parsing OFX file: {str(e)}")
+
+@reader('.qif')
+def iter_bank_qif(source: Union[str, BinaryIO], chunk_size: int = 1000, profiles: Optional[Profiles] = None,
+                  date_format: Optional[str] = None, decimal: Optional[str] = None) -> Iterator[List[Dict]]:
+    """Parse the transactions of a QIF statement in chunks; see statement_readers.qif_frames."""
+    try:
+        yield from _parse_frames(qif_frames(source, chunk_size), 'qif', profiles, date_format, decimal)
+    except Exception as e:
+        raise ValueError(f"Error parsing QIF file: {str(e)}")
+
+@reader('.xlsx')
+def iter_bank_xlsx(source: Union[str, BinaryIO], chunk_size: int = 1000, profiles: Optional[Profiles] = None,
+                   date_format: Optional[str] = None, decimal: Optional[str] = None) -> Iterator[List[Dict]]:
+    """
+    Parse the first worksheet of an XLSX statement in chunks. Its header row is
+    matched like a CSV header; see statement_readers.xlsx_frames.
+    """
+    try:
+        yield from _parse_frames(xlsx_frames(source, chunk_size), 'xlsx', profiles, date_format, decimal)
+    except Exception as e:
+        raise ValueError(f"Error parsing XLSX file: {str(e)}")
+
+def save_upload(source: BinaryIO, file_path: str):
+    """Copy an uploaded file to disk, for work that outlives the request"""
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(source, f)
+
 def cleanup_upload(file_path: str):
     """Remove the uploaded file after processing"""
     try:
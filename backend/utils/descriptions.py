@@ -0,0 +1,43 @@
+import re
+from typing import Set
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize_description(text: str) -> str:
+    """
+    Normalize a merchant string or note for comparison.
+    Lowercases, strips punctuation and drops tokens carrying digits
+    (card numbers, references, dates), e.g. "AMAZON MKTP US*2K3L1" -> "amazon mktp us".
+    """
+    if not text:
+        return ""
+    tokens = _NON_ALNUM.sub(" ", text.lower()).split()
+    # Tokens are [a-z0-9]+ here, so the ones without digits are the alphabetic ones
+    return " ".join([token for token in tokens if token.isalpha()])
+
+def description_grams(normalized: str) -> Set[str]:
+    """
+    Tokens and character trigrams of a normalized description.
+    Tokens are prefixed with "w:" so they never collide with trigrams.
+    """
+    grams = set()
+    for token in normalized.split():
+        grams.add("w:" + token)
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+def substring_grams(normalized: str) -> Set[str]:
+    """
+    The trigrams every description containing normalized must have: those inside
+    each of its tokens. Tokens shorter than three characters contribute none.
+    """
+    return {token[i:i + 3] for token in normalized.split() for i in range(len(token) - 2)}
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two gram sets; 0.0 when either is empty."""
+    if not a or not b:
+        return 0.0
+    overlap = len(a & b)
+    return overlap / (len(a) + len(b) - overlap)
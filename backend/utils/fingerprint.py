@@ -0,0 +1,47 @@
+import hashlib
+from collections import Counter
+from datetime import date, datetime
+from typing import Dict, List, Optional, Union
+from .descriptions import normalize_description
+from .money import format_cents
+
+def bank_fingerprint(owner_id: int, account_number: str, day: Union[date, datetime], amount_cents: int,
+                     normalized_description: str, ordinal: int) -> str:
+    """
+    Stable identity of a statement line. ordinal tells apart identical lines of the
+    same statement (two equal coffees on one day), so they are not taken for duplicates.
+    The amount is keyed as a two-place decimal string, as it was when amounts were floats.
+    """
+    if isinstance(day, datetime):
+        day = day.date()
+    return _line_hash(f"{owner_id}|{account_number.strip()}|", day.isoformat(), amount_cents, normalized_description, ordinal)
+
+def _line_hash(prefix: str, day: str, amount_cents: int, normalized_description: str, ordinal: int) -> str:
+    key = f"{prefix}{day}|{format_cents(amount_cents)}|{normalized_description}|{ordinal}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def statement_fingerprints(owner_id: int, account_number: str, rows: List[Dict], seen: Optional[Counter] = None,
+                           normalized_descriptions: Optional[List[str]] = None) -> List[str]:
+    """
+    Fingerprints of the parsed rows of one statement, in order.
+    A line repeated within the statement gets ordinal 0, 1, 2, ... in the order it appears.
+    When a statement is read in chunks, pass the same seen counter for every chunk;
+    it holds one small integer key per distinct line. A caller that normalized the
+    descriptions already passes them along.
+    """
+    seen = Counter() if seen is None else seen
+    if normalized_descriptions is None:
+        normalized_descriptions = [normalize_description(row["description"]) for row in rows]
+    # The same key as bank_fingerprint, built once per statement and per day rather than per row
+    prefix = f"{owner_id}|{account_number.strip()}|"
+    days = {}
+    fingerprints = []
+    for row, normalized in zip(rows, normalized_descriptions):
+        day = days.get(row["date"])
+        if day is None:
+            day = days[row["date"]] = (row["date"].date() if isinstance(row["date"], datetime) else row["date"]).isoformat()
+        key = hash((day, row["amount_cents"], normalized))
+        ordinal = seen[key]
+        seen[key] = ordinal + 1
+        fingerprints.append(_line_hash(prefix, day, row["amount_cents"], normalized, ordinal))
+    return fingerprints
\ No newline at end of file
@@ -1,6 +1,20 @@
-from typing import List, Tuple, Dict
-from datetime import datetime, timedelta
+from typing import List, Tuple, Dict, Optional, Set
+from collections import Counter, defaultdict
+import numpy as np
 from ..models import Transaction, BankTransaction
+from .descriptions import normalize_description, description_grams, jaccard
+
+# Pairs further apart than this get no date credit and are never put in the same block
+DATE_WINDOW_DAYS = 3
+
+def _transaction_grams(transaction: Transaction) -> Set[str]:
+    # Transactions carry a free-text note; fall back to the category when it is empty
+    normalized = transaction.normalized_note or normalize_description(transaction.note or transaction.category or "")
+    return description_grams(normalized)
+
+def _bank_grams(bank_transaction: BankTransaction) -> Set[str]:
+    normalized = bank_transaction.normalized_description or normalize_description(bank_transaction.description)
+    return description_grams(normalized)
 
 def calculate_similarity_score(transaction: Transaction, bank_transaction: BankTransaction) -> float:
     """
@@ -11,48 +25,263 @@ def calculate_similarity_score(transaction: Transaction, bank_transaction: BankT
     total_factors = 0
 
     # Amount matching (exact match)
-    if abs(transaction.amount - bank_transaction.amount) < 0.01:
+    if transaction.amount_cents == bank_transaction.amount_cents:
         score += 1.0
     total_factors += 1
 
     # Date matching (within 3 days)
     date_diff = abs((transaction.date - bank_transaction.date).days)
-    if date_diff <= 3:
-        score += 1.0 - (date_diff / 3)
+    if date_diff <= DATE_WINDOW_DAYS:
+        score += 1.0 - (date_diff / DATE_WINDOW_DAYS)
     total_factors += 1
 
-    # Description matching (basic text similarity)
-    trans_desc = transaction.description.lower()
-    bank_desc = bank_transaction.description.lower()
-    
-    # Check if one description contains the other
-    if trans_desc in bank_desc or bank_desc in trans_desc:
-        score += 1.0
+    # Description matching (token and trigram overlap)
+    score += jaccard(_transaction_grams(transaction), _bank_grams(bank_transaction))
     total_factors += 1
 
     return score / total_factors
 
-def find_potential_matches(transaction: Transaction, bank_transactions: List[BankTransaction], 
+def score_pairs(pairs: List[Tuple[Transaction, BankTransaction]]) -> List[float]:
+    """
+    calculate_similarity_score for a list of pairs, computing the description grams
+    of every transaction and bank transaction only once.
+    """
+    t_grams = {}
+    b_grams = {}
+    scores = []
+    for transaction, bank_transaction in pairs:
+        grams = t_grams.get(id(transaction))
+        if grams is None:
+            grams = t_grams[id(transaction)] = _transaction_grams(transaction)
+        bank_grams = b_grams.get(id(bank_transaction))
+        if bank_grams is None:
+            bank_grams = b_grams[id(bank_transaction)] = _bank_grams(bank_transaction)
+
+        score = 1.0 if transaction.amount_cents == bank_transaction.amount_cents else 0.0
+        date_diff = abs(transaction.date.toordinal() - bank_transaction.date.toordinal())
+        if date_diff <= DATE_WINDOW_DAYS:
+            score += 1.0 - date_diff / DATE_WINDOW_DAYS
+        score += jaccard(grams, bank_grams)
+        scores.append(score / 3)
+    return scores
+
+def score_matrix(transactions: List[Transaction], bank_transactions: List[BankTransaction],
+                 min_confidence: Optional[float] = None) -> np.ndarray:
+    """
+    Score every transaction against every bank transaction in one pass.
+    Returns a (len(transactions), len(bank_transactions)) array holding the same
+    values as calculate_similarity_score.
+
+    When min_confidence is given, the description factor is only evaluated for
+    pairs that could still reach it; the remaining pairs keep their amount and
+    date score, which is already below min_confidence.
+    Description similarity is the Jaccard score of token and trigram sets.
+    """
+    t_amounts = np.array([t.amount_cents for t in transactions], dtype=np.int64)
+    b_amounts = np.array([b.amount_cents for b in bank_transactions], dtype=np.int64)
+    t_days = np.array([t.date.toordinal() for t in transactions], dtype=np.int64)
+    b_days = np.array([b.date.toordinal() for b in bank_transactions], dtype=np.int64)
+
+    # Amount matching (exact match)
+    scores = (t_amounts[:, None] == b_amounts[None, :]).astype(float)
+
+    # Date matching (within the date window)
+    date_diff = np.abs(t_days[:, None] - b_days[None, :])
+    scores += np.where(date_diff <= DATE_WINDOW_DAYS, 1.0 - date_diff / DATE_WINDOW_DAYS, 0.0)
+
+    # Description matching, only where it can change the outcome. Bank grams go into
+    # an inverted index so only pairs sharing at least one gram are compared.
+    allowed = None if min_confidence is None else (scores + 1.0) / 3 >= min_confidence
+    b_grams = [_bank_grams(b) for b in bank_transactions]
+    postings = defaultdict(list)
+    for j, grams in enumerate(b_grams):
+        for gram in grams:
+            postings[gram].append(j)
+    for i, transaction in enumerate(transactions):
+        if allowed is not None and not allowed[i].any():
+            continue
+        grams = _transaction_grams(transaction)
+        shared = Counter()
+        for gram in grams:
+            shared.update(postings.get(gram, ()))
+        for j, overlap in shared.items():
+            if allowed is None or allowed[i, j]:
+                scores[i, j] += overlap / (len(grams) + len(b_grams[j]) - overlap)
+
+    return scores / 3
+
+def _linear_assignment(cost: np.ndarray) -> np.ndarray:
+    """
+    Hungarian algorithm: assign each row a distinct column minimising total cost.
+    Requires rows <= columns. Returns the column index for every row.
+    """
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # p[j] is the (1-based) row assigned to column j; column 0 is a sentinel
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    padded = np.hstack([np.full((n, 1), np.inf), cost])
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            reduced = padded[i0 - 1] - u[i0] - v
+            better = free & (reduced < minv)
+            minv[better] = reduced[better]
+            way[better] = j0
+            masked = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(masked))
+            delta = masked[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    assignment = np.full(n, -1, dtype=np.int64)
+    for j in range(1, m + 1):
+        if p[j]:
+            assignment[p[j] - 1] = j - 1
+    return assignment
+
+def _assign_block(scores: np.ndarray, min_confidence: float) -> List[Tuple[int, int]]:
+    """
+    Maximum-score one-to-one assignment over the pairs scoring at least min_confidence.
+    The candidate graph is split into connected components so the Hungarian step only
+    ever sees rows that actually compete for the same bank transactions.
+    """
+    candidate = scores >= min_confidence
+    rows, cols = np.nonzero(candidate)
+    if not len(rows):
+        return []
+
+    # Union-find over transactions (0..n-1) and bank transactions (n..n+m-1)
+    n = scores.shape[0]
+    parent = list(range(n + scores.shape[1]))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for i, j in zip(rows, cols):
+        parent[find(i)] = find(n + j)
+
+    components: Dict[int, Tuple[set, set]] = {}
+    for i, j in zip(rows, cols):
+        t_nodes, b_nodes = components.setdefault(find(i), (set(), set()))
+        t_nodes.add(i)
+        b_nodes.add(j)
+
+    pairs = []
+    for t_nodes, b_nodes in components.values():
+        t_idx = np.array(sorted(t_nodes))
+        b_idx = np.array(sorted(b_nodes))
+        if len(t_idx) == 1 and len(b_idx) == 1:
+            pairs.append((int(t_idx[0]), int(b_idx[0])))
+            continue
+        # Non-candidate pairs cost nothing, so taking them is the same as leaving a row unassigned
+        cost = np.where(candidate[np.ix_(t_idx, b_idx)], -scores[np.ix_(t_idx, b_idx)], 0.0)
+        if len(t_idx) <= len(b_idx):
+            assigned = [(r, c) for r, c in enumerate(_linear_assignment(cost))]
+        else:
+            assigned = [(r, c) for c, r in enumerate(_linear_assignment(cost.T))]
+        for r, c in assigned:
+            if candidate[t_idx[r], b_idx[c]]:
+                pairs.append((int(t_idx[r]), int(b_idx[c])))
+    return pairs
+
+def date_blocks(transactions: List[Transaction], bank_transactions: List[BankTransaction], block_days: int):
+    """
+    Yield (transactions, bank transactions) blocks in date order.
+    Each block covers block_days of transaction dates plus the date window on either
+    side for bank transactions, so no pair within the window is missed.
+    """
+    transactions = sorted(transactions, key=lambda x: x.date)
+    bank_transactions = sorted(bank_transactions, key=lambda x: x.date)
+    b_days = np.array([b.date.toordinal() for b in bank_transactions], dtype=np.int64)
+
+    start = 0
+    while start < len(transactions):
+        block_start = transactions[start].date
+        end = start
+        while end < len(transactions) and (transactions[end].date - block_start).days < block_days:
+            end += 1
+        low = np.searchsorted(b_days, block_start.toordinal() - DATE_WINDOW_DAYS, side="left")
+        high = np.searchsorted(b_days, transactions[end - 1].date.toordinal() + DATE_WINDOW_DAYS, side="right")
+        yield transactions[start:end], bank_transactions[low:high]
+        start = end
+
+def _within(transactions: List[Transaction], bank_transactions: List[BankTransaction],
+            time_window_days: int, amount_tolerance: float) -> np.ndarray:
+    """Which pairs lie inside the date window and the relative amount tolerance."""
+    t_amounts = np.array([t.amount_cents for t in transactions], dtype=np.int64)
+    b_amounts = np.array([b.amount_cents for b in bank_transactions], dtype=np.int64)
+    t_days = np.array([t.date.toordinal() for t in transactions], dtype=np.int64)
+    b_days = np.array([b.date.toordinal() for b in bank_transactions], dtype=np.int64)
+    within = np.abs(t_days[:, None] - b_days[None, :]) <= time_window_days
+    return within & (np.abs(t_amounts[:, None] - b_amounts[None, :]) <= np.abs(t_amounts)[:, None] * amount_tolerance)
+
+def assign_matches(transactions: List[Transaction], bank_transactions: List[BankTransaction],
+                   min_confidence: float = 0.6, block_days: int = 31, time_window_days: Optional[int] = None,
+                   amount_tolerance: float = 0.0) -> List[Tuple[Transaction, BankTransaction, float]]:
+    """
+    Pair transactions with bank transactions one-to-one, maximising the total score.
+    Work is split into date blocks of block_days; a bank transaction assigned in an
+    earlier block is not offered again. Pairs scoring below min_confidence are never made.
+    With time_window_days, neither are pairs further apart in days or, relative to the
+    transaction amount, by more than amount_tolerance.
+    Returns a list of (transaction, bank_transaction, confidence_score) tuples.
+    """
+    transactions = [t for t in transactions if not t.matched]
+    bank_transactions = [b for b in bank_transactions if not b.is_matched]
+    assigned_bank_ids = set()
+    results = []
+
+    for block_transactions, block_bank in date_blocks(transactions, bank_transactions, block_days):
+        block_bank = [b for b in block_bank if id(b) not in assigned_bank_ids]
+        if not block_bank:
+            continue
+        scores = score_matrix(block_transactions, block_bank, min_confidence)
+        if time_window_days is not None:
+            scores = np.where(_within(block_transactions, block_bank, time_window_days, amount_tolerance), scores, 0.0)
+        for i, j in _assign_block(scores, min_confidence):
+            assigned_bank_ids.add(id(block_bank[j]))
+            results.append((block_transactions[i], block_bank[j], float(scores[i, j])))
+
+    return results
+
+def find_potential_matches(transaction: Transaction, bank_transactions: List[BankTransaction],
                          min_confidence: float = 0.6) -> List[Tuple[BankTransaction, float]]:
     """
     Find potential matches for a transaction from a list of bank transactions.
     Returns a list of tuples containing the bank transaction and its confidence score.
     """
-    matches = []
-    
-    for bank_trans in bank_transactions:
-        # Skip if bank transaction is already matched
-        if bank_trans.is_matched:
-            continue
-            
-        score = calculate_similarity_score(transaction, bank_trans)
-        if score >= min_confidence:
-            matches.append((bank_trans, score))
-    
+    # Skip bank transactions that are already matched
+    candidates = [b for b in bank_transactions if not b.is_matched]
+    if not candidates:
+        return []
+
+    scores = score_matrix([transaction], candidates, min_confidence)[0]
+    matches = [(candidates[j], float(scores[j])) for j in np.nonzero(scores >= min_confidence)[0]]
+
     # Sort by confidence score in descending order
     return sorted(matches, key=lambda x: x[1], reverse=True)
 
-def find_best_match(transaction: Transaction, bank_transactions: List[BankTransaction], 
+def find_best_match(transaction: Transaction, bank_transactions: List[BankTransaction],
                    min_confidence: float = 0.6) -> Tuple[BankTransaction, float]:
     """
     Find the best matching bank transaction for a given transaction.
@@ -61,24 +290,27 @@ def find_best_match(transaction: Transaction, bank_transactions: List[BankTransa
     matches = find_potential_matches(transaction, bank_transactions, min_confidence)
     return matches[0] if matches else (None, 0.0)
 
-def find_matches(transactions: List[Transaction], bank_transactions: List[BankTransaction], 
-                min_confidence: float = 0.6) -> Dict[int, List[Tuple[BankTransaction, float]]]:
+def find_matches(transactions: List[Transaction], bank_transactions: List[BankTransaction],
+                min_confidence: float = 0.6, block_days: int = 31) -> Dict[int, List[Tuple[BankTransaction, float]]]:
     """
     Find matches for multiple transactions against a list of bank transactions.
     Returns a dictionary mapping transaction IDs to their potential matches.
+    Only bank transactions within the date window of a transaction are scored;
+    use assign_matches for a one-to-one pairing.
     """
     matches = {}
-    
-    # Sort transactions by date to process them in chronological order
-    sorted_transactions = sorted(transactions, key=lambda x: x.date)
-    
-    for transaction in sorted_transactions:
-        # Skip if transaction is already matched
-        if transaction.matched:
+    transactions = [t for t in transactions if not t.matched]
+    bank_transactions = [b for b in bank_transactions if not b.is_matched]
+
+    # Blocks come back in chronological order
+    for block_transactions, block_bank in date_blocks(transactions, bank_transactions, block_days):
+        if not block_bank:
             continue
-            
-        potential_matches = find_potential_matches(transaction, bank_transactions, min_confidence)
-        if potential_matches:
-            matches[transaction.id] = potential_matches
-            
-    return matches 
\ No newline at end of file
+        scores = score_matrix(block_transactions, block_bank, min_confidence)
+        for i, transaction in enumerate(block_transactions):
+            hits = np.nonzero(scores[i] >= min_confidence)[0]
+            if len(hits):
+                ranked = sorted(((block_bank[j], float(scores[i, j])) for j in hits), key=lambda x: x[1], reverse=True)
+                matches[transaction.id] = ranked
+
+    return matches
@@ -0,0 +1,38 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+def to_cents(amount: Union[float, Decimal, str, int]) -> int:
+    """
+    Integer cents of an amount, rounded half away from zero.
+    Floats go through their shortest repr, so 0.29 is 29 cents and not 28.
+    """
+    value = amount if isinstance(amount, Decimal) else Decimal(str(amount))
+    return int((value * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+def from_cents(cents: int) -> float:
+    """The amount of a number of cents, as the API and reports show it."""
+    return cents / 100
+
+def format_cents(cents: int) -> str:
+    """Cents as a decimal string with two places, e.g. -1250 -> "-12.50"."""
+    # Integer arithmetic; it runs for every line of every statement imported
+    units, rest = divmod(abs(cents), 100)
+    return f"{'-' if cents < 0 else ''}{units}.{rest:02d}"
+
+def series_to_cents(amounts: pd.Series) -> pd.Series:
+    """
+    Vectorized to_cents for parsed statement amounts, giving the same cents for
+    every value. Amounts with at most two decimals, almost all of them, convert in
+    one pass; the others go through to_cents, since a float such as 1.005 is just
+    below its decimal and would otherwise round down.
+    """
+    values = amounts.to_numpy(dtype=float) * 100
+    cents = np.rint(values)
+    # Within float error of a whole number of cents: rounding either way gives it
+    rest = ~(np.abs(values - cents) < 1e-6)
+    if rest.any():
+        cents[rest] = [to_cents(amount) for amount in amounts.to_numpy(dtype=float)[rest].tolist()]
+    return pd.Series(cents, index=amounts.index).astype('int64')
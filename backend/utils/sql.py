@@ -0,0 +1,64 @@
+"""
+SQL expressions that need different spellings on SQLite and PostgreSQL.
+"""
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.types import Date, Integer
+
+# INSERTs that take on_conflict_do_nothing() and on_conflict_do_update(), per dialect
+_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def dialect_insert(db, table):
+    """An INSERT into table, in the dialect of the session's database, so it can handle conflicts."""
+    return _INSERTS[db.get_bind().dialect.name](table)
+
+class date_shift(FunctionElement):
+    """date_shift(date, days): the date moved by a whole number of days."""
+    type = Date()
+    name = "date_shift"
+    inherit_cache = True
+
+@compiles(date_shift)
+def _date_shift(element, compiler, **kw):
+    # PostgreSQL: date + integer is a date
+    day, days = list(element.clauses)
+    return f"({compiler.process(day, **kw)} + {compiler.process(days, **kw)})"
+
+@compiles(date_shift, "sqlite")
+def _date_shift_sqlite(element, compiler, **kw):
+    day, days = list(element.clauses)
+    return f"date({compiler.process(day, **kw)}, {compiler.process(days, **kw)} || ' days')"
+
+class days_between(FunctionElement):
+    """days_between(a, b): whole days from date b to date a (a - b)."""
+    type = Integer()
+    name = "days_between"
+    inherit_cache = True
+
+@compiles(days_between)
+def _days_between(element, compiler, **kw):
+    # PostgreSQL: date - date is an integer
+    a, b = list(element.clauses)
+    return f"({compiler.process(a, **kw)} - {compiler.process(b, **kw)})"
+
+@compiles(days_between, "sqlite")
+def _days_between_sqlite(element, compiler, **kw):
+    a, b = list(element.clauses)
+    return f"CAST(julianday({compiler.process(a, **kw)}) - julianday({compiler.process(b, **kw)}) AS INTEGER)"
+
+class month_start(FunctionElement):
+    """month_start(date): the first day of the date's month."""
+    type = Date()
+    name = "month_start"
+    inherit_cache = True
+
+@compiles(month_start)
+def _month_start(element, compiler, **kw):
+    day, = list(element.clauses)
+    return f"CAST(date_trunc('month', {compiler.process(day, **kw)}) AS DATE)"
+
+@compiles(month_start, "sqlite")
+def _month_start_sqlite(element, compiler, **kw):
+    day, = list(element.clauses)
+    return f"date({compiler.process(day, **kw)}, 'start of month')"
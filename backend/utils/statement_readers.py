@@ -0,0 +1,248 @@
+"""
+Raw readers for the statement formats other than CSV.
+
+Each reader yields DataFrames of at most chunk_size rows holding the statement's
+values as strings, like pd.read_csv(dtype=str) does, so bank_parser can detect
+and apply a format profile to them exactly as it does for CSV. The frame index
+is the line (or worksheet row) number minus 2, which is what error messages
+count from. Nothing is read ahead of the chunk being built.
+"""
+import codecs
+import itertools
+import re
+from datetime import date, datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+import pandas as pd
+import openpyxl
+from .bank_formats import DATE_COLUMNS
+
+# Bytes read from an OFX document at a time
+OFX_BLOCK_SIZE = 64 * 1024
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+_OFX_XML_ENCODING = re.compile(rb'encoding="([A-Za-z0-9_\-]+)"')
+
+# QIF sections holding transactions; account and category lists are skipped
+_QIF_TRANSACTION_TYPES = {'bank', 'cash', 'ccard', 'oth a', 'oth l'}
+
+# Worksheet rows searched for the header; exports often put a title or account details above it
+XLSX_HEADER_SCAN_ROWS = 20
+
+def _open_binary(source: Union[str, BinaryIO]):
+    return open(source, 'rb') if isinstance(source, str) else source
+
+def _describe(name: Optional[str], memo: Optional[str]) -> str:
+    name, memo = (name or '').strip(), (memo or '').strip()
+    if memo and memo not in name:
+        return f"{name} {memo}".strip()
+    return name
+
+class _FrameBuilder:
+    """Collects rows of the standard columns and hands them out as frames of chunk_size."""
+    def __init__(self, chunk_size: int):
+        self.chunk_size = chunk_size
+        self._reset()
+
+    def _reset(self):
+        self.columns: Dict[str, List] = {'date': [], 'description': [], 'amount': []}
+        self.index: List[int] = []
+
+    def add(self, line: int, day: Optional[str], description: str, amount: Optional[str]) -> bool:
+        """Add a row; True when a full chunk is ready."""
+        self.columns['date'].append(day)
+        self.columns['description'].append(description)
+        self.columns['amount'].append(amount)
+        self.index.append(line - 2)
+        return len(self.index) >= self.chunk_size
+
+    def take(self) -> Optional[pd.DataFrame]:
+        if not self.index:
+            return None
+        frame = pd.DataFrame(self.columns, index=self.index, dtype=object)
+        self._reset()
+        return frame
+
+def _ofx_encoding(head: bytes) -> str:
+    """Encoding named by the OFX 1.x SGML header or the OFX 2.x XML declaration."""
+    if b'CHARSET:1252' in head or b'ENCODING:USASCII' in head:
+        return 'cp1252'
+    declared = _OFX_XML_ENCODING.search(head)
+    if declared:
+        try:
+            return codecs.lookup(declared.group(1).decode('ascii')).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def ofx_frames(source: Union[str, BinaryIO], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the STMTTRN records of an OFX (or QFX) document, SGML or XML.
+    The document is scanned tag by tag in blocks, so a statement written on a
+    single line is not held in memory either. DTPOSTED is cut to its date part
+    (YYYYMMDD); the description is NAME, followed by MEMO when it adds anything.
+    """
+    stream = _open_binary(source)
+    try:
+        head = stream.read(4096)
+        decoder = codecs.getincrementaldecoder(_ofx_encoding(head))(errors='replace')
+        builder = _FrameBuilder(chunk_size)
+        transaction = None
+        line = 1
+        pending = ''
+        block = head
+        while True:
+            final = not block
+            pending += decoder.decode(block, final=final)
+            # Only complete tags are scanned; the text after the last '<' may continue in the next block
+            cut = len(pending) if final else pending.rfind('<')
+            if cut > 0:
+                text, pending = pending[:cut], pending[cut:]
+                position = 0
+                for tag in _OFX_TAG.finditer(text):
+                    line += text.count('\n', position, tag.start())
+                    position = tag.start()
+                    closing, name, value = tag.group(1), tag.group(2).upper(), tag.group(3)
+                    if name == 'STMTTRN':
+                        if not closing:
+                            transaction = {'line': line}
+                        elif transaction is not None:
+                            full = builder.add(
+                                transaction['line'],
+                                transaction.get('DTPOSTED', '')[:8] or None,
+                                _describe(transaction.get('NAME'), transaction.get('MEMO')),
+                                transaction.get('TRNAMT')
+                            )
+                            transaction = None
+                            if full:
+                                yield builder.take()
+                    elif transaction is not None and not closing:
+                        transaction[name] = value.strip()
+                line += text.count('\n', position)
+            if final:
+                break
+            block = stream.read(OFX_BLOCK_SIZE)
+        frame = builder.take()
+        if frame is not None:
+            yield frame
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+def _decode_line(raw: bytes) -> str:
+    # QIF files carry no encoding; most are UTF-8 or Windows-1252
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('cp1252', errors='replace')
+
+def _qif_date(value: str) -> str:
+    # Quicken writes 1/31'24 for 2024 and pads single digits with spaces: 12/ 1' 4
+    return value.replace("'", '/').replace(' ', '0')
+
+def qif_frames(source: Union[str, BinaryIO], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the transactions of a QIF file line by line.
+    D is the date, T (or U) the amount, P the payee and M the memo; ^ ends a record.
+    Records outside transaction sections (!Type:Bank, Cash, CCard, Oth A, Oth L),
+    such as account or category lists, are skipped.
+    """
+    stream = _open_binary(source)
+    try:
+        builder = _FrameBuilder(chunk_size)
+        in_transactions = True
+        record: Dict[str, str] = {}
+        start = None
+        for number, raw in enumerate(stream, 1):
+            text = _decode_line(raw).strip().lstrip('\ufeff')
+            if not text:
+                continue
+            code, value = text[0], text[1:].strip()
+            if code == '!':
+                section = value.lower()
+                if section.startswith('type:'):
+                    in_transactions = section[5:].strip() in _QIF_TRANSACTION_TYPES
+                elif section.startswith('account'):
+                    in_transactions = False
+                continue
+            if not in_transactions:
+                continue
+            if code == '^':
+                if record:
+                    full = builder.add(
+                        start,
+                        _qif_date(record['D']) if 'D' in record else None,
+                        _describe(record.get('P'), record.get('M')),
+                        record.get('T', record.get('U'))
+                    )
+                    if full:
+                        yield builder.take()
+                record, start = {}, None
+            elif code in 'DTUPM':
+                if start is None:
+                    start = number
+                record.setdefault(code, value)
+        frame = builder.take()
+        if frame is not None:
+            yield frame
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+def _cell_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+def _xlsx_rows(sheet) -> Iterator[Tuple[int, List[Optional[str]]]]:
+    """(row number, cell texts) of the non-empty rows of a worksheet."""
+    for number, values in enumerate(sheet.iter_rows(values_only=True), 1):
+        cells = [_cell_text(value) for value in values]
+        if any(cell is not None and cell.strip() for cell in cells):
+            yield number, cells
+
+def xlsx_frames(source: Union[str, BinaryIO], chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Read the first worksheet of an XLSX workbook with openpyxl's read-only mode,
+    which streams rows from the sheet XML instead of building the workbook.
+    The header is the first row naming a date column within the first
+    XLSX_HEADER_SCAN_ROWS rows, so title and account rows above it are skipped;
+    failing that, the first row. Empty rows are skipped. Date cells come out as
+    YYYY-MM-DD and numbers as plain decimal strings.
+    """
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = _xlsx_rows(workbook.worksheets[0])
+        header = None
+        leading = []
+        for number, cells in rows:
+            if any(cell is not None and cell.strip().lower() in DATE_COLUMNS for cell in cells):
+                header = cells
+                break
+            leading.append((number, cells))
+            if len(leading) >= XLSX_HEADER_SCAN_ROWS:
+                break
+        if header is None:
+            if not leading:
+                raise ValueError("The first worksheet is empty")
+            # Detection then reports which column is missing
+            (_, header), leading = leading[0], leading[1:]
+        else:
+            leading = []
+        header = [cell or '' for cell in header]
+
+        batch: List[List[Optional[str]]] = []
+        index: List[int] = []
+        for number, cells in itertools.chain(leading, rows):
+            batch.append((cells + [None] * len(header))[:len(header)])
+            index.append(number - 2)
+            if len(batch) >= chunk_size:
+                yield pd.DataFrame(batch, columns=header, index=index, dtype=object)
+                batch, index = [], []
+        if batch:
+            yield pd.DataFrame(batch, columns=header, index=index, dtype=object)
+    finally:
+        workbook.close()
@@ -0,0 +1,24 @@
+import { apiClient } from './client';
+
+export interface Job {
+  id: string;
+  kind: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  progress: number;
+  total: number | null;
+  error: string | null;
+}
+
+// Poll a background job until it ends; rejects when it did not succeed
+export const waitForJob = async (jobId: string, intervalMs = 500): Promise<Job> => {
+  for (;;) {
+    const { data: job } = await apiClient.get<Job>(`/jobs/${jobId}`);
+    if (job.status === 'succeeded') {
+      return job;
+    }
+    if (job.status === 'failed' || job.status === 'cancelled') {
+      throw new Error(job.error || `Job ${job.status}`);
+    }
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+};
@@ -10,28 +10,34 @@ import {
 } from '@mui/material';
 import { useMutation, useQueryClient } from '@tanstack/react-query';
 import { apiClient } from '@/api/client';
+import { waitForJob } from '@/api/jobs';
 
 export const BankTransactionForm: React.FC = () => {
   const navigate = useNavigate();
   const queryClient = useQueryClient();
   const [file, setFile] = useState<File | null>(null);
+  const [bankName, setBankName] = useState('');
+  const [accountNumber, setAccountNumber] = useState('');
+  const [dateFormat, setDateFormat] = useState('');
+  const [decimalSeparator, setDecimalSeparator] = useState('');
   const [error, setError] = useState<string>('');
 
   const importMutation = useMutation({
     mutationFn: async (formData: FormData) => {
-      const response = await apiClient.post('/bank-transactions/import', formData, {
+      const response = await apiClient.post('/bank-transactions/bulk/upload', formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
       });
-      return response.data;
+      // The statement is imported by a background job
+      return waitForJob(response.data.id);
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ['bank-transactions'] });
       navigate('/bank-transactions');
     },
     onError: (error: any) => {
-      setError(error.response?.data?.message || 'Failed to import transactions');
+      setError(error.response?.data?.detail || error.message || 'Failed to import transactions');
     },
   });
 
@@ -57,6 +63,15 @@ export const BankTransactionForm: React.FC = () => {
 
     const formData = new FormData();
     formData.append('file', file);
+    formData.append('bank_name', bankName);
+    formData.append('account_number', accountNumber);
+    // Only needed when the statement's dates or amounts read more than one way
+    if (dateFormat) {
+      formData.append('date_format', dateFormat);
+    }
+    if (decimalSeparator) {
+      formData.append('decimal_separator', decimalSeparator);
+    }
     importMutation.mutate(formData);
   };
 
@@ -75,6 +90,34 @@ export const BankTransactionForm: React.FC = () => {
               </Alert>
             )}
 
+            <TextField
+              label="Bank name"
+              value={bankName}
+              onChange={(event) => setBankName(event.target.value)}
+              required
+            />
+
+            <TextField
+              label="Account number"
+              value={accountNumber}
+              onChange={(event) => setAccountNumber(event.target.value)}
+              required
+            />
+
+            <TextField
+              label="Date format (optional)"
+              value={dateFormat}
+              onChange={(event) => setDateFormat(event.target.value)}
+              helperText="e.g. %d/%m/%Y, when the dates read both day-first and month-first"
+            />
+
+            <TextField
+              label="Decimal separator (optional)"
+              value={decimalSeparator}
+              onChange={(event) => setDecimalSeparator(event.target.value)}
+              helperText=". or , when the amounts read either way"
+            />
+
             <TextField
               type="file"
               inputProps={{ accept: '.csv' }}
@@ -94,7 +137,7 @@ export const BankTransactionForm: React.FC = () => {
               <Button
                 type="submit"
                 variant="contained"
-                disabled={!file || importMutation.isPending}
+                disabled={!file || !bankName || !accountNumber || importMutation.isPending}
               >
                 Import
               </Button>
@@ -28,6 +28,7 @@ import {
 } from '@mui/icons-material';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { apiClient } from '@/api/client';
+import { waitForJob } from '@/api/jobs';
 import { format } from 'date-fns';
 
 type FilterType = 'date' | 'month' | 'week' | 'year';
@@ -158,9 +159,15 @@ const BankTransactionList: React.FC = () => {
 
   const handleDownloadUnmatched = async () => {
     try {
-      const response = await apiClient.get('/bank-transactions/unmatched/report', {
+      let response = await apiClient.get('/bank-transactions/unmatched/report', {
         responseType: 'blob', // Important for downloading files
       });
+      if (response.status === 202) {
+        // The report is being built by a job; its result is the file
+        const job = JSON.parse(await response.data.text());
+        await waitForJob(job.id);
+        response = await apiClient.get(`/jobs/${job.id}/result`, { responseType: 'blob' });
+      }
 
       const url = window.URL.createObjectURL(new Blob([response.data]));
       const link = document.createElement('a');